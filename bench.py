@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+性能基准：用 make_judge_workbook 生成不同规模的工作簿，
+分别计时 calc / verify / check-count / compare-ids 四个步骤（以及 all），
+另有 pipeline（calc --pipeline，与 calc 对比流水线是否更快；只有 1 个 CPU 时 calc 会改用普通循环，
+结果中的 cpus 记录了 CPU 数），
+报告每个步骤的耗时、行/秒和峰值内存（RSS），结果保存为 JSON 以便比较不同版本
+
+每个步骤在独立子进程中运行（python cal.py <步骤>），峰值内存只统计该子进程
+用法：
+    python bench.py --sizes 10000,100000 --engine fast
+    python bench.py --sizes 1000000 --baseline bench_results/上一次.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from make_judge_workbook import write_workbook
+
+BASE = Path(__file__).resolve().parent
+# 步骤 -> cal.py 的子命令及附加选项
+STAGES = {
+    'calc': ['calc'],
+    'pipeline': ['calc', '--pipeline'],
+    'verify': ['verify'],
+    'check-count': ['check-count'],
+    'compare-ids': ['compare-ids'],
+    'all': ['all'],
+}
+
+
+def run_stage(cmd):
+    """运行一个子进程，返回 (耗时秒数, 峰值 RSS 字节数或 None, 退出码)"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if hasattr(os, "wait4"):
+        _, status, rusage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        # Linux 上 ru_maxrss 单位为 KB，macOS 上为字节
+        peak = rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+    else:
+        peak = _poll_peak_rss(proc)
+        elapsed = time.perf_counter() - start
+    stderr = proc.stderr.read().decode("utf-8", "replace")
+    proc.stderr.close()
+    if proc.returncode not in (0, 1):
+        raise RuntimeError(f"{' '.join(map(str, cmd))} 失败:\n{stderr}")
+    return elapsed, peak, proc.returncode
+
+
+def _poll_peak_rss(proc):
+    """没有 os.wait4 的平台（Windows）：有 psutil 时轮询峰值内存，否则返回 None"""
+    try:
+        import psutil
+    except ImportError:
+        proc.wait()
+        return None
+    ps = psutil.Process(proc.pid)
+    peak = 0
+    while proc.poll() is None:
+        try:
+            info = ps.memory_info()
+            peak = max(peak, getattr(info, "peak_wset", info.rss))
+        except psutil.Error:
+            break
+        time.sleep(0.01)
+    proc.wait()
+    return peak or None
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ensure_workbook(data_dir, rows, seed):
+    """生成（或复用已生成的）指定行数的工作簿"""
+    path = Path(data_dir) / f"judge_{rows}_s{seed}.xlsx"
+    if not path.exists():
+        print(f"生成 {rows} 行工作簿: {path}")
+        write_workbook(path, rows, seed=seed)
+    return path
+
+
+def bench_size(rows, xlsx, args):
+    out_dir = Path(args.data_dir) / f"out_{rows}"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    results = []
+    for stage in args.stages:
+        cmd = [sys.executable, str(BASE / "cal.py"), *STAGES[stage], "--xlsx", str(xlsx),
+               "--out-dir", str(out_dir), "--engine", args.engine]
+        if not args.cache:
+            cmd.append("--no-cache")
+        runs = [run_stage(cmd) for _ in range(args.repeat)]
+        seconds = min(r[0] for r in runs)
+        peaks = [r[1] for r in runs if r[1] is not None]
+        peak = max(peaks) if peaks else None
+        result = {
+            "rows": rows,
+            "stage": stage,
+            "engine": args.engine,
+            "cache": args.cache,
+            "seconds": round(seconds, 4),
+            "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+            "peak_rss_mb": round(peak / (1024 * 1024), 1) if peak is not None else None,
+            "exit_code": runs[-1][2],
+        }
+        results.append(result)
+        rss = f"{result['peak_rss_mb']:.1f} MB" if peak is not None else "n/a"
+        print(f"  {stage:<12} {seconds:9.3f}s  {result['rows_per_sec'] or 0:>12,.0f} 行/秒  峰值内存 {rss}")
+    return results
+
+
+def compare_with_baseline(results, baseline_path):
+    """与上一次的结果对比行/秒，打印变化比例"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    old = {(r["rows"], r["stage"], r["engine"], r["cache"]): r for r in baseline["results"]}
+    print("\n与基准对比（行/秒，>1 表示更快）:")
+    for r in results:
+        prev = old.get((r["rows"], r["stage"], r["engine"], r["cache"]))
+        if prev and prev.get("rows_per_sec") and r["rows_per_sec"]:
+            ratio = r["rows_per_sec"] / prev["rows_per_sec"]
+            print(f"  {r['rows']:>8} {r['stage']:<12} x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="judge 工作簿处理性能基准")
+    parser.add_argument("--sizes", default="10000,100000",
+                        help="逗号分隔的行数列表（默认 10000,100000；可加 1000000）")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"逗号分隔的步骤（默认全部：{','.join(STAGES)}）")
+    parser.add_argument("--engine", choices=('openpyxl', 'fast'), default="openpyxl")
+    parser.add_argument("--cache", action="store_true", help="允许使用解析缓存（默认每次重新解析）")
+    parser.add_argument("--repeat", type=int, default=1, help="每个步骤重复次数，取最快一次（默认 1）")
+    parser.add_argument("--seed", type=int, default=0, help="生成工作簿的随机种子")
+    parser.add_argument("--data-dir", type=Path, default=BASE / "bench_data",
+                        help="生成的工作簿和中间 CSV 存放目录")
+    parser.add_argument("--output", type=Path,
+                        help="结果 JSON 路径（默认 bench_results/bench-<时间>.json）")
+    parser.add_argument("--baseline", type=Path, help="与之对比的上一次结果 JSON")
+    args = parser.parse_args()
+    args.stages = [s for s in args.stages.split(",") if s]
+    for stage in args.stages:
+        if stage not in STAGES:
+            parser.error(f"未知步骤: {stage}")
+
+    started = datetime.now()
+    results = []
+    for rows in (int(s) for s in args.sizes.split(",") if s):
+        xlsx = ensure_workbook(args.data_dir, rows, args.seed)
+        print(f"\n{rows} 行 ({xlsx.stat().st_size / 1024 / 1024:.1f} MB):")
+        results.extend(bench_size(rows, xlsx, args))
+
+    report = {
+        "started": started.isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "engine": args.engine,
+        "cache": args.cache,
+        "results": results,
+    }
+    output = args.output or BASE / "bench_results" / f"bench-{started:%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入: {output}")
+
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+"""
+统一命令行入口：
+    python cal.py calc          计算所得金，写出 salary_detail.csv / salary_summary.csv
+                                （--incremental：按检查点只处理变化的行；
+                                 --pipeline：解析与汇总、校验在不同进程中同时进行；
+                                 --shards：一个工作表按行切片，多个进程并行解析、汇总；
+                                 --memory-limit：限定汇总内存，超出时写临时文件再归并；
+                                 --preview：几秒内抽样估计每位老师的所得金和置信区间；
+                                 --analytics：另外写出评审分析表）
+    python cal.py verify        用 judge.xlsx 逐条验证两个 CSV
+                                （--differential：只重新验证摘要有变化的老师，--full 全部重新验证）
+    python cal.py check-count   检查每个题目的评审老师数量
+    python cal.py validate      一遍扫描检查全部数据校验规则（见 judge_rules），--fail-fast 遇错即停
+    python cal.py compare-ids   对比 Excel 与 CSV 中的老师-ID
+                                （verify / compare-ids 可用 --report json|csv|text 写出结构化报告，
+                                 见 report_writer）
+    python cal.py all           只解析一次 judge.xlsx，在同一个进程里依次执行 calc / verify /
+                                validate / compare-ids；验证直接对比刚算好的汇总结果，不再经过 CSV 文本
+    python cal.py batch 输入... 多个工作簿 / 工作表并行计算，合并写出两个 CSV（见 salary_parallel）
+    python cal.py rollup        按日期范围合并汇总库中的历史批次（见 salary_rollup）
+    python cal.py index         为 judge.xlsx 建立老师 -> 题目的倒排索引（见 teacher_index）
+    python cal.py lookup 孙林-251  用索引查询某个老师-ID / 老师姓名的全部题目，不读取工作簿
+    python cal.py serve         监视 judge.xlsx，变化后自动重算，提供 HTTP/JSON 查询接口（见 salary_server）
+    python cal.py analytics     老师正确率、每题几位老师判断正确、正确率最高 / 最低的老师（见 salary_analytics）；
+                                --tables 只读已写出的分析表，不读工作簿
+任一检查不通过时退出码为 1
+"""
+
+import argparse
+import re
+import sys
+from pathlib import Path
+
+from judge_loader import ENGINES, DEFAULT_FILL_RULE, iter_judge_rows
+from calc_salary_from_judge import (compute_totals, compute_totals_incremental, compute_totals_pipelined,
+                                    compute_totals_sharded, write_outputs, write_outputs_spilled,
+                                    add_memory_limit_arguments, run_preview, write_analytics_outputs,
+                                    check_calc_arguments, output_dir)
+from salary_preview import add_preview_arguments
+from salary_incremental import CHECKPOINT_NAME
+from salary_columnar import TABLES_NAME
+from verify_digest import DIGEST_NAME
+from salary_shards import add_shard_argument, iter_judge_rows_sharded, collect_appearances_sharded
+from salary_parallel import expand_inputs, plan_tasks, run_tasks, merge_results
+from salary_aggregate import collect_appearances, merge_totals, write_detail_csv, write_summary_csv
+from salary_analytics import ANALYTICS_NAME, add_analytics_arguments, load_analytics, print_analytics
+from salary_rollup import (add_rollup_arguments, check_rollup_arguments, record_from_args, open_store,
+                           query_range, parse_date)
+from verify_salary import (verify, verify_merge_join, verify_columnar, verify_differential,
+                           read_detail_csv, read_summary_csv, records_from_totals, REPORT_FIELDS as VERIFY_REPORT_FIELDS)
+from check_teacher_count import check_count
+from judge_rules import RULES, RuleOptions, DEFAULT_EXPECTED_COUNT, validate, select_rules, print_report
+from compare_teacher_ids import (compare_ids, read_csv_teacher_ids,
+                                 REPORT_FIELDS as COMPARE_REPORT_FIELDS)
+from report_writer import add_report_arguments, check_report_arguments, open_report_from_args
+from teacher_index import TeacherIndex, build_index, index_path_for
+from salary_server import (PayrollService, serve, DEFAULT_HOST, DEFAULT_PORT, DEFAULT_INTERVAL,
+                           DEFAULT_DEBOUNCE)
+from profiling import PROFILER, add_profile_arguments, start_from_args, finish_from_args
+
+BASE = Path(__file__).resolve().parent
+
+
+def fill_rule(args):
+    return DEFAULT_FILL_RULE.with_rgbs(args.colored_rgb)
+
+
+def judge_rows(args):
+    """按命令行参数读取 judge.xlsx 的 JudgeRow 流（--shards 时分片并行解析）"""
+    if args.shards is not None:
+        return iter_judge_rows_sharded(args.xlsx, fill_rule=fill_rule(args), jobs=args.shards)
+    return iter_judge_rows(args.xlsx, engine=args.engine, fill_rule=fill_rule(args),
+                           use_cache=not args.no_cache)
+
+
+def cmd_calc(args):
+    if args.preview is not None:
+        return run_preview(args.xlsx, args.out_dir, args.preview, args.seed, fill_rule(args))
+    print(f"正在读取文件: {args.xlsx} (引擎: {args.engine})")
+    if args.memory_limit is not None:
+        write_outputs_spilled(judge_rows(args), args.out_dir, args.memory_limit, args.spill_dir)
+        return True
+    ok = True
+    validation = None
+    captured = []
+    on_appearances = captured.append if args.analytics else None
+    if args.shards is not None and not args.incremental and not args.validate:
+        totals = compute_totals_sharded(args.xlsx, fill_rule(args), jobs=args.shards,
+                                        on_appearances=on_appearances)
+    elif args.pipeline:
+        rules, options = rules_from_args(args) if args.validate else (None, RuleOptions())
+        totals, validation = compute_totals_pipelined(args.xlsx, args.engine, fill_rule(args),
+                                                      not args.no_cache, rules, options, on_appearances)
+    elif args.incremental:
+        checkpoint = args.checkpoint or args.out_dir / CHECKPOINT_NAME
+        totals, ok = compute_totals_incremental(judge_rows(args), checkpoint, fill_rule(args),
+                                                check_full=args.check_full)
+    else:
+        rows = judge_rows(args)
+        if args.validate:
+            rows = list(rows)   # 校验需要再遍历一次
+        totals = compute_totals(rows, on_appearances)
+        if args.validate:
+            validation = validate(rows, *rules_from_args(args))
+    write_outputs(totals, args.out_dir, columnar=args.columnar)
+    if captured:
+        write_analytics_outputs(captured[0], args.out_dir, args.expected_count, args.top, args.min_reviews)
+    record_from_args(args, args.xlsx, totals)
+    if validation is not None:
+        print()
+        print_report(validation)
+        ok = validation.ok and ok
+    return ok
+
+
+def cmd_verify(args):
+    report = open_report_from_args(args, VERIFY_REPORT_FIELDS)
+    try:
+        if args.columnar:
+            return verify_columnar(judge_rows(args), args.out_dir / args.columnar, report=report)
+        if args.differential:
+            return verify_differential(judge_rows(args), args.out_dir / "salary_detail.csv",
+                                       args.out_dir / "salary_summary.csv",
+                                       args.digest or args.out_dir / DIGEST_NAME, full=args.full,
+                                       report=report)
+        if args.merge_join:
+            return verify_merge_join(judge_rows(args), args.out_dir / "salary_detail.csv",
+                                     args.out_dir / "salary_summary.csv", report=report)
+        detail_records = read_detail_csv(args.out_dir / "salary_detail.csv")
+        csv_summary = read_summary_csv(args.out_dir / "salary_summary.csv")
+        return verify(judge_rows(args), detail_records, csv_summary, report=report)
+    finally:
+        if report is not None:
+            report.close()
+
+
+def cmd_check_count(args):
+    return check_count(judge_rows(args))
+
+
+def rules_from_args(args):
+    """按 --rules / --expected-count / --id-pattern 选出规则和参数；规则名或正则表达式不对时抛出 ValueError"""
+    names = [n for n in args.rules.split(",") if n] if args.rules else None
+    try:
+        re.compile(args.id_pattern)
+    except re.error as e:
+        raise ValueError(f"--id-pattern 不是合法的正则表达式: {e}") from None
+    return select_rules(names), RuleOptions(args.expected_count, args.id_pattern)
+
+
+def cmd_validate(args):
+    rules, options = rules_from_args(args)
+    report = validate(judge_rows(args), rules, options, fail_fast=args.fail_fast)
+    print_report(report)
+    return report.ok
+
+
+def cmd_compare_ids(args):
+    report = open_report_from_args(args, COMPARE_REPORT_FIELDS)
+    try:
+        return compare_ids(judge_rows(args), read_csv_teacher_ids(args.out_dir / "salary_detail.csv"),
+                           report)
+    finally:
+        if report is not None:
+            report.close()
+
+
+def cmd_all(args):
+    print(f"正在读取文件: {args.xlsx} (引擎: {args.engine})")
+    with PROFILER.phase("load_model") as ph:
+        rows = list(judge_rows(args))   # 只解析一次，后面各步骤共用
+        ph.rows = len(rows)
+
+    with PROFILER.phase("calc"):
+        totals = compute_totals(rows)
+        write_outputs(totals, args.out_dir)
+
+    print()
+    detail_records, csv_summary = records_from_totals(totals)
+    ok = verify(rows, detail_records, csv_summary,
+                detail_label="本次计算的明细结果", summary_label="本次计算的汇总结果")
+    print()
+    rules, options = rules_from_args(args)
+    report = validate(rows, rules, options)
+    print_report(report)
+    ok = report.ok and ok
+    print()
+    ok = compare_ids(rows, set(totals.ids)) and ok
+    return ok
+
+
+def cmd_batch(args):
+    paths = expand_inputs(args.inputs)
+    tasks = plan_tasks(paths, args.sheet, engine=args.engine, fill_rule=fill_rule(args),
+                       use_cache=not args.no_cache)
+    if not tasks:
+        print("没有找到需要处理的工作表")
+        return False
+    print(f"共 {len(paths)} 个工作簿、{len(tasks)} 个工作表 (引擎: {args.engine})")
+    with PROFILER.phase("parallel_parse") as ph:
+        results = run_tasks(tasks, args.jobs)
+        ph.rows = sum(r.rows for r in results)
+    for r in results:
+        print(f"  {r.path} [{r.sheet}]: {r.rows} 行，{len(r.totals.ids)} 个老师-ID"
+              + (f"，跳过 {r.skipped} 行" if r.skipped else ""))
+    with PROFILER.phase("merge"):
+        totals = merge_results(results)
+    write_outputs(totals, args.out_dir)
+    if args.rollup:
+        if args.batch_label and len(paths) > 1:
+            print("多个工作簿不能共用 --batch-label，未写入汇总库")
+            return False
+        # 每个工作簿记为一个批次（合并它的各个工作表）
+        for path in paths:
+            partials = [r.totals for r in results if r.path == path]
+            if partials:
+                record_from_args(args, path, merge_totals(partials))
+    return True
+
+
+def cmd_rollup(args):
+    conn = open_store(args.rollup)
+    try:
+        batches, totals = query_range(conn, args.date_from, args.date_to)
+    finally:
+        conn.close()
+    start = args.date_from.isoformat() if args.date_from else "最早"
+    end = args.date_to.isoformat() if args.date_to else "最新"
+    print(f"{start} ~ {end}：共 {len(batches)} 个批次")
+    for _, label, batch_date, _ in batches:
+        print(f"  {batch_date}  {label}")
+    if not batches:
+        return True
+
+    tag = f"{args.date_from or 'begin'}_{args.date_to or 'end'}"
+    out_dir = output_dir(args.out_dir)
+    detail_path = out_dir / f"salary_detail_{tag}.csv"
+    summary_path = out_dir / f"salary_summary_{tag}.csv"
+    write_detail_csv(totals, detail_path)
+    write_summary_csv(totals, summary_path)
+    print(f"\n详细记录 {len(totals.ids)} 条已写入: {detail_path}")
+    print(f"汇总老师 {len(totals.names)} 位已写入: {summary_path}")
+    return True
+
+
+def cmd_index(args):
+    print(f"正在读取文件: {args.xlsx} (引擎: {args.engine})")
+    with PROFILER.phase("build_index") as ph:
+        path, count = build_index(judge_rows(args), args.xlsx, fill_rule(args))
+        ph.rows = count
+    print(f"索引已写入: {path}（{count} 次老师出现）")
+    return True
+
+
+def open_index(args):
+    """打开 judge.xlsx 的索引；不存在或工作簿已变化时先重建"""
+    path = index_path_for(args.xlsx)
+    if path.exists():
+        index = TeacherIndex(path)
+        if index.is_current(args.xlsx, fill_rule(args)):
+            return index
+        index.close()
+        print("工作簿在建立索引后有变化，重新建立索引...")
+    else:
+        print("还没有索引，正在建立...")
+    cmd_index(args)
+    return TeacherIndex(path)
+
+
+def print_postings(title, postings):
+    print(f"\n{title}：{len(postings)} 次出现")
+    if not postings:
+        return
+    print(f"  {'行号':>6}  {'题号':<12} {'列':<2} {'颜色':<4} {'金额':>10}  老师-ID")
+    correct = wrong = 0.0
+    correct_count = wrong_count = skipped = 0
+    for p in postings:
+        if p.amount is None:
+            skipped += 1
+            amount = "不计"
+        else:
+            amount = f"{p.amount:.2f}"
+            if p.colored:
+                correct += p.amount
+                correct_count += 1
+            else:
+                wrong += p.amount
+                wrong_count += 1
+        color = "有" if p.colored else "无"
+        print(f"  {p.row:>6}  {str(p.problem_id):<12} {p.column:<2} {color:<4} {amount:>10}  {p.teacher_id}")
+    line = (f"  正确 {correct_count} 次 {correct:.2f}，错误 {wrong_count} 次 {wrong:.2f}，"
+            f"合计 {correct + wrong:.2f}")
+    if skipped:
+        line += f"（另有 {skipped} 次因 K/N 不是数字不计）"
+    print(line)
+
+
+def cmd_lookup(args):
+    with PROFILER.phase("lookup"):
+        with open_index(args) as index:
+            found = True
+            for key in args.keys:
+                postings = [] if args.by == "name" else index.by_teacher_id(key)
+                if postings:
+                    print_postings(f"老师-ID {key}", postings)
+                    continue
+                postings = [] if args.by == "id" else index.by_name(key)
+                if postings:
+                    print_postings(f"老师 {key}", postings)
+                else:
+                    print(f"\n{key}：索引中没有找到")
+                    found = False
+    return found
+
+
+def cmd_analytics(args):
+    if args.tables:
+        path = args.out_dir / args.tables
+        if not path.exists():
+            print(f"分析表不存在: {path}（先运行 cal.py analytics 或 calc --analytics）")
+            return False
+        print_analytics(load_analytics(path), args.top, args.min_reviews)
+        return True
+    print(f"正在读取文件: {args.xlsx} (引擎: {args.engine})")
+    with PROFILER.phase("collect_appearances") as ph:
+        if args.shards is not None:
+            appearances = collect_appearances_sharded(args.xlsx, fill_rule(args), jobs=args.shards, with_rows=True)
+        else:
+            appearances = collect_appearances(judge_rows(args), with_rows=True)
+        ph.rows = appearances.rows
+    print(f"共处理 {appearances.rows} 行数据")
+    write_analytics_outputs(appearances, args.out_dir, args.expected_count, args.top, args.min_reviews)
+    return True
+
+
+def cmd_serve(args):
+    service = PayrollService(args.xlsx, engine=args.engine, fill_rule=fill_rule(args),
+                             use_cache=not args.no_cache, interval=args.interval, debounce=args.debounce)
+    serve(service, args.host, args.port)
+    return True
+
+
+COMMANDS = {
+    'calc': (cmd_calc, "计算所得金并写出 CSV"),
+    'verify': (cmd_verify, "逐条验证 salary_detail.csv / salary_summary.csv"),
+    'check-count': (cmd_check_count, "检查每个题目的评审老师数量是否为5"),
+    'validate': (cmd_validate, "一遍扫描检查全部数据校验规则"),
+    'compare-ids': (cmd_compare_ids, "对比 Excel 与 CSV 中的老师-ID"),
+    'all': (cmd_all, "解析一次，依次执行 calc / verify / validate / compare-ids"),
+    'batch': (cmd_batch, "并行处理多个工作簿 / 工作表，合并写出 CSV"),
+    'rollup': (cmd_rollup, "按日期范围合并汇总库中的历史批次"),
+    'index': (cmd_index, "为 judge.xlsx 建立老师 -> 题目的倒排索引"),
+    'lookup': (cmd_lookup, "用索引查询老师-ID / 老师姓名的全部题目"),
+    'serve': (cmd_serve, "监视 judge.xlsx，变化后自动重算，并提供 HTTP/JSON 查询接口"),
+    'analytics': (cmd_analytics, "老师正确率、每题一致程度、正确率最高 / 最低的老师"),
+}
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--xlsx", type=Path, default=BASE / "judge.xlsx",
+                        help="judge 工作簿路径（默认：脚本目录下的 judge.xlsx）")
+    common.add_argument("--out-dir", type=Path, default=BASE,
+                        help="salary_detail.csv / salary_summary.csv 所在目录（默认：脚本目录）")
+    common.add_argument("--engine", choices=ENGINES, default="openpyxl",
+                        help="读取引擎：openpyxl（默认）或 fast（直接解析 XML）")
+    common.add_argument("--no-cache", action="store_true",
+                        help="忽略 .judge_cache/ 中的解析缓存，强制重新解析")
+    common.add_argument("--colored-rgb", action="append", default=[], metavar="ARGB",
+                        help="额外算作「有颜色」的 RGB 实心填充，如 FFDDEBF7，可重复指定")
+    add_shard_argument(common)
+    add_profile_arguments(common)
+
+    parser = argparse.ArgumentParser(prog="cal", description="judge.xlsx 所得金计算与校验")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, (func, help_text) in COMMANDS.items():
+        p = sub.add_parser(name, parents=[common], help=help_text)
+        p.set_defaults(func=func)
+        if name in ('calc', 'batch'):
+            add_rollup_arguments(p)
+        if name in ('verify', 'compare-ids'):
+            add_report_arguments(p)
+        if name == 'calc':
+            p.add_argument("--incremental", action="store_true",
+                           help="使用检查点，只处理新增、删除或修改过的行")
+            p.add_argument("--checkpoint", type=Path,
+                           help=f"增量检查点路径（默认：--out-dir 下的 {CHECKPOINT_NAME}）")
+            p.add_argument("--check-full", action="store_true",
+                           help="配合 --incremental，再全量重算一次并确认结果一致")
+            p.add_argument("--pipeline", action="store_true",
+                           help="流水线模式：解析、汇总、校验在不同进程中同时进行（见 salary_pipeline）")
+            p.add_argument("--validate", action="store_true",
+                           help="计算的同时检查数据校验规则（规则选项同 validate 命令）")
+            p.add_argument("--columnar", action="store_true",
+                           help=f"另外写出列式二进制的 {TABLES_NAME}（金额为整数分，见 salary_columnar）")
+            add_memory_limit_arguments(p)
+            add_preview_arguments(p)
+            p.add_argument("--analytics", action="store_true",
+                           help=f"另外写出评审分析表 {ANALYTICS_NAME}（见 salary_analytics）")
+        if name in ('calc', 'analytics'):
+            add_analytics_arguments(p)
+        if name in ('calc', 'validate', 'all'):
+            p.add_argument("--rules", metavar="NAME,...",
+                           help=f"只检查这些规则（逗号分隔；默认全部：{','.join(RULES)}）")
+            p.add_argument("--expected-count", type=int, default=DEFAULT_EXPECTED_COUNT,
+                           help=f"teacher_count 规则中每题的老师数（默认 {DEFAULT_EXPECTED_COUNT}）")
+            p.add_argument("--id-pattern", default=RuleOptions().id_pattern,
+                           help="id_pattern 规则使用的正则表达式（默认「姓名-编号」）")
+        if name == 'validate':
+            p.add_argument("--fail-fast", action="store_true",
+                           help="遇到第一处违规即停止并返回非 0 退出码（用于 CI）")
+        elif name == 'verify':
+            p.add_argument("--merge-join", action="store_true",
+                           help="归并对比模式：CSV 按老师排序逐行对比，内存与 CSV 大小无关")
+            p.add_argument("--columnar", nargs="?", const=Path(TABLES_NAME), type=Path, metavar="NPZ",
+                           help=f"对比 calc --columnar 写出的列式文件（默认 --out-dir 下的 {TABLES_NAME}），不读 CSV")
+            p.add_argument("--differential", action="store_true",
+                           help="差异验证：只重新验证与上次通过时相比有变化的老师（见 verify_digest）")
+            p.add_argument("--digest", type=Path,
+                           help=f"差异验证的摘要文件（默认：--out-dir 下的 {DIGEST_NAME}）")
+            p.add_argument("--full", action="store_true",
+                           help="配合 --differential，全部重新验证并重建摘要")
+        elif name == 'batch':
+            p.add_argument("inputs", nargs="+", metavar="输入",
+                           help="工作簿目录、通配符（如 'batches/*.xlsx'）或文件")
+            p.add_argument("--sheet", action="append", default=[], metavar="PATTERN",
+                           help="只处理名称匹配的工作表（通配符，可重复指定；默认全部工作表）")
+            p.add_argument("--jobs", "-j", type=int, default=None,
+                           help="工作进程数（默认：CPU 核数；1 表示不开进程池）")
+        elif name == 'lookup':
+            p.add_argument("keys", nargs="+", metavar="老师",
+                           help="老师-ID（如 孙林-251）或老师姓名（如 孙林）")
+            p.add_argument("--by", choices=("auto", "id", "name"), default="auto",
+                           help="按老师-ID 还是姓名查询（默认 auto：先按 ID，找不到再按姓名）")
+        elif name == 'serve':
+            p.add_argument("--host", default=DEFAULT_HOST, help=f"监听地址（默认 {DEFAULT_HOST}）")
+            p.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"端口（默认 {DEFAULT_PORT}）")
+            p.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                           help=f"检查文件变化的间隔秒数（默认 {DEFAULT_INTERVAL}）")
+            p.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE,
+                           help=f"文件连续这么多秒不再变化才重新计算（默认 {DEFAULT_DEBOUNCE}）")
+        elif name == 'analytics':
+            p.add_argument("--tables", nargs="?", const=Path(ANALYTICS_NAME), type=Path, metavar="NPZ",
+                           help=f"只读已写出的分析表（默认 --out-dir 下的 {ANALYTICS_NAME}），不读工作簿")
+            p.add_argument("--expected-count", type=int, default=DEFAULT_EXPECTED_COUNT,
+                           help=f"每题应有的评审老师数（默认 {DEFAULT_EXPECTED_COUNT}）")
+        elif name == 'rollup':
+            p.add_argument("--rollup", type=Path, required=True, metavar="DB", help="SQLite 汇总库")
+            p.add_argument("--from", dest="date_from", type=parse_date, metavar="YYYY-MM-DD",
+                           help="起始日期（含）")
+            p.add_argument("--to", dest="date_to", type=parse_date, metavar="YYYY-MM-DD",
+                           help="结束日期（含）")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    check_calc_arguments(parser, args)
+    if args.command in ('verify', 'compare-ids'):
+        check_report_arguments(parser, args)
+    if args.command in ('calc', 'batch'):
+        check_rollup_arguments(parser, args)
+    if hasattr(args, "rules"):
+        try:
+            rules_from_args(args)
+        except ValueError as e:
+            parser.error(str(e))
+    if getattr(args, "full", False) and not args.differential:
+        parser.error("--full 需要配合 --differential 使用")
+    start_from_args(args)
+    ok = args.func(args)
+    finish_from_args(args, command=args.command)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,141 +3,335 @@
 从 judge.xlsx 按每个格子的颜色判断「正确/错误」，汇总每位老师的正确、错误所得金
 """
 
+import argparse
 from pathlib import Path
-from collections import defaultdict
-import openpyxl
+from judge_loader import ENGINES, DEFAULT_FILL_RULE, iter_judge_rows
+from salary_aggregate import (collect_appearances, aggregate, write_detail_csv, write_summary_csv,
+                              write_detail_csv_rows, write_summary_csv_rows)
+import salary_incremental
+import salary_pipeline
+import salary_shards
+from salary_spill import SpillAggregator
+from salary_preview import PREVIEW_NAME, PreviewOverBudget, preview, print_preview, write_preview_csv, add_preview_arguments
+from salary_columnar import TABLES_NAME, write_tables
+from judge_rules import RuleOptions, DEFAULT_EXPECTED_COUNT, validate
+from salary_analytics import (ANALYTICS_NAME, DEFAULT_TOP_N, DEFAULT_MIN_REVIEWS, analyze, write_analytics,
+                              load_analytics, print_analytics, add_analytics_arguments)
+from salary_rollup import add_rollup_arguments, check_rollup_arguments, record_from_args
+from profiling import PROFILER, add_profile_arguments, start_from_args, finish_from_args
 
-def has_color(cell):
+def compute_totals(judge_rows, on_appearances=None):
     """
-    判断单个格子是否有浅蓝/浅绿填充
-    根据实际文件，有颜色的格子特征：
-    - patternType == 'solid'
-    - theme == 8 (浅蓝) 或 theme == 9 (浅绿)
+    遍历 JudgeRow 流，返回 SalaryTotals
+    on_appearances 不为 None 时另外交给它带行信息的 Appearances（见 salary_analytics）
     """
-    if not cell or not cell.fill:
-        return False
-    
-    # 检查是否为实心填充
-    if cell.fill.patternType != 'solid':
-        return False
-    
-    # 检查主题颜色
-    if cell.fill.fgColor and hasattr(cell.fill.fgColor, 'theme'):
-        theme = cell.fill.fgColor.theme
-        # theme 8 = 浅蓝, theme 9 = 浅绿
-        if theme in [8, 9]:
-            return True
-    
-    return False
+    print("开始处理数据...")
+    with PROFILER.phase("collect_appearances") as ph:
+        appearances = collect_appearances(judge_rows, with_rows=on_appearances is not None)
+        ph.rows = appearances.rows
+    print(f"共处理 {appearances.rows} 行数据")
+    with PROFILER.phase("aggregate") as ph:
+        totals = aggregate(appearances)
+        ph.rows = len(appearances.codes)
+    if on_appearances is not None:
+        on_appearances(appearances)
+    return totals
 
-def parse_teachers(s):
-    """把 '彭海航-1 李长葳-51 ...' 拆成 ['彭海航-1','李长葳-51',...]"""
-    if not s or not str(s).strip():
-        return []
-    return [x.strip() for x in str(s).split() if x.strip()]
+def compute_totals_pipelined(xlsx_path, engine='openpyxl', fill_rule=DEFAULT_FILL_RULE, use_cache=True,
+                             rules=None, options=RuleOptions(), on_appearances=None):
+    """
+    流水线模式（见 salary_pipeline）：读取进程解析工作簿，主进程同时汇总，
+    rules 不为 None 时校验进程同时检查这些规则
+    返回 (SalaryTotals, ValidationReport 或 None)；只有一个 CPU 时改用普通循环，结果相同
+    """
+    if not salary_pipeline.pipeline_available():
+        print("只有 1 个 CPU，流水线没有收益，改用普通循环")
+        rows = iter_judge_rows(xlsx_path, engine=engine, fill_rule=fill_rule, use_cache=use_cache)
+        if rules is not None:
+            rows = list(rows)   # 校验需要再遍历一次
+        totals = compute_totals(rows, on_appearances)
+        return totals, validate(rows, rules, options) if rules is not None else None
 
-def extract_teacher_name(teacher_id):
-    """从 '孙林-251' 提取出 '孙林'"""
-    if '-' in teacher_id:
-        return teacher_id.rsplit('-', 1)[0]  # 按最后一个 - 分割，取前面部分
-    return teacher_id
+    print("开始处理数据（流水线：解析与汇总" + ("、校验" if rules is not None else "") + "同时进行）...")
+    with PROFILER.phase("pipeline") as ph:
+        result = salary_pipeline.run_pipeline(xlsx_path, engine, fill_rule, use_cache,
+                                              rules=rules, options=options,
+                                              with_rows=on_appearances is not None)
+        ph.rows = result.appearances.rows
+    print(f"共处理 {result.appearances.rows} 行数据")
+    with PROFILER.phase("aggregate") as ph:
+        totals = aggregate(result.appearances)
+        ph.rows = len(result.appearances.codes)
+    if on_appearances is not None:
+        on_appearances(result.appearances)
+    return totals, result.validation
 
-def main():
-    base = Path(__file__).resolve().parent
-    xlsx_path = base / "judge.xlsx"
-    
-    print(f"正在读取文件: {xlsx_path}")
-    # data_only=True 读取公式的计算结果而不是公式本身
-    wb = openpyxl.load_workbook(xlsx_path, data_only=True)
-    ws = wb.active
-
-    # 列号：C=passed_users(3), D=failed_users(4), K=决定正确金额/每人(11), N=决定错误金额/每人(14)
-    col_passed = 3
-    col_failed = 4
-    col_correct_per = 11   # K列
-    col_wrong_per   = 14   # N列
-
-    total_detail = defaultdict(lambda: [0.0, 0.0])   # 老师-ID -> [正确总金, 错误总金]
-    # 老师姓名 -> [正确总金, 错误总金, 正确题数, 错误题数]
-    total_summary = defaultdict(lambda: [0.0, 0.0, 0, 0])
-
-    print(f"开始处理 {ws.max_row - 1} 行数据...")
-    
-    for row in range(2, ws.max_row + 1):
-        correct_per = ws.cell(row=row, column=col_correct_per).value
-        wrong_per   = ws.cell(row=row, column=col_wrong_per).value
-        
-        try:
-            correct_per = float(correct_per) if correct_per is not None else 0.0
-            wrong_per   = float(wrong_per)   if wrong_per   is not None else 0.0
-        except (TypeError, ValueError):
-            continue
-
-        # 处理 passed_users 格子（C列）
-        cell_passed = ws.cell(row=row, column=col_passed)
-        passed_list = parse_teachers(cell_passed.value)
-        if has_color(cell_passed):
-            # 有颜色 → 判断正确
-            for t in passed_list:
-                teacher_name = extract_teacher_name(t)
-                total_detail[t][0] += correct_per       # 详细记录
-                total_summary[teacher_name][0] += correct_per  # 汇总记录
-                total_summary[teacher_name][2] += 1     # 正确题数 +1
-        else:
-            # 没颜色 → 判断错误
-            for t in passed_list:
-                teacher_name = extract_teacher_name(t)
-                total_detail[t][1] += wrong_per
-                total_summary[teacher_name][1] += wrong_per
-                total_summary[teacher_name][3] += 1     # 错误题数 +1
-
-        # 处理 failed_users 格子（D列）
-        cell_failed = ws.cell(row=row, column=col_failed)
-        failed_list = parse_teachers(cell_failed.value)
-        if has_color(cell_failed):
-            # 有颜色 → 判断正确
-            for t in failed_list:
-                teacher_name = extract_teacher_name(t)
-                total_detail[t][0] += correct_per
-                total_summary[teacher_name][0] += correct_per
-                total_summary[teacher_name][2] += 1     # 正确题数 +1
+def compute_totals_sharded(xlsx_path, fill_rule=DEFAULT_FILL_RULE, jobs=None, on_appearances=None):
+    """
+    分片模式（见 salary_shards）：工作表按行切片，各片在工作进程中并行解析、展开，
+    按片的顺序拼接后汇总，结果与 compute_totals 逐位相同
+    """
+    jobs = salary_shards.default_jobs(jobs)
+    print(f"开始处理数据（分片：{jobs} 个进程）...")
+    with PROFILER.phase("collect_appearances_sharded") as ph:
+        appearances = salary_shards.collect_appearances_sharded(xlsx_path, fill_rule, jobs=jobs,
+                                                                with_rows=on_appearances is not None)
+        ph.rows = appearances.rows
+    print(f"共处理 {appearances.rows} 行数据")
+    with PROFILER.phase("aggregate") as ph:
+        totals = aggregate(appearances)
+        ph.rows = len(appearances.codes)
+    if on_appearances is not None:
+        on_appearances(appearances)
+    return totals
+
+def compute_totals_incremental(judge_rows, checkpoint_path, fill_rule=DEFAULT_FILL_RULE, check_full=False):
+    """
+    按检查点增量计算，返回 (SalaryTotals, 是否通过全量核对)
+    check_full=True 时再全量重算一次，确认与增量结果一致；不核对时第二项恒为 True
+    """
+    print("开始增量处理数据...")
+    if check_full:
+        judge_rows = list(judge_rows)   # 全量核对需要再遍历一次
+    with PROFILER.phase("incremental_update") as ph:
+        result = salary_incremental.update(judge_rows, checkpoint_path, fill_rule)
+        ph.rows = result.added + result.removed
+    if result.full:
+        print(f"检查点不存在、已失效或行顺序有变化，已全量计算 {result.added} 行并写出检查点: {checkpoint_path}")
+    else:
+        print(f"增量更新：未变化 {result.unchanged} 行，新增 {result.added} 行，删除 {result.removed} 行"
+              f"（其中修改 {len(result.changed)} 个题目）")
+
+    ok = True
+    if check_full:
+        with PROFILER.phase("check_full") as ph:
+            mismatched = salary_incremental.check_against_full(result.state, judge_rows)
+            ph.rows = len(judge_rows)
+        if mismatched:
+            ok = False
+            print(f"❌ 全量核对失败：{len(mismatched)} 个老师-ID 与全量重算结果不一致")
+            for t in mismatched[:20]:
+                print(f"  {t}")
         else:
-            # 没颜色 → 判断错误
-            for t in failed_list:
-                teacher_name = extract_teacher_name(t)
-                total_detail[t][1] += wrong_per
-                total_summary[teacher_name][1] += wrong_per
-                total_summary[teacher_name][3] += 1     # 错误题数 +1
+            print("✅ 全量核对通过：增量结果与全量重算完全一致")
+
+    with PROFILER.phase("build_totals"):
+        totals = result.state.to_totals()
+    return totals, ok
 
-    wb.close()
+def output_dir(out_dir):
+    """输出目录（--out-dir）不存在时先创建，返回 Path"""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    return out_dir
 
+def write_outputs(totals, out_dir, columnar=False):
+    """
+    把汇总结果写入 out_dir 下的 salary_detail.csv / salary_summary.csv
+    columnar=True 时再写一份列式的 salary_tables.npz（见 salary_columnar）
+    """
     # 输出到终端
     print("\n" + "="*80)
-    print(f"处理完成！详细记录 {len(total_detail)} 条，汇总 {len(total_summary)} 位老师")
+    print(f"处理完成！详细记录 {len(totals.ids)} 条，汇总 {len(totals.names)} 位老师")
     print("="*80)
+    out_dir = output_dir(out_dir)
     
     # 写入详细文件
-    detail_path = base / "salary_detail.csv"
-    with open(detail_path, 'w', encoding='utf-8-sig', newline='') as f:
-        f.write("老师,回答正确所得金,回答错误所得金,所得金合计\n")
-        for t in sorted(total_detail.keys()):
-            c, w = total_detail[t]
-            f.write(f"{t},{c:.2f},{w:.2f},{c+w:.2f}\n")
+    detail_path = out_dir / "salary_detail.csv"
+    with PROFILER.phase("write_detail_csv") as ph:
+        write_detail_csv(totals, detail_path)
+        ph.rows = len(totals.ids)
     
     print(f"\n详细记录已写入: {detail_path}")
     
     # 写入汇总文件
-    summary_path = base / "salary_summary.csv"
-    with open(summary_path, 'w', encoding='utf-8-sig', newline='') as f:
-        f.write("老师,回答正确所得金,回答错误所得金,所得金合计,评价正确题数,评价错误题数,评价总题数\n")
-        for t in sorted(total_summary.keys()):
-            c, w, correct_count, wrong_count = total_summary[t]
-            total_count = correct_count + wrong_count
-            f.write(f"{t},{c:.2f},{w:.2f},{c+w:.2f},{correct_count},{wrong_count},{total_count}\n")
+    summary_path = out_dir / "salary_summary.csv"
+    with PROFILER.phase("write_summary_csv") as ph:
+        write_summary_csv(totals, summary_path)
+        ph.rows = len(totals.names)
     
     print(f"汇总数据已写入: {summary_path}")
-    print(f"\n详细记录: {len(total_detail)} 条")
-    print(f"汇总老师: {len(total_summary)} 位")
+
+    if columnar:
+        tables_path = out_dir / TABLES_NAME
+        with PROFILER.phase("write_columnar") as ph:
+            write_tables(totals, tables_path)
+            ph.rows = len(totals.ids) + len(totals.names)
+        print(f"列式数据已写入: {tables_path}")
+    print(f"\n详细记录: {len(totals.ids)} 条")
+    print(f"汇总老师: {len(totals.names)} 位")
+
+def write_outputs_spilled(judge_rows, out_dir, memory_limit, spill_dir=None):
+    """
+    限定内存模式（见 salary_spill）：汇总占用的内存最多约 memory_limit MB，超出时写临时分段，
+    最后 k 路归并，边归并边写出 salary_detail.csv / salary_summary.csv，内容与 write_outputs 相同
+    """
+    print(f"开始处理数据（限定内存：{memory_limit} MB）...")
+    out_dir = output_dir(out_dir)
+    detail_path = out_dir / "salary_detail.csv"
+    summary_path = out_dir / "salary_summary.csv"
+    with SpillAggregator(memory_limit, tmp_dir=spill_dir) as agg:
+        with PROFILER.phase("spill_collect") as ph:
+            agg.add_rows(judge_rows)
+            agg.finish()
+            ph.rows = agg.rows
+        print(f"共处理 {agg.rows} 行数据")
+        if agg.spilled_runs:
+            print(f"缓冲区达到上限，已写出 {agg.spilled_runs} 个临时分段，归并写出结果")
+        with PROFILER.phase("merge_detail_csv") as ph:
+            n_ids = ph.rows = write_detail_csv_rows(agg.detail_rows(), detail_path)
+        with PROFILER.phase("merge_summary_csv") as ph:
+            n_names = ph.rows = write_summary_csv_rows(agg.summary_rows(), summary_path)
+
+    print("\n" + "="*80)
+    print(f"处理完成！详细记录 {n_ids} 条，汇总 {n_names} 位老师")
+    print("="*80)
+    print(f"\n详细记录已写入: {detail_path}")
+    print(f"汇总数据已写入: {summary_path}")
+    print(f"\n详细记录: {n_ids} 条")
+    print(f"汇总老师: {n_names} 位")
+
+def run_preview(xlsx_path, out_dir, budget, seed=None, fill_rule=DEFAULT_FILL_RULE):
+    """
+    抽样预览（见 salary_preview）：输出估计值，写到 salary_preview.csv
+    准备工作已经用完 budget 时不给出估计，返回 False
+    """
+    print(f"抽样预览（用时上限约 {budget:g} 秒）...")
+    try:
+        result = preview(xlsx_path, budget, fill_rule=fill_rule, seed=seed)
+    except PreviewOverBudget as e:
+        print(f"❌ 预览失败：{e}")
+        print("这部分耗时与整个工作表的大小成正比，抽样无法缩短；请加大 --preview 的秒数，或直接运行 calc")
+        return False
+    print_preview(result)
+    path = output_dir(out_dir) / PREVIEW_NAME
+    write_preview_csv(result, path)
+    print(f"\n预览估计已写入: {path}（不是最终结果）")
+    return True
+
+def write_analytics_outputs(appearances, out_dir, expected_count=DEFAULT_EXPECTED_COUNT,
+                            top_n=DEFAULT_TOP_N, min_reviews=DEFAULT_MIN_REVIEWS):
+    """评审分析（见 salary_analytics）：写出 salary_analytics.npz，再从写出的表输出摘要"""
+    path = output_dir(out_dir) / ANALYTICS_NAME
+    with PROFILER.phase("analytics") as ph:
+        write_analytics(analyze(appearances, expected_count), path)
+        ph.rows = len(appearances.codes)
+    print()
+    print_analytics(load_analytics(path), top_n, min_reviews)
+    print(f"\n分析表已写入: {path}")
+
+def add_memory_limit_arguments(parser):
+    """--memory-limit / --spill-dir：calc 的限定内存模式"""
+    parser.add_argument("--memory-limit", type=int, metavar="MB",
+                        help="限定内存模式：汇总占用的内存（从读到第一行时算起，不含启动和读取工作簿的基线）"
+                             "最多约 MB 兆字节，超出时写临时文件再归并（见 salary_spill）")
+    parser.add_argument("--spill-dir", type=Path,
+                        help="配合 --memory-limit，临时分段文件的目录（默认：系统临时目录）")
+
+def _given(args, *names):
+    """names 中在命令行上指定了的选项，返回 ['--xxx', ...]；args 中没有的选项按未指定处理"""
+    given = []
+    for n in names:
+        value = getattr(args, n, None)
+        if value is not None and value is not False:     # --shards 不写 N 时为 0，也算指定了
+            given.append("--" + n.replace("_", "-"))
+    return given
+
+def check_calc_arguments(parser, args):
+    """calc 选项之间的冲突检查（本脚本与 cal.py calc 共用），有冲突时 parser.error 退出"""
+    def conflict(option, *others):
+        given = _given(args, *others)
+        if given:
+            parser.error(f"{option} 不能与 {' / '.join(given)} 同时使用")
+
+    if getattr(args, "incremental", False):
+        conflict("--incremental", "pipeline", "validate")
+    if getattr(args, "shards", None) is not None:
+        conflict("--shards", "pipeline")
+    if getattr(args, "memory_limit", None) is not None:
+        if args.memory_limit <= 0:
+            parser.error("--memory-limit 必须大于 0")
+        conflict("--memory-limit", "incremental", "pipeline", "validate", "columnar", "rollup")
+    elif getattr(args, "spill_dir", None) is not None:
+        parser.error("--spill-dir 需要配合 --memory-limit 使用")
+    if getattr(args, "preview", None) is not None:
+        if args.preview <= 0:
+            parser.error("--preview 的秒数必须大于 0")
+        conflict("--preview", "incremental", "pipeline", "validate", "columnar", "rollup", "shards", "memory_limit")
+    elif getattr(args, "seed", None) is not None:
+        parser.error("--seed 需要配合 --preview 使用")
+    if getattr(args, "analytics", False):
+        conflict("--analytics", "incremental", "memory_limit", "preview")
+
+def main():
+    parser = argparse.ArgumentParser(description="从 judge.xlsx 汇总每位老师的所得金")
+    parser.add_argument("--engine", choices=ENGINES, default="openpyxl",
+                        help="读取引擎：openpyxl（默认）或 fast（直接解析 XML）")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="忽略 .judge_cache/ 中的解析缓存，强制重新解析 judge.xlsx")
+    parser.add_argument("--incremental", action="store_true",
+                        help="使用检查点，只处理新增、删除或修改过的行")
+    parser.add_argument("--checkpoint", type=Path,
+                        help=f"增量检查点路径（默认：脚本目录下的 {salary_incremental.CHECKPOINT_NAME}）")
+    parser.add_argument("--check-full", action="store_true",
+                        help="配合 --incremental，再全量重算一次并确认结果一致")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="流水线模式：解析与汇总在不同进程中同时进行（多核时更快）")
+    parser.add_argument("--columnar", action="store_true",
+                        help=f"另外写出列式二进制的 {TABLES_NAME}（金额为整数分，可直接映射读取）")
+    salary_shards.add_shard_argument(parser)
+    add_memory_limit_arguments(parser)
+    add_preview_arguments(parser)
+    parser.add_argument("--analytics", action="store_true",
+                        help=f"另外写出评审分析表 {ANALYTICS_NAME}（正确率、每题一致程度，见 salary_analytics）")
+    add_analytics_arguments(parser)
+    add_rollup_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    check_calc_arguments(parser, args)
+    check_rollup_arguments(parser, args)
+    start_from_args(args)
+
+    base = Path(__file__).resolve().parent
+    xlsx_path = base / "judge.xlsx"
+    if args.preview is not None:
+        ok = run_preview(xlsx_path, base, args.preview, args.seed)
+        finish_from_args(args, command="calc")
+        if not ok:
+            raise SystemExit(1)
+        return
+    
+    print(f"正在读取文件: {xlsx_path} (引擎: {'fast，分片' if args.shards is not None else args.engine})")
+
+    def judge_rows():
+        if args.shards is not None:
+            return salary_shards.iter_judge_rows_sharded(xlsx_path, jobs=args.shards)
+        return iter_judge_rows(xlsx_path, engine=args.engine, use_cache=not args.no_cache)
+
+    if args.memory_limit is not None:
+        write_outputs_spilled(judge_rows(), base, args.memory_limit, args.spill_dir)
+        finish_from_args(args, command="calc")
+        return
+    ok = True
+    captured = []
+    on_appearances = captured.append if args.analytics else None
+    if args.shards is not None and not args.incremental:
+        totals = compute_totals_sharded(xlsx_path, jobs=args.shards, on_appearances=on_appearances)
+    elif args.pipeline:
+        totals, _ = compute_totals_pipelined(xlsx_path, args.engine, use_cache=not args.no_cache,
+                                             on_appearances=on_appearances)
+    elif args.incremental:
+        checkpoint = args.checkpoint or base / salary_incremental.CHECKPOINT_NAME
+        totals, ok = compute_totals_incremental(judge_rows(), checkpoint, check_full=args.check_full)
+    else:
+        totals = compute_totals(judge_rows(), on_appearances)
+    write_outputs(totals, base, columnar=args.columnar)
+    if captured:
+        write_analytics_outputs(captured[0], base, top_n=args.top, min_reviews=args.min_reviews)
+    record_from_args(args, xlsx_path, totals)
+    finish_from_args(args, command="calc")
+    if not ok:
+        raise SystemExit(1)
 
 if __name__ == "__main__":
     main()
@@ -1,57 +1,28 @@
 # -*- coding: utf-8 -*-
 """
 检查每个题目的评审老师数量是否为5位
+（judge_rules 中 teacher_count 规则的单独入口；全部规则见 cal.py validate）
 """
 
-import openpyxl
+import argparse
+from judge_loader import iter_judge_rows
+from salary_shards import add_shard_argument, iter_judge_rows_sharded
+from judge_rules import validate, select_rules
+from profiling import PROFILER, add_profile_arguments, start_from_args, finish_from_args
 
-def parse_teachers(s):
-    """解析老师列表"""
-    if not s or not str(s).strip():
-        return []
-    return [x.strip() for x in str(s).split() if x.strip()]
-
-def main():
-    xlsx_path = "judge.xlsx"
-    
+@PROFILER.profiled("check_count")
+def check_count(judge_rows):
+    """检查每个题目的老师数量是否为5，全部满足时返回 True"""
     print("="*80)
     print("检查每个题目的评审老师数量")
     print("="*80)
     
-    wb = openpyxl.load_workbook(xlsx_path, data_only=True)
-    ws = wb.active
-    
-    problems_with_issues = []
-    total_problems = 0
-    
-    for row in range(2, ws.max_row + 1):
-        problem_id = ws.cell(row, 1).value  # A列：题号/import_id
-        
-        # C列 passed_users
-        cell_c = ws.cell(row, 3)
-        passed_teachers = parse_teachers(cell_c.value)
-        
-        # D列 failed_users
-        cell_d = ws.cell(row, 4)
-        failed_teachers = parse_teachers(cell_d.value)
-        
-        # 合并所有老师
-        all_teachers = passed_teachers + failed_teachers
-        teacher_count = len(all_teachers)
-        
-        total_problems += 1
-        
-        # 检查是否为5位老师
-        if teacher_count != 5:
-            problems_with_issues.append({
-                'row': row,
-                'problem_id': problem_id,
-                'count': teacher_count,
-                'passed': passed_teachers,
-                'failed': failed_teachers
-            })
-    
-    wb.close()
+    # 由 judge_rules 的 teacher_count 规则完成检查
+    report = validate(judge_rows, select_rules(['teacher_count']))
+    total_problems = report.rows
+    problems_with_issues = [
+        {'row': v.row, 'problem_id': v.problem_id, **v.detail} for v in report.violations
+    ]
     
     # 输出结果
     print(f"\n总共检查了 {total_problems} 个题目")
@@ -79,5 +50,22 @@ def main():
     expected_records = total_problems * 5
     print(f"\n理论上应该有的记录数: {total_problems} 题目 × 5 老师 = {expected_records} 条")
 
+    return not problems_with_issues
+
+def main():
+    parser = argparse.ArgumentParser(description="检查每个题目的评审老师数量是否为5位")
+    add_shard_argument(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    start_from_args(args)
+
+    xlsx_path = "judge.xlsx"
+    if args.shards is not None:
+        rows = iter_judge_rows_sharded(xlsx_path, jobs=args.shards)
+    else:
+        rows = iter_judge_rows(xlsx_path, use_cache=True)
+    check_count(rows)
+    finish_from_args(args, command="check-count")
+
 if __name__ == "__main__":
     main()
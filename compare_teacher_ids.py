@@ -3,36 +3,79 @@
 对比Excel中的老师-ID和CSV中的老师-ID，找出差异
 """
 
-import openpyxl
+import argparse
 import csv
+from judge_loader import iter_judge_rows, parse_teachers
+from salary_shards import add_shard_argument, iter_judge_rows_sharded
+from report_writer import add_report_arguments, check_report_arguments, open_report_from_args, progress_printer
+from profiling import PROFILER, add_profile_arguments, start_from_args, finish_from_args
 
-def parse_teachers(s):
-    """解析老师列表"""
-    if not s or not str(s).strip():
-        return []
-    return [x.strip() for x in str(s).split() if x.strip()]
+@PROFILER.profiled("read_csv_teacher_ids")
+def read_csv_teacher_ids(csv_path):
+    """从 salary_detail.csv 读取所有老师-ID"""
+    csv_teacher_ids = set()
+    with open(csv_path, 'r', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            csv_teacher_ids.add(row['老师'])
+    return csv_teacher_ids
 
-def main():
-    xlsx_path = "judge.xlsx"
-    csv_path = "salary_detail.csv"
-    
-    print("="*80)
-    print("对比Excel和CSV中的老师-ID")
-    print("="*80)
+# 结构化报告（--report）的字段
+REPORT_FIELDS = ('teacher_id', 'appearances', 'problems')
+
+def _appearance_record(teacher_id, appearances):
+    return {
+        'teacher_id': teacher_id,
+        'appearances': len(appearances),
+        'problems': ";".join(f"{problem_id}({status})" for problem_id, status in appearances),
+    }
+
+def write_compare_report(report, excel_teacher_details, csv_teacher_ids, missing, extra):
+    """
+    以结构化报告输出对比结果：missing / extra / repeated 三段，每个老师-ID 一条记录
+    （题目详情合并在 problems 一个字段里）；--top 时 missing / repeated 取出现次数最多的
+    """
+    def by_appearances(teacher_id):
+        return len(excel_teacher_details[teacher_id])
+
+    def render(teacher_id):
+        return _appearance_record(teacher_id, excel_teacher_details[teacher_id])
+
+    report.section('missing', missing, key=by_appearances, render=render)
+    report.section('extra', extra, render=lambda teacher_id: {'teacher_id': teacher_id})
+    repeated = [t for t in sorted(excel_teacher_details) if len(excel_teacher_details[t]) > 1]
+    report.section('repeated', repeated, key=by_appearances, render=render)
+    report.summary({
+        'excel_ids': len(excel_teacher_details),
+        'csv_ids': len(csv_teacher_ids),
+        'missing': len(missing),
+        'extra': len(extra),
+        'repeated_ids': len(repeated),
+        'total_repeats': sum(len(excel_teacher_details[t]) - 1 for t in repeated),
+        'ok': not missing and not extra,
+    })
+
+@PROFILER.profiled("compare_ids")
+def compare_ids(judge_rows, csv_teacher_ids, report=None):
+    """
+    对比 Excel 与 CSV 中的老师-ID，没有缺失也没有多余时返回 True
+    report 为 report_writer 的写入器时，不逐行打印，结果写成结构化报告
+    """
+    say = progress_printer(report)
+    say("="*80)
+    say("对比Excel和CSV中的老师-ID")
+    say("="*80)
     
     # 1. 从Excel提取所有唯一的老师-ID
-    print("\n[1/3] 从Excel提取所有老师-ID...")
-    wb = openpyxl.load_workbook(xlsx_path, data_only=True)
-    ws = wb.active
-    
+    say("\n[1/3] 从Excel提取所有老师-ID...")
     excel_teacher_ids = set()
     excel_teacher_details = {}  # 记录每个老师出现在哪些题目中
     
-    for row in range(2, ws.max_row + 1):
-        problem_id = ws.cell(row, 1).value
+    for r in judge_rows:
+        problem_id = r.problem_id
         
         # C列 passed_users
-        passed = parse_teachers(ws.cell(row, 3).value)
+        passed = parse_teachers(r.passed)
         for t in passed:
             excel_teacher_ids.add(t)
             if t not in excel_teacher_details:
@@ -40,69 +83,64 @@ def main():
             excel_teacher_details[t].append((problem_id, 'passed'))
         
         # D列 failed_users
-        failed = parse_teachers(ws.cell(row, 4).value)
+        failed = parse_teachers(r.failed)
         for t in failed:
             excel_teacher_ids.add(t)
             if t not in excel_teacher_details:
                 excel_teacher_details[t] = []
             excel_teacher_details[t].append((problem_id, 'failed'))
-    
-    wb.close()
-    print(f"   Excel中找到 {len(excel_teacher_ids)} 个唯一的老师-ID")
+    say(f"   Excel中找到 {len(excel_teacher_ids)} 个唯一的老师-ID")
     
     # 2. 从CSV读取所有老师-ID
-    print("\n[2/3] 从CSV读取所有老师-ID...")
-    csv_teacher_ids = set()
-    
-    with open(csv_path, 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            csv_teacher_ids.add(row['老师'])
-    
-    print(f"   CSV中找到 {len(csv_teacher_ids)} 个老师-ID")
+    say("\n[2/3] 从CSV读取所有老师-ID...")
+    say(f"   CSV中找到 {len(csv_teacher_ids)} 个老师-ID")
     
     # 3. 找出差异
-    print("\n[3/3] 对比差异...")
+    say("\n[3/3] 对比差异...")
     missing = sorted(excel_teacher_ids - csv_teacher_ids)  # Excel有但CSV没有
     extra = sorted(csv_teacher_ids - excel_teacher_ids)    # CSV有但Excel没有
+
+    if report is not None:
+        write_compare_report(report, excel_teacher_details, csv_teacher_ids, missing, extra)
+        return not missing and not extra
     
-    print("\n" + "="*80)
-    print("对比结果")
-    print("="*80)
+    say("\n" + "="*80)
+    say("对比结果")
+    say("="*80)
     
-    print(f"\nExcel中有: {len(excel_teacher_ids)} 个老师-ID")
-    print(f"CSV中有:   {len(csv_teacher_ids)} 个老师-ID")
-    print(f"差异:      {len(excel_teacher_ids) - len(csv_teacher_ids)} 条")
+    say(f"\nExcel中有: {len(excel_teacher_ids)} 个老师-ID")
+    say(f"CSV中有:   {len(csv_teacher_ids)} 个老师-ID")
+    say(f"差异:      {len(excel_teacher_ids) - len(csv_teacher_ids)} 条")
     
     if missing:
-        print(f"\n" + "="*80)
-        print(f"Excel中有但CSV中缺失的老师-ID: {len(missing)} 个")
-        print("="*80)
+        say(f"\n" + "="*80)
+        say(f"Excel中有但CSV中缺失的老师-ID: {len(missing)} 个")
+        say("="*80)
         
         for teacher_id in missing:
             appearances = excel_teacher_details[teacher_id]
-            print(f"\n老师-ID: {teacher_id}")
-            print(f"  出现次数: {len(appearances)}")
-            print(f"  题目详情:")
+            say(f"\n老师-ID: {teacher_id}")
+            say(f"  出现次数: {len(appearances)}")
+            say(f"  题目详情:")
             for problem_id, status in appearances:
-                print(f"    - 题目 {problem_id} ({status})")
+                say(f"    - 题目 {problem_id} ({status})")
     else:
-        print("\n✓ Excel中的所有老师-ID都在CSV中")
+        say("\n✓ Excel中的所有老师-ID都在CSV中")
     
     if extra:
-        print(f"\n" + "="*80)
-        print(f"CSV中有但Excel中不存在的老师-ID: {len(extra)} 个")
-        print("="*80)
+        say(f"\n" + "="*80)
+        say(f"CSV中有但Excel中不存在的老师-ID: {len(extra)} 个")
+        say("="*80)
         
         for teacher_id in extra:
-            print(f"  - {teacher_id}")
+            say(f"  - {teacher_id}")
     else:
-        print("\n✓ CSV中没有多余的老师-ID")
+        say("\n✓ CSV中没有多余的老师-ID")
     
     # 检查重复使用的老师-ID
-    print("\n" + "="*80)
-    print("检查重复使用的老师-ID")
-    print("="*80)
+    say("\n" + "="*80)
+    say("检查重复使用的老师-ID")
+    say("="*80)
     
     repeated_teachers = []
     for teacher_id, appearances in excel_teacher_details.items():
@@ -110,31 +148,56 @@ def main():
             repeated_teachers.append((teacher_id, appearances))
     
     if repeated_teachers:
-        print(f"\n发现 {len(repeated_teachers)} 个老师-ID被重复使用（评审了多个题目）:")
+        say(f"\n发现 {len(repeated_teachers)} 个老师-ID被重复使用（评审了多个题目）:")
         total_repeats = 0
         for teacher_id, appearances in sorted(repeated_teachers):
-            print(f"\n老师-ID: {teacher_id}")
-            print(f"  评审次数: {len(appearances)}")
-            print(f"  题目详情:")
+            say(f"\n老师-ID: {teacher_id}")
+            say(f"  评审次数: {len(appearances)}")
+            say(f"  题目详情:")
             for problem_id, status in appearances:
-                print(f"    - 题目 {problem_id} ({status})")
+                say(f"    - 题目 {problem_id} ({status})")
             total_repeats += len(appearances) - 1  # 减1是因为第一次不算重复
         
-        print(f"\n总重复次数: {total_repeats}")
-        print(f"计算验证: {len(excel_teacher_ids)} 个唯一ID + {total_repeats} 次重复 = {len(excel_teacher_ids) + total_repeats} 条总记录")
+        say(f"\n总重复次数: {total_repeats}")
+        say(f"计算验证: {len(excel_teacher_ids)} 个唯一ID + {total_repeats} 次重复 = {len(excel_teacher_ids) + total_repeats} 条总记录")
     else:
-        print("\n✓ 没有重复使用的老师-ID，每个ID只评审了1个题目")
+        say("\n✓ 没有重复使用的老师-ID，每个ID只评审了1个题目")
     
     # 汇总
-    print("\n" + "="*80)
-    print("问题汇总")
-    print("="*80)
+    say("\n" + "="*80)
+    say("问题汇总")
+    say("="*80)
     if missing:
-        print(f"\n可能原因：这 {len(missing)} 个老师-ID在生成CSV时被跳过了")
-        print("建议检查 calc_salary_from_judge.py 中的数据处理逻辑")
-        print("特别是这些老师所在行的K列（正确金额）和N列（错误金额）是否有异常")
+        say(f"\n可能原因：这 {len(missing)} 个老师-ID在生成CSV时被跳过了")
+        say("建议检查 calc_salary_from_judge.py 中的数据处理逻辑")
+        say("特别是这些老师所在行的K列（正确金额）和N列（错误金额）是否有异常")
+    else:
+        say("\n没有发现缺失的老师-ID，数据一致！")
+
+    return not missing and not extra
+
+def main():
+    parser = argparse.ArgumentParser(description="对比Excel中的老师-ID和CSV中的老师-ID")
+    add_shard_argument(parser)
+    add_report_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    check_report_arguments(parser, args)
+    start_from_args(args)
+
+    xlsx_path = "judge.xlsx"
+    csv_path = "salary_detail.csv"
+    report = open_report_from_args(args, REPORT_FIELDS)
+    if args.shards is not None:
+        rows = iter_judge_rows_sharded(xlsx_path, jobs=args.shards)
     else:
-        print("\n没有发现缺失的老师-ID，数据一致！")
+        rows = iter_judge_rows(xlsx_path, use_cache=True)
+    try:
+        compare_ids(rows, read_csv_teacher_ids(csv_path), report)
+    finally:
+        if report is not None:
+            report.close()
+    finish_from_args(args, command="compare-ids")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+judge.xlsx 解析结果缓存：第一次解析时把 JudgeRow 流写入工作簿旁边的
+.judge_cache/ 目录，之后同一个文件直接从缓存读出，不再解析 xlsx，也不导入 openpyxl
+
+缓存按「工作簿内容的 SHA-256 + 解析器版本 + 填充颜色规则」做键，任一项变化即失效
+文件格式（全部为标准库 marshal + zlib）：
+    MAGIC | 头部长度 | marshal(头部) | { 块长度 | zlib(marshal(按列存放的一块行)) } ...
+"""
+
+import hashlib
+import marshal
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+
+from judge_loader import JudgeRow, PARSER_VERSION, DEFAULT_FILL_RULE, parse_judge_rows
+from profiling import PROFILER
+
+CACHE_DIR_NAME = ".judge_cache"
+CACHE_SUFFIX = ".jcache"
+MAGIC = b"JDGC"
+FORMAT_VERSION = 1
+
+# 每块行数：块越大压缩越好，但流式读取时占用的内存也越大
+CHUNK_ROWS = 4096
+
+# 淘汰策略默认值：整个缓存目录最多 256 MB，超过 90 天未使用的缓存直接删除
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 90
+
+_LEN = struct.Struct("<I")
+
+
+def file_sha256(path):
+    """分块计算文件的 SHA-256"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cache_header(sha256, fill_rule, sheet=None):
+    return {
+        "format": FORMAT_VERSION,
+        "parser": PARSER_VERSION,
+        "sha256": sha256,
+        "fill_rule": (sorted(fill_rule.themes), sorted(fill_rule.rgbs)),
+        "sheet": sheet,
+    }
+
+
+def cache_path_for(xlsx_path, sha256, sheet=None):
+    """
+    缓存文件路径：<工作簿目录>/.judge_cache/<文件名>.<哈希前16位>.jcache
+    指定了工作表时再加上工作表名称的哈希：<文件名>.<哈希前16位>.<表名哈希>.jcache
+    """
+    xlsx_path = Path(xlsx_path)
+    suffix = ""
+    if sheet is not None:
+        suffix = "." + hashlib.sha256(sheet.encode("utf-8")).hexdigest()[:8]
+    return xlsx_path.parent / CACHE_DIR_NAME / f"{xlsx_path.name}.{sha256[:16]}{suffix}{CACHE_SUFFIX}"
+
+
+def _read_block(f):
+    raw = f.read(_LEN.size)
+    if not raw:
+        return None
+    if len(raw) != _LEN.size:
+        raise ValueError("缓存文件被截断")
+    (size,) = _LEN.unpack(raw)
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("缓存文件被截断")
+    return data
+
+
+def _write_block(f, data):
+    f.write(_LEN.pack(len(data)))
+    f.write(data)
+
+
+def _read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        return None
+    data = _read_block(f)
+    return marshal.loads(data) if data is not None else None
+
+
+def _iter_cached_rows(f):
+    """从缓存文件中逐块读出 JudgeRow"""
+    while True:
+        data = _read_block(f)
+        if data is None:
+            return
+        for values in zip(*marshal.loads(zlib.decompress(data))):
+            yield JudgeRow._make(values)
+
+
+def _pack_chunk(rows):
+    """把一块行按列打包；含有 marshal 不支持的值（如日期）时抛出 ValueError"""
+    return zlib.compress(marshal.dumps(tuple(list(col) for col in zip(*rows))))
+
+
+def _iter_and_store(rows, cache_path, header):
+    """边产出行边写缓存；只有完整读完才把临时文件换成正式缓存"""
+    cache_path.parent.mkdir(exist_ok=True)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    f = open(tmp_path, "wb")
+    writable = True
+    completed = False
+    try:
+        f.write(MAGIC)
+        _write_block(f, marshal.dumps(header))
+        chunk = []
+        for row in rows:
+            yield row
+            if writable:
+                chunk.append(row)
+                if len(chunk) >= CHUNK_ROWS:
+                    writable = _try_write_chunk(f, chunk)
+                    chunk = []
+        if writable and chunk:
+            writable = _try_write_chunk(f, chunk)
+        completed = writable
+    finally:
+        f.close()
+        if completed:
+            os.replace(tmp_path, cache_path)
+        else:
+            tmp_path.unlink(missing_ok=True)
+
+
+def _try_write_chunk(f, chunk):
+    try:
+        _write_block(f, _pack_chunk(chunk))
+        return True
+    except ValueError:
+        # 值无法序列化时放弃本次缓存，行照常产出
+        return False
+
+
+def iter_cached_judge_rows(xlsx_path, engine='openpyxl', fill_rule=DEFAULT_FILL_RULE,
+                           max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS, sheet=None):
+    """
+    与 judge_loader.iter_judge_rows 相同的 JudgeRow 流，但优先从缓存读取
+    未命中时解析工作簿并写入缓存，同时清理该工作簿的旧缓存并按大小/时间淘汰
+    """
+    with PROFILER.phase('hash_workbook'):
+        sha256 = file_sha256(xlsx_path)
+    header = _cache_header(sha256, fill_rule, sheet)
+    cache_path = cache_path_for(xlsx_path, sha256, sheet)
+
+    if cache_path.exists():
+        f = open(cache_path, "rb")
+        try:
+            ok = _read_header(f) == header
+        except (ValueError, EOFError, TypeError):
+            ok = False
+        if ok:
+            os.utime(cache_path)  # 记录最近使用时间，淘汰时按 LRU
+            return _iter_from_open_file(f)
+        f.close()
+
+    # 未命中：这个工作簿旧内容的缓存都已过期
+    _remove_stale(xlsx_path, sha256)
+    evict(Path(xlsx_path).parent / CACHE_DIR_NAME, max_bytes, max_age_days)
+
+    return _iter_and_store(parse_judge_rows(xlsx_path, engine, fill_rule, sheet), cache_path, header)
+
+
+def _iter_from_open_file(f):
+    with f:
+        yield from _iter_cached_rows(f)
+
+
+def _remove_stale(xlsx_path, sha256):
+    """删除同一工作簿、但内容哈希不同的缓存（各工作表的缓存都保留）"""
+    cache_dir = Path(xlsx_path).parent / CACHE_DIR_NAME
+    if not cache_dir.is_dir():
+        return
+    prefix = f"{Path(xlsx_path).name}."
+    for p in cache_dir.glob(f"{prefix}*{CACHE_SUFFIX}"):
+        if not p.name[len(prefix):].startswith(sha256[:16]):
+            p.unlink(missing_ok=True)
+
+
+def evict(cache_dir, max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+    """
+    淘汰缓存：先删除超过 max_age_days 天未使用的文件，
+    再按最近使用时间从旧到新删除，直到目录总大小不超过 max_bytes
+    返回删除的文件数
+    """
+    cache_dir = Path(cache_dir)
+    if not cache_dir.is_dir():
+        return 0
+
+    now = time.time()
+    entries = []
+    removed = 0
+    for p in cache_dir.glob(f"*{CACHE_SUFFIX}"):
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue
+        if max_age_days is not None and now - st.st_mtime > max_age_days * 86400:
+            p.unlink(missing_ok=True)
+            removed += 1
+        else:
+            entries.append((st.st_mtime, st.st_size, p))
+
+    if max_bytes is not None:
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries, key=lambda e: e[0]):
+            if total <= max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+    return removed
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+judge.xlsx 的快速读取引擎：不经过 openpyxl，直接把 xlsx 当 zip 打开，
+用 iterparse 增量解析 sharedStrings.xml / styles.xml / 工作表 XML
+只处理 A/C/D/K/N 五列，其余列的格子直接跳过；
+样式表预先分类成「有颜色」的样式编号集合，逐格只做一次整数查集合
+输出与 judge_loader 的 openpyxl 引擎逐行一致
+"""
+
+import posixpath
+import zipfile
+from functools import lru_cache
+from xml.etree.ElementTree import iterparse
+
+from judge_loader import (
+    JudgeRow, COL_PROBLEM_ID, COL_PASSED, COL_FAILED, COL_CORRECT_PER, COL_WRONG_PER,
+    DEFAULT_FILL_RULE, FILL_NONE, FILL_COLORED, FILL_OTHER, fill_is_colored, fill_is_blank,
+)
+from profiling import PROFILER
+
+NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+TAG_SI = NS_MAIN + "si"
+TAG_T = NS_MAIN + "t"
+TAG_R = NS_MAIN + "r"
+TAG_V = NS_MAIN + "v"
+TAG_F = NS_MAIN + "f"
+TAG_IS = NS_MAIN + "is"
+TAG_C = NS_MAIN + "c"
+TAG_ROW = NS_MAIN + "row"
+TAG_SHEET_DATA = NS_MAIN + "sheetData"
+TAG_DIMENSION = NS_MAIN + "dimension"
+
+# 只关心这几列，其余列的格子不做任何转换
+_WANTED_COLS = frozenset([COL_PROBLEM_ID, COL_PASSED, COL_FAILED, COL_CORRECT_PER, COL_WRONG_PER])
+_AMOUNT_COLS = frozenset([COL_CORRECT_PER, COL_WRONG_PER])
+
+# 与 openpyxl 一致：这些内置数字格式是日期 / 时间间隔
+_BUILTIN_DATE_FORMATS = frozenset([14, 15, 16, 17, 18, 19, 20, 21, 22, 45, 46, 47])
+_BUILTIN_TIMEDELTA_FORMATS = frozenset([46])
+_DIGITS = "0123456789"
+
+
+@lru_cache(maxsize=None)
+def _column_index(letters):
+    """'A' -> 1, 'AA' -> 27"""
+    idx = 0
+    for ch in letters:
+        idx = idx * 26 + (ord(ch) - 64)
+    return idx
+
+
+def _text_content(node):
+    """与 openpyxl Text.content 相同：直接的 <t> 加上 <r><t>，忽略注音 <rPh>"""
+    snippets = []
+    for child in node:
+        if child.tag == TAG_T:
+            if child.text is not None:
+                snippets.append(child.text)
+        elif child.tag == TAG_R:
+            t = child.find(TAG_T)
+            if t is not None and t.text is not None:
+                snippets.append(t.text)
+    return "".join(snippets)
+
+
+def read_shared_strings(archive):
+    """读取共享字符串表"""
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    with archive.open("xl/sharedStrings.xml") as src:
+        for _, node in iterparse(src):
+            if node.tag == TAG_SI:
+                strings.append(_text_content(node).replace('x005F_', ''))
+                node.clear()
+    return strings
+
+
+def read_styles(archive, fill_rule=DEFAULT_FILL_RULE):
+    """
+    读取 styles.xml，返回 (colored, other_filled, date_styles, timedelta_styles)
+    colored 为按 fill_rule 判定「有颜色」的样式编号集合，other_filled 为有其它填充的样式编号集合
+    """
+    if "xl/styles.xml" not in archive.namelist():
+        return frozenset(), frozenset(), frozenset(), frozenset()
+
+    fills = []          # 每个 fill 的分类（FILL_NONE / FILL_COLORED / FILL_OTHER）
+    xfs = []            # cellXfs: (fillId, numFmtId)
+    num_fmts = {}       # 自定义数字格式 id -> formatCode
+    section = None
+    with archive.open("xl/styles.xml") as src:
+        for event, node in iterparse(src, events=("start", "end")):
+            tag = node.tag[len(NS_MAIN):] if node.tag.startswith(NS_MAIN) else node.tag
+            if event == "start":
+                if tag in ("fills", "cellXfs", "cellStyleXfs"):
+                    section = tag
+                continue
+            if tag in ("fills", "cellXfs", "cellStyleXfs"):
+                section = None
+            elif tag == "numFmt":
+                num_fmts[int(node.get("numFmtId"))] = node.get("formatCode", "")
+            elif tag == "fill" and section == "fills":
+                fills.append(_fill_kind(node, fill_rule))
+                node.clear()
+            elif tag == "xf" and section == "cellXfs":
+                xfs.append((int(node.get("fillId", 0)), int(node.get("numFmtId", 0))))
+                node.clear()
+
+    def styles_of(kind):
+        return frozenset(
+            style_id for style_id, (fill_id, _) in enumerate(xfs)
+            if fill_id < len(fills) and fills[fill_id] == kind
+        )
+
+    date_styles, timedelta_styles = _date_styles(xfs, num_fmts)
+    return styles_of(FILL_COLORED), styles_of(FILL_OTHER), date_styles, timedelta_styles
+
+
+def _fill_kind(fill, fill_rule):
+    """<fill> 属于哪一类，规则与 openpyxl 引擎共用 fill_is_colored / fill_is_blank"""
+    pattern = fill.find(NS_MAIN + "patternFill")
+    if pattern is None:
+        return FILL_OTHER if fill.find(NS_MAIN + "gradientFill") is not None else FILL_NONE
+    fg = pattern.find(NS_MAIN + "fgColor")
+    theme = rgb = None
+    if fg is not None and fg.get("indexed") is None:
+        if fg.get("theme") is not None:
+            theme = int(fg.get("theme"))
+        else:
+            rgb = fg.get("rgb")
+    pattern_type = pattern.get("patternType")
+    if fill_is_colored(pattern_type, theme, rgb, fill_rule):
+        return FILL_COLORED
+    return FILL_NONE if fill_is_blank(pattern_type) else FILL_OTHER
+
+
+def _date_styles(xfs, num_fmts):
+    """找出数字格式为日期 / 时间间隔的样式编号，用于和 openpyxl 一样把数字转成日期"""
+    date_styles = set()
+    timedelta_styles = set()
+    custom = {fmt_id for _, fmt_id in xfs if fmt_id in num_fmts}
+    if custom:
+        # 只有自定义数字格式时才需要 openpyxl 的判定规则
+        from openpyxl.styles.numbers import is_date_format, is_timedelta_format
+    for style_id, (_, fmt_id) in enumerate(xfs):
+        if fmt_id in num_fmts:
+            code = num_fmts[fmt_id]
+            if is_date_format(code):
+                date_styles.add(style_id)
+                if is_timedelta_format(code):
+                    timedelta_styles.add(style_id)
+        elif fmt_id in _BUILTIN_DATE_FORMATS:
+            date_styles.add(style_id)
+            if fmt_id in _BUILTIN_TIMEDELTA_FORMATS:
+                timedelta_styles.add(style_id)
+    return frozenset(date_styles), frozenset(timedelta_styles)
+
+
+def read_workbook(archive):
+    """
+    读取 workbook.xml：返回 (工作表列表, activeTab, date1904)
+    工作表列表按工作簿中的顺序，每项为 (名称, XML 路径, 是否普通工作表)
+    """
+    active = None
+    sheets = []
+    date1904 = False
+    with archive.open("xl/workbook.xml") as src:
+        for _, node in iterparse(src):
+            if node.tag == NS_MAIN + "workbookView" and active is None:
+                active = int(node.get("activeTab", 0))
+            elif node.tag == NS_MAIN + "sheet":
+                sheets.append((node.get("name"), node.get(NS_REL + "id")))
+            elif node.tag == NS_MAIN + "workbookPr":
+                date1904 = node.get("date1904") in ("1", "true")
+
+    targets = {}
+    with archive.open("xl/_rels/workbook.xml.rels") as src:
+        for _, node in iterparse(src):
+            if node.tag == NS_PKG_REL + "Relationship":
+                targets[node.get("Id")] = (node.get("Target"), node.get("Type", ""))
+
+    result = []
+    for name, rid in sheets:
+        target, rel_type = targets[rid]
+        if target.startswith("/"):
+            path = target[1:]
+        else:
+            path = posixpath.normpath(posixpath.join("xl", target))
+        result.append((name, path, rel_type.endswith("/worksheet")))
+    return result, active or 0, date1904
+
+
+def sheet_names(archive):
+    """普通工作表（不含图表工作表）的名称，按工作簿中的顺序"""
+    return [name for name, _, is_worksheet in read_workbook(archive)[0] if is_worksheet]
+
+
+def _sheet_path(archive, sheet=None):
+    """
+    找到工作表的 XML 路径：sheet 为 None 时按 activeTab 取当前工作表（即 wb.active），
+    否则按名称查找（与 wb[sheet] 一致，找不到时抛出 KeyError）
+    """
+    sheets, active, date1904 = read_workbook(archive)
+    if sheet is None:
+        return sheets[active][1], date1904
+    for name, path, _ in sheets:
+        if name == sheet:
+            return path, date1904
+    raise KeyError(f"Worksheet {sheet} does not exist.")
+
+
+def _max_row_from_dimension(archive, sheet_path):
+    """读取 <dimension ref="A1:Q186"> 中的最大行号；没有就返回 None"""
+    with archive.open(sheet_path) as src:
+        for _, node in iterparse(src, events=("start",)):
+            if node.tag == TAG_DIMENSION:
+                ref = node.get("ref", "").split(":")[-1]
+                digits = ref.lstrip("$ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+                return int(digits) if digits.isdigit() else None
+            if node.tag == TAG_SHEET_DATA:
+                return None
+    return None
+
+
+class _CellConverter:
+    """把 <c> 元素转换成与 openpyxl data_only 模式相同的 Python 值"""
+
+    def __init__(self, shared_strings, date_styles, timedelta_styles, date1904):
+        self.shared_strings = shared_strings
+        self.date_styles = date_styles
+        self.timedelta_styles = timedelta_styles
+        self.date1904 = date1904
+
+    def value(self, c, style_id):
+        data_type = c.get("t", "n")
+        if data_type == "inlineStr":
+            child = c.find(TAG_IS)
+            return _text_content(child) if child is not None else None
+
+        value = c.findtext(TAG_V, None) or None
+        if value is None:
+            return None
+        if data_type == "n":
+            if "." in value or "E" in value or "e" in value:
+                value = float(value)
+            else:
+                value = int(value)
+            if style_id in self.date_styles:
+                value = self._to_date(value, style_id)
+            return value
+        if data_type == "s":
+            return self.shared_strings[int(value)]
+        if data_type == "b":
+            return bool(int(value))
+        if data_type == "d":
+            from openpyxl.utils.datetime import from_ISO8601
+            return from_ISO8601(value)
+        return value  # 'str' / 'e'
+
+    def _to_date(self, value, style_id):
+        from openpyxl.utils.datetime import from_excel, MAC_EPOCH, WINDOWS_EPOCH
+        epoch = MAC_EPOCH if self.date1904 else WINDOWS_EPOCH
+        try:
+            return from_excel(value, epoch, timedelta=style_id in self.timedelta_styles)
+        except (OverflowError, ValueError):
+            return "#VALUE!"
+
+
+def iter_judge_rows_fast(xlsx_path, fill_rule=DEFAULT_FILL_RULE, sheet=None):
+    """
+    逐行产出 JudgeRow，行号范围与 openpyxl 只读模式 iter_rows(min_row=2) 完全一致：
+    缺失的行补空行，超过 dimension 声明的最大行号即停止
+    sheet: 工作表名称，None 表示当前工作表
+    """
+    with zipfile.ZipFile(xlsx_path) as archive:
+        with PROFILER.phase('read_shared_strings'):
+            shared_strings = read_shared_strings(archive)
+        with PROFILER.phase('classify_styles'):
+            colored, other_filled, date_styles, timedelta_styles = read_styles(archive, fill_rule)
+        sheet_path, date1904 = _sheet_path(archive, sheet)
+        max_row = _max_row_from_dimension(archive, sheet_path)
+        conv = _CellConverter(shared_strings, date_styles, timedelta_styles, date1904)
+        with archive.open(sheet_path) as src:
+            yield from iter_sheet_rows(src, conv, colored, other_filled, max_row)
+
+
+class RowOrderError(Exception):
+    """分片中出现了不属于该分片的行号（行没有按行号升序排列），无法按行号分片"""
+
+
+def iter_sheet_rows(src, conv, colored, other_filled, max_row, first=2, stop=None):
+    """
+    解析工作表 XML（src 为文件对象），产出行号 >= first 的 JudgeRow
+    stop 为 None 时处理到文件结束（整个工作表）；
+    否则只处理行号 < stop 的行，并补齐 stop 之前缺失的行（按行号分片时使用，见 salary_shards），
+    遇到行号 >= stop 的行抛出 RowOrderError
+    """
+    def empty_row(row_idx):
+        return JudgeRow(row_idx, None, None, None, False, False, None, None)
+
+    counter = first      # 下一个要产出的行号（第一片跳过表头）
+    idx = first - 1
+    row_counter = 0
+    sheet_data = None
+    for event, node in iterparse(src, events=("start", "end")):
+        if event == "start":
+            if node.tag == TAG_SHEET_DATA:
+                sheet_data = node
+            continue
+        if node.tag != TAG_ROW:
+            continue
+
+        r = node.get("r")
+        row_counter = int(float(r)) if r is not None else row_counter + 1
+        idx = row_counter
+        if max_row is not None and idx > max_row:
+            break
+        if stop is not None and idx >= stop:
+            raise RowOrderError(idx)
+
+        # 有些行在 XML 中缺失，补空行
+        while counter < idx:
+            yield empty_row(counter)
+            counter += 1
+
+        if counter <= idx:
+            values = {}
+            styles = {}
+            uncached = False
+            col_counter = 0
+            for c in node:
+                if c.tag != TAG_C:
+                    continue
+                ref = c.get("r")
+                if ref:
+                    col_counter = _column_index(ref.rstrip(_DIGITS).lstrip("$"))
+                else:
+                    col_counter += 1
+                if col_counter not in _WANTED_COLS:
+                    continue
+                style_id = int(c.get("s", 0))
+                value = values[col_counter] = conv.value(c, style_id)
+                styles[col_counter] = style_id
+                if value is None and col_counter in _AMOUNT_COLS and c.find(TAG_F) is not None:
+                    uncached = True     # 只有公式没有缓存值，由 judge_formulas 计算
+            yield JudgeRow(
+                row=idx,
+                problem_id=values.get(COL_PROBLEM_ID),
+                passed=values.get(COL_PASSED),
+                failed=values.get(COL_FAILED),
+                passed_colored=styles.get(COL_PASSED) in colored,
+                failed_colored=styles.get(COL_FAILED) in colored,
+                correct_per=values.get(COL_CORRECT_PER),
+                wrong_per=values.get(COL_WRONG_PER),
+                passed_other_fill=styles.get(COL_PASSED) in other_filled,
+                failed_other_fill=styles.get(COL_FAILED) in other_filled,
+                uncached_formula=uncached,
+            )
+            counter += 1
+
+        node.clear()
+        if sheet_data is not None:
+            sheet_data.clear()
+
+    if stop is not None:
+        last = stop - 1
+    elif max_row is not None and max_row < idx:
+        last = max_row
+    else:
+        return
+    while counter <= last:
+        yield empty_row(counter)
+        counter += 1
@@ -0,0 +1,530 @@
+# -*- coding: utf-8 -*-
+"""
+K/N 列公式的计算：工作簿由不保存公式计算结果的工具最后保存时，
+K（决定正确金额/每人）、N（决定错误金额/每人）格子只有公式没有缓存值，
+读出来是 None，会被当作 0。这里直接计算这些公式，不必再用 Excel 打开重新保存
+
+支持的公式：数字、同一行的单元格引用（可带 $）、+ - * / ^ %、一元正负号、括号，
+例如 judge.xlsx 中的 K=I/J、M=O-J、N=L/M（引用的格子本身也可以是没有缓存值的公式）
+共享公式（<f t="shared">）按主单元格的公式平移引用后计算
+计算方式：扫描一遍工作表 XML，收集没有缓存值的公式格子和同一行被引用的格子，
+只有解析时发现了这种格子才扫描（普通的空格子不会触发），
+相同公式的格子归为一组，用 NumPy 数组一次算完；与 Excel 一样，
+除以 0 得到 #DIV/0!，文本参与运算得到 #VALUE!，被引用格子的错误值原样传递
+
+无法计算的公式（函数、引用其它行、区域、其它工作表、循环引用等）：
+格子的值换成以 "=" 开头的公式文本——和其它非数字的 K/N 一样整行不计，
+judge_rules 的 non_numeric_amount 规则会报告它（解析缓存命中时同样如此），
+解析时还会在标准错误输出中列出这些公式
+"""
+
+import re
+import sys
+import zipfile
+from collections import defaultdict
+from typing import NamedTuple
+from xml.etree.ElementTree import iterparse
+
+import numpy as np
+
+from judge_loader import COL_CORRECT_PER, COL_WRONG_PER
+from judge_fastxml import (TAG_C, TAG_ROW, TAG_SHEET_DATA, TAG_V, TAG_F, TAG_IS, _DIGITS,
+                           _column_index, _sheet_path, _text_content, read_shared_strings)
+from profiling import PROFILER
+
+# 最多在标准错误输出中列出多少个无法计算的公式
+MAX_REPORTED = 20
+
+_REF = re.compile(r"(?<![A-Za-z0-9_.!:])(\$?)([A-Z]{1,3})(\$?)(\d+)(?![A-Za-z0-9_(!:])")
+_TOKEN = re.compile(r"\s*(?:(?P<num>\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)"
+                    r"|(?P<ref>\$?[A-Z]{1,3}\$?\d+)(?![A-Za-z0-9_(!:])"
+                    r"|(?P<op>[-+*/^()%]))")
+
+
+class FormulaIssue(NamedTuple):
+    """一个无法计算的公式"""
+    cell: str           # 如 'K5'
+    formula: str
+    reason: str
+
+
+class FormulaResult(NamedTuple):
+    values: dict        # 行号 -> {列号: 计算结果}，只含没有缓存值的 K/N 公式格子
+    evaluated: int      # 成功计算的格子数
+    issues: list        # FormulaIssue 列表
+
+
+class _Unsupported(Exception):
+    pass
+
+
+class _ExcelError(str):
+    """单元格中的错误值（t="e"），如 #N/A"""
+
+
+def _column_letters(idx):
+    letters = ""
+    while idx:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _shift(formula, dr, dc):
+    """把共享公式主单元格的公式平移到 (dr, dc) 之外的格子，$ 固定的行 / 列不动"""
+    def move(m):
+        col_abs, col, row_abs, row = m.groups()
+        if not col_abs:
+            col = _column_letters(_column_index(col) + dc)
+        if not row_abs:
+            row = str(int(row) + dr)
+        return f"{col_abs}{col}{row_abs}{row}"
+    return _REF.sub(move, formula)
+
+
+# ---- 解析：公式文本 -> 只引用同一行的表达式树 ----
+# 节点：('num', 值) / ('ref', 列号) / ('neg', x) / ('pct', x) / ('bin', 运算符, a, b)
+# 优先级与 Excel 一致：一元负号 > % > ^ > * / > + -
+
+def _tokenize(formula):
+    tokens = []
+    pos = 0
+    text = formula.strip()
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if m is None or m.end() == pos:
+            raise _Unsupported(f"不支持的写法: {text[pos:pos + 20]!r}")
+        pos = m.end()
+        if m.group("num"):
+            tokens.append(("num", float(m.group("num"))))
+        elif m.group("ref"):
+            tokens.append(("ref", m.group("ref")))
+        else:
+            tokens.append(("op", m.group("op")))
+    return tokens
+
+
+def parse_formula(formula, row):
+    """解析 row 行中一个格子的公式，引用了其它行时抛出 _Unsupported"""
+    tokens = _tokenize(formula.lstrip("="))
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else (None, None)
+
+    def take(op):
+        nonlocal pos
+        if peek() == ("op", op):
+            pos += 1
+            return True
+        return False
+
+    def binary(next_level, ops):
+        node = next_level()
+        while peek()[0] == "op" and peek()[1] in ops:
+            op = tokens[pos][1]
+            advance()
+            node = ("bin", op, node, next_level())
+        return node
+
+    def advance():
+        nonlocal pos
+        pos += 1
+
+    def expr():
+        return binary(term, "+-")
+
+    def term():
+        return binary(power, "*/")
+
+    def power():
+        return binary(unary, "^")
+
+    def unary():
+        if take("-"):
+            return ("neg", unary())
+        if take("+"):
+            return unary()
+        return postfix()
+
+    def postfix():
+        node = primary()
+        while take("%"):
+            node = ("pct", node)
+        return node
+
+    def primary():
+        kind, value = peek()
+        if kind == "num":
+            advance()
+            return ("num", value)
+        if kind == "ref":
+            advance()
+            m = _REF.fullmatch(value)
+            if int(m.group(4)) != row:
+                raise _Unsupported(f"引用了其它行的 {value}")
+            return ("ref", _column_index(m.group(2)))
+        if take("("):
+            node = expr()
+            if not take(")"):
+                raise _Unsupported("括号不配对")
+            return node
+        raise _Unsupported("公式不完整" if kind is None else f"不支持的运算符 {value!r}")
+
+    node = expr()
+    if pos != len(tokens):
+        raise _Unsupported(f"不支持的写法: {tokens[pos][1]!r}")
+    return node
+
+
+def _references(node, out=None):
+    """表达式树引用的列号"""
+    out = set() if out is None else out
+    if node[0] == "ref":
+        out.add(node[1])
+    elif node[0] in ("neg", "pct"):
+        _references(node[1], out)
+    elif node[0] == "bin":
+        _references(node[2], out)
+        _references(node[3], out)
+    return out
+
+
+# ---- 计算：同一个表达式树对一组行一次算完 ----
+
+ERROR_DIV0 = "#DIV/0!"
+ERROR_VALUE = "#VALUE!"
+ERROR_NUM = "#NUM!"
+_UNEVALUATED = "#UNEVALUATED"      # 内部使用：引用的格子无法计算
+
+
+class _Errors:
+    """错误值 <-> 整数编码（0 表示没有错误），数组中只存编码"""
+
+    def __init__(self):
+        self.names = [None, ERROR_DIV0, ERROR_VALUE, ERROR_NUM, _UNEVALUATED]
+        self.codes = {name: i for i, name in enumerate(self.names) if name}
+
+    def code(self, name):
+        if name not in self.codes:
+            self.codes[name] = len(self.names)
+            self.names.append(name)
+        return self.codes[name]
+
+
+def _evaluate(node, env, n, errors):
+    """返回 (数值数组, 错误编码数组)；env: 列号 -> (数值数组, 错误编码数组)"""
+    kind = node[0]
+    if kind == "num":
+        return np.full(n, node[1]), np.zeros(n, dtype=np.int64)
+    if kind == "ref":
+        return env[node[1]]
+    if kind == "neg":
+        v, e = _evaluate(node[1], env, n, errors)
+        return -v, e
+    if kind == "pct":
+        v, e = _evaluate(node[1], env, n, errors)
+        return v / 100, e
+
+    _, op, a, b = node
+    va, ea = _evaluate(a, env, n, errors)
+    vb, eb = _evaluate(b, env, n, errors)
+    err = np.where(ea != 0, ea, eb)            # 与 Excel 一样取左边第一个错误
+    ok = err == 0
+    with np.errstate(all="ignore"):
+        if op == "+":
+            v = va + vb
+        elif op == "-":
+            v = va - vb
+        elif op == "*":
+            v = va * vb
+        elif op == "/":
+            v = va / vb
+            err = np.where(ok & (vb == 0), errors.code(ERROR_DIV0), err)
+        else:
+            v = va ** vb
+            err = np.where(ok & (va == 0) & (vb < 0), errors.code(ERROR_DIV0), err)
+            err = np.where(ok & (va == 0) & (vb == 0), errors.code(ERROR_NUM), err)
+    err = np.where((err == 0) & ~np.isfinite(v), errors.code(ERROR_NUM), err)
+    return v, err
+
+
+def _leaf(value, errors):
+    """被引用格子的值 -> (数值, 错误编码)，与 Excel 算术运算的转换规则相同"""
+    if value is None:
+        return 0.0, 0
+    if isinstance(value, _ExcelError):
+        return np.nan, errors.code(str(value))
+    if isinstance(value, bool):
+        return float(value), 0
+    if isinstance(value, (int, float)):
+        return float(value), 0
+    try:
+        return float(str(value).strip()), 0
+    except ValueError:
+        return np.nan, errors.code(ERROR_VALUE)
+
+
+def _result_value(v):
+    """与读取缓存值时相同：整数结果是 int"""
+    return int(v) if v.is_integer() and abs(v) < 2 ** 53 else v
+
+
+# ---- 扫描工作表 ----
+
+def _cell_value(c, data_type, shared_strings):
+    if data_type == "inlineStr":
+        child = c.find(TAG_IS)
+        return _text_content(child) if child is not None else None
+    v = c.findtext(TAG_V, None) or None
+    if v is None:
+        return None
+    if data_type == "n":
+        return float(v)
+    if data_type == "s":
+        return shared_strings[int(v)]
+    if data_type == "b":
+        return v == "1"
+    if data_type == "e":
+        return _ExcelError(v)
+    return v
+
+
+def _scan(archive, sheet_path, columns):
+    """
+    找出 columns 中没有缓存值的公式格子，返回 {行号: {列号: (值, 公式)}}，
+    只保留含有这种格子的行（同一行的其它格子用于计算引用）
+    """
+    shared_strings = None
+    masters = {}            # 共享公式编号 -> (公式, 行号, 列号)
+    rows = {}
+    with archive.open(sheet_path) as src:
+        sheet_data = None
+        row_counter = 0
+        for event, node in iterparse(src, events=("start", "end")):
+            if event == "start":
+                if node.tag == TAG_SHEET_DATA:
+                    sheet_data = node
+                continue
+            if node.tag != TAG_ROW:
+                continue
+            r = node.get("r")
+            row_counter = int(float(r)) if r is not None else row_counter + 1
+            cells = {}
+            wanted = False
+            col_counter = 0
+            for c in node:
+                if c.tag != TAG_C:
+                    continue
+                ref = c.get("r")
+                col_counter = _column_index(ref.rstrip(_DIGITS).lstrip("$")) if ref else col_counter + 1
+                f = c.find(TAG_F)
+                formula = None
+                if f is not None:
+                    if f.get("t") == "shared":
+                        si = f.get("si")
+                        if f.text:
+                            masters[si] = (f.text, row_counter, col_counter)
+                            formula = f.text
+                        elif si in masters:
+                            text, master_row, master_col = masters[si]
+                            formula = _shift(text, row_counter - master_row, col_counter - master_col)
+                        else:
+                            formula = ""        # 找不到主单元格
+                    else:
+                        formula = f.text or ""
+                data_type = c.get("t", "n")
+                if data_type == "s" and shared_strings is None:
+                    shared_strings = read_shared_strings(archive)
+                value = _cell_value(c, data_type, shared_strings)
+                cells[col_counter] = (value, formula)
+                if formula is not None and value is None and col_counter in columns:
+                    wanted = True
+            if wanted:
+                rows[row_counter] = cells
+            node.clear()
+            if sheet_data is not None:
+                sheet_data.clear()
+    return rows
+
+
+def evaluate_uncached(xlsx_path, sheet=None, columns=(COL_CORRECT_PER, COL_WRONG_PER)):
+    """计算工作表中 columns 列里没有缓存值的公式，返回 FormulaResult"""
+    columns = frozenset(columns)
+    with zipfile.ZipFile(xlsx_path) as archive:
+        sheet_path, _ = _sheet_path(archive, sheet)
+        rows = _scan(archive, sheet_path, columns)
+
+    errors = _Errors()
+    issues = []
+    pending = {}            # (行号, 列号) -> 表达式树
+    resolved = {}           # (行号, 列号) -> (数值, 错误编码)
+    formulas = {}           # (行号, 列号) -> 公式文本（用于报告）
+
+    def cell_name(key):
+        return f"{_column_letters(key[1])}{key[0]}"
+
+    def fail(key, reason):
+        resolved[key] = (np.nan, errors.code(_UNEVALUATED))
+        issues.append(FormulaIssue(cell_name(key), formulas[key], reason))
+
+    def add(key):
+        """登记一个没有缓存值的公式格子，以及它引用的同样没有缓存值的公式格子"""
+        if key in pending or key in resolved:
+            return
+        formulas[key] = "=" + rows[key[0]][key[1]][1]
+        if not rows[key[0]][key[1]][1]:
+            fail(key, "找不到共享公式的主单元格")
+            return
+        try:
+            node = parse_formula(rows[key[0]][key[1]][1], key[0])
+        except _Unsupported as e:
+            fail(key, str(e))
+            return
+        pending[key] = node
+        for col in _references(node):
+            value, formula = rows[key[0]].get(col, (None, None))
+            if formula is not None and value is None:
+                add((key[0], col))
+
+    targets = [(row, col) for row, cells in rows.items() for col, (value, formula) in cells.items()
+               if col in columns and formula is not None and value is None]
+    for key in targets:
+        add(key)
+
+    # 按依赖顺序分批：引用的格子都已算出的先算，相同公式的一组用数组一次算完
+    while pending:
+        ready = defaultdict(list)
+        for key, node in pending.items():
+            if not any((key[0], col) in pending for col in _references(node)):
+                ready[node].append(key)
+        if not ready:
+            for key in list(pending):
+                del pending[key]
+                fail(key, "循环引用")
+            break
+        for node, keys in ready.items():
+            n = len(keys)
+            env = {}
+            for col in _references(node):
+                values = np.empty(n)
+                codes = np.zeros(n, dtype=np.int64)
+                for i, (row, _) in enumerate(keys):
+                    if (row, col) in resolved:
+                        values[i], codes[i] = resolved[(row, col)]
+                    else:
+                        values[i], codes[i] = _leaf(rows[row].get(col, (None, None))[0], errors)
+                env[col] = (values, codes)
+            values, codes = _evaluate(node, env, n, errors)
+            for key, v, e in zip(keys, values.tolist(), codes.tolist()):
+                del pending[key]
+                resolved[key] = (v, e)
+
+    values = defaultdict(dict)
+    unevaluated = errors.code(_UNEVALUATED)
+    evaluated = 0
+    reported = {issue.cell for issue in issues}
+    for key in targets:
+        v, e = resolved[key]
+        if e == unevaluated:
+            if cell_name(key) not in reported:
+                issues.append(FormulaIssue(cell_name(key), formulas[key], "引用的格子无法计算"))
+            values[key[0]][key[1]] = formulas[key]
+        else:
+            values[key[0]][key[1]] = errors.names[e] if e else _result_value(v)
+            evaluated += 1
+    issues.sort(key=lambda issue: (int(issue.cell.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ")), issue.cell))
+    return FormulaResult(dict(values), evaluated, issues)
+
+
+def print_issues(result, file=None):
+    """在标准错误输出中报告计算情况和无法计算的公式"""
+    file = sys.stderr if file is None else file
+    if result.evaluated:
+        print(f"提示：K/N 列有 {result.evaluated} 个公式没有缓存的计算结果，已自动计算", file=file)
+    if result.issues:
+        print(f"警告：{len(result.issues)} 个公式无法计算，按非数字处理（所在行不计入所得金）：", file=file)
+        for issue in result.issues[:MAX_REPORTED]:
+            print(f"  {issue.cell}: {issue.formula}（{issue.reason}）", file=file)
+        if len(result.issues) > MAX_REPORTED:
+            print(f"  ……另有 {len(result.issues) - MAX_REPORTED} 个", file=file)
+
+
+# 只找 K/N 列中带 r 属性的格子：<c r="K12" ...>……</c>
+_AMOUNT_CELL = re.compile(rb'<(?:[\w.-]+:)?c\s[^>]*?\br="\$?(?:K|N)\$?(\d+)"[^>]*?(?<!/)>')
+_CELL_END = re.compile(rb"</(?:[\w.-]+:)?c>")
+_F_OPEN = re.compile(rb"<(?:[\w.-]+:)?f[\s>/]")
+# 有内容的 <v>……</v> 才是缓存值；openpyxl 保存公式时写的是空的 <v></v> / <v/>
+_V_CACHED = re.compile(rb"<(?:[\w.-]+:)?v(?:\s[^>]*)?>[^<]")
+
+
+def uncached_formula_rows(xlsx_path, sheet=None):
+    """
+    不解析 XML，直接在解压出的字节中找 K/N 列「有 <f> 没有缓存值」的格子，返回它们的行号集合
+    （没有 <v>，或者 <v> 为空——与 fast 引擎读到 None 的情况相同）
+    供看不到公式的 openpyxl 引擎使用（fast 引擎在解析时直接记录）；没有 r 属性的格子找不到
+    """
+    found = set()
+
+    def scan(data):
+        for m in _AMOUNT_CELL.finditer(data):
+            end = _CELL_END.search(data, m.end())
+            body = data[m.end():end.start() if end else len(data)]
+            if _F_OPEN.search(body) and not _V_CACHED.search(body):
+                found.add(int(m.group(1)))
+
+    with zipfile.ZipFile(xlsx_path) as archive:
+        sheet_path, _ = _sheet_path(archive, sheet)
+        with archive.open(sheet_path) as src:
+            tail = b""
+            while True:
+                chunk = src.read(1 << 20)
+                data = tail + chunk
+                if not chunk:
+                    scan(data)
+                    break
+                cut = data.rfind(b"row>")      # 格子不会跨行：只处理到最后一个完整的行
+                if cut < 0:
+                    tail = data
+                    continue
+                scan(data[:cut + 4])
+                tail = data[cut + 4:]
+    return found
+
+
+def mark_uncached_formulas(rows, xlsx_path, sheet=None):
+    """
+    openpyxl 引擎的 JudgeRow 流：遇到第一行「K 或 N 为空」时用 uncached_formula_rows
+    快速检查一次，给有没有缓存值公式的行标上 uncached_formula（与 fast 引擎一样，不管这一行有没有老师）；
+    K/N 都有值时不做任何额外工作
+    """
+    marked = None
+    for r in rows:
+        if r.correct_per is None or r.wrong_per is None:
+            if marked is None:
+                with PROFILER.phase("find_uncached_formulas"):
+                    marked = uncached_formula_rows(xlsx_path, sheet)
+            if r.row in marked:
+                r = r._replace(uncached_formula=True)
+        yield r
+
+
+def fill_uncached_formulas(rows, xlsx_path, sheet=None, report=print_issues, result=None):
+    """
+    包装解析出的 JudgeRow 流：遇到第一行 uncached_formula（解析时发现 K/N 有没有缓存值的公式）时
+    扫描一次工作表，计算这些公式，之后把结果填回对应的行；
+    没有这种公式（正常情况，包括普通的空格子）时不做任何额外工作
+    report: 计算后用 FormulaResult 调用一次（默认打印到标准错误输出）
+    result: 已经算好的 FormulaResult（例如分片时由主进程算好），直接使用，不再扫描也不报告
+    """
+    for r in rows:
+        if r.uncached_formula:
+            if result is None:
+                with PROFILER.phase("evaluate_formulas"):
+                    result = evaluate_uncached(xlsx_path, sheet)
+                report(result)
+            found = result.values.get(r.row, {})
+            # 填回后清除标记，之后再经过这里（例如读取时已经计算过）不会重复计算
+            r = r._replace(correct_per=found.get(COL_CORRECT_PER, r.correct_per),
+                           wrong_per=found.get(COL_WRONG_PER, r.wrong_per), uncached_formula=False)
+        yield r
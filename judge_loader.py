@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+judge.xlsx 的共享读取模块：只读模式流式读取，一次正向遍历
+只取 A/C/D/K/N 五列，以及 C、D 两列的填充颜色判断
+K/N 中没有缓存计算结果的公式在解析时计算（见 judge_formulas）
+"""
+
+from typing import NamedTuple
+
+from profiling import PROFILER
+
+# 列号：A=题号(1), C=passed_users(3), D=failed_users(4),
+#       K=决定正确金额/每人(11), N=决定错误金额/每人(14)
+COL_PROBLEM_ID  = 1
+COL_PASSED      = 3
+COL_FAILED      = 4
+COL_CORRECT_PER = 11
+COL_WRONG_PER   = 14
+
+# iter_rows 只需读到 N 列为止，后面的列直接丢弃
+_MAX_COL = COL_WRONG_PER
+
+# 可选的读取引擎
+ENGINES = ('openpyxl', 'fast')
+
+# 解析器版本：JudgeRow 的内容或含义改变时 +1，旧的解析缓存会自动失效
+PARSER_VERSION = 4
+
+
+class JudgeRow(NamedTuple):
+    """judge.xlsx 中的一行（只保留用到的列）"""
+    row: int                # Excel 行号（从 2 开始）
+    problem_id: object      # A列
+    passed: object          # C列原始值
+    failed: object          # D列原始值
+    passed_colored: bool    # C列是否有浅蓝/浅绿填充
+    failed_colored: bool    # D列是否有浅蓝/浅绿填充
+    correct_per: object     # K列原始值
+    wrong_per: object       # N列原始值
+    passed_other_fill: bool = False     # C列有填充，但不是规则中的颜色
+    failed_other_fill: bool = False     # D列有填充，但不是规则中的颜色
+    uncached_formula: bool = False      # K/N 列有没有缓存计算结果的公式（见 judge_formulas）
+
+
+class FillRule(NamedTuple):
+    """
+    哪些填充颜色算「有颜色」（= 判断正确）
+    只认 patternType == 'solid' 的实心填充，前景色满足以下任一条件：
+    - themes: 主题色编号，例如 8 (浅蓝)、9 (浅绿)
+    - rgbs:   ARGB 颜色值，例如 'FFDDEBF7'（部分 Excel 版本保存为 RGB 而不是主题色）
+    """
+    themes: frozenset = frozenset()
+    rgbs: frozenset = frozenset()
+
+    def with_rgbs(self, rgbs):
+        """在当前规则基础上追加 RGB 颜色（6 位 RGB 自动补成 FF 开头的 ARGB）"""
+        extra = {normalize_rgb(x) for x in rgbs}
+        return self._replace(rgbs=self.rgbs | extra)
+
+
+def normalize_rgb(rgb):
+    """'ddebf7' / 'FFDDEBF7' -> 'FFDDEBF7'"""
+    rgb = rgb.strip().upper()
+    return 'FF' + rgb if len(rgb) == 6 else rgb
+
+
+# 默认规则：theme 8 = 浅蓝, theme 9 = 浅绿
+DEFAULT_FILL_RULE = FillRule(themes=frozenset([8, 9]))
+
+
+def fill_is_colored(pattern_type, theme, rgb, rule=DEFAULT_FILL_RULE):
+    """判断一种填充是否算「有颜色」；theme / rgb 为前景色，没有则传 None"""
+    if pattern_type != 'solid':
+        return False
+    if theme is not None and theme in rule.themes:
+        return True
+    return rgb is not None and normalize_rgb(rgb) in rule.rgbs
+
+
+def fill_is_blank(pattern_type):
+    """没有填充（patternType 缺省或为 none）"""
+    return pattern_type is None or pattern_type == 'none'
+
+
+# 填充的分类
+FILL_NONE = 0       # 没有填充
+FILL_COLORED = 1    # 规则中的颜色（= 判断正确）
+FILL_OTHER = 2      # 有填充，但不是规则中的颜色
+
+
+def _openpyxl_fill_kind(fill, rule):
+    """openpyxl 的 Fill 对象（可能为 None 或渐变填充）属于哪一类"""
+    if fill is not None and getattr(fill, 'tagname', None) == 'gradientFill':
+        return FILL_OTHER
+    pattern_type = getattr(fill, 'patternType', None)
+    fg = getattr(fill, 'fgColor', None)
+    theme = rgb = None
+    if fg is not None:
+        theme = fg.theme if fg.type == 'theme' else None
+        rgb = fg.rgb if fg.type == 'rgb' else None
+    if fill_is_colored(pattern_type, theme, rgb, rule):
+        return FILL_COLORED
+    return FILL_NONE if fill_is_blank(pattern_type) else FILL_OTHER
+
+
+def classify_fill_styles(wb, rule=DEFAULT_FILL_RULE):
+    """
+    预先把工作簿的样式表分类：返回 (有颜色的样式编号集合, 其它填充的样式编号集合)
+    一个工作簿只有几种填充，逐格判断就只剩一次整数查集合
+    """
+    kinds = [_openpyxl_fill_kind(fill, rule) for fill in wb._fills]
+    by_kind = {FILL_COLORED: set(), FILL_OTHER: set()}
+    for style_id, style in enumerate(wb._cell_styles):
+        if style.fillId < len(kinds) and kinds[style.fillId] in by_kind:
+            by_kind[kinds[style.fillId]].add(style_id)
+    return frozenset(by_kind[FILL_COLORED]), frozenset(by_kind[FILL_OTHER])
+
+
+def colored_style_ids(wb, rule=DEFAULT_FILL_RULE):
+    """所有「有颜色」的样式编号集合"""
+    return classify_fill_styles(wb, rule)[0]
+
+
+def parse_teachers(s):
+    """把 '彭海航-1 李长葳-51 ...' 拆成 ['彭海航-1','李长葳-51',...]"""
+    if not s or not str(s).strip():
+        return []
+    return [x.strip() for x in str(s).split() if x.strip()]
+
+
+def extract_teacher_name(teacher_id):
+    """从 '孙林-251' 提取出 '孙林'"""
+    if '-' in teacher_id:
+        return teacher_id.rsplit('-', 1)[0]  # 按最后一个 - 分割，取前面部分
+    return teacher_id
+
+
+def iter_judge_rows(xlsx_path, engine='openpyxl', fill_rule=DEFAULT_FILL_RULE, use_cache=False,
+                    sheet=None):
+    """
+    逐行产出 JudgeRow，从第 2 行（跳过表头）到最后一行，内存占用与行数无关
+    engine:
+    - 'openpyxl'：read_only 模式 + iter_rows
+    - 'fast'：直接解析 xlsx 中的 XML（见 judge_fastxml），只处理用到的五列
+    fill_rule: 哪些填充颜色算「有颜色」，见 FillRule
+    use_cache: 优先读取 .judge_cache/ 中的解析缓存（见 judge_cache）
+    sheet: 工作表名称，None 表示当前工作表（wb.active）
+    """
+    if use_cache:
+        from judge_cache import iter_cached_judge_rows
+        rows = iter_cached_judge_rows(xlsx_path, engine, fill_rule, sheet=sheet)
+    else:
+        rows = parse_judge_rows(xlsx_path, engine, fill_rule, sheet)
+    return PROFILER.timed_iter('read_rows', rows)
+
+
+def parse_judge_rows(xlsx_path, engine='openpyxl', fill_rule=DEFAULT_FILL_RULE, sheet=None):
+    """按 engine 直接解析工作簿（不经过缓存），K/N 中没有缓存值的公式就地计算"""
+    from judge_formulas import fill_uncached_formulas, mark_uncached_formulas
+    if engine == 'fast':
+        from judge_fastxml import iter_judge_rows_fast
+        rows = iter_judge_rows_fast(xlsx_path, fill_rule, sheet)
+    elif engine == 'openpyxl':
+        # openpyxl 的 data_only 模式看不到公式，另外快速检查哪些行有没有缓存值的公式
+        rows = mark_uncached_formulas(_iter_judge_rows_openpyxl(xlsx_path, fill_rule, sheet), xlsx_path, sheet)
+    else:
+        raise ValueError(f"未知的读取引擎: {engine}")
+    return fill_uncached_formulas(rows, xlsx_path, sheet)
+
+
+def sheet_names(xlsx_path):
+    """工作簿中普通工作表的名称（按顺序），只读 workbook.xml，不导入 openpyxl"""
+    import zipfile
+    from judge_fastxml import sheet_names as _sheet_names
+    with zipfile.ZipFile(xlsx_path) as archive:
+        return _sheet_names(archive)
+
+
+def _iter_judge_rows_openpyxl(xlsx_path, fill_rule, sheet=None):
+    """openpyxl 只读模式读取"""
+    import openpyxl
+
+    # data_only=True 读取公式的计算结果而不是公式本身
+    with PROFILER.phase('load_workbook'):
+        wb = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        with PROFILER.phase('classify_styles'):
+            colored, other_filled = classify_fill_styles(wb, fill_rule)
+        ws = wb.active if sheet is None else wb[sheet]
+        for row_idx, cells in enumerate(ws.iter_rows(min_row=2, max_col=_MAX_COL), start=2):
+            cell_c = cells[COL_PASSED - 1]
+            cell_d = cells[COL_FAILED - 1]
+            # 空格子 (EmptyCell) 没有 _style_id，视为无颜色
+            style_c = getattr(cell_c, '_style_id', None)
+            style_d = getattr(cell_d, '_style_id', None)
+            yield JudgeRow(
+                row=row_idx,
+                problem_id=cells[COL_PROBLEM_ID - 1].value,
+                passed=cell_c.value,
+                failed=cell_d.value,
+                passed_colored=style_c in colored,
+                failed_colored=style_d in colored,
+                correct_per=cells[COL_CORRECT_PER - 1].value,
+                wrong_per=cells[COL_WRONG_PER - 1].value,
+                passed_other_fill=style_c in other_filled,
+                failed_other_fill=style_d in other_filled,
+            )
+    finally:
+        wb.close()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+judge.xlsx 数据校验：一遍扫描 JudgeRow 流，同时检查一组声明好的逐行规则
+
+    python cal.py validate                          检查全部规则
+    python cal.py validate --rules teacher_count,id_pattern --fail-fast
+
+规则（RULES，键为规则名）：
+    teacher_count        每个题目的评审老师数（C + D）等于 expected_count（默认 5）
+    id_in_both_columns   同一个老师-ID 同时出现在 C 列和 D 列
+    duplicate_id_in_cell 同一个格子里同一个老师-ID 出现多次
+    non_numeric_amount   K/N 列不是数字（计算所得金时整行被跳过）
+    id_pattern           老师-ID 不符合「姓名-编号」格式
+    unknown_fill         C/D 列有填充，但不是规则中的颜色（可能是标错了颜色）
+
+每条违规记成一个 Violation，汇总在 ValidationReport 中；fail_fast=True 时遇到第一条即停止
+"""
+
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, NamedTuple
+
+from judge_loader import parse_teachers
+from salary_aggregate import parse_amount
+from profiling import PROFILER
+
+DEFAULT_EXPECTED_COUNT = 5
+DEFAULT_ID_PATTERN = r"^\S+-\d+$"
+
+
+class Violation(NamedTuple):
+    """一处违规"""
+    rule: str
+    row: int
+    problem_id: object
+    message: str
+    detail: dict        # 规则相关的附加数据，供其它输出格式使用
+
+
+class RowContext:
+    """一行数据加上各规则共用的解析结果（老师列表只拆分一次）"""
+    __slots__ = ('row', 'passed', 'failed')
+
+    def __init__(self, row):
+        self.row = row
+        self.passed = parse_teachers(row.passed)
+        self.failed = parse_teachers(row.failed)
+
+
+class Rule(NamedTuple):
+    name: str
+    description: str
+    check: Callable     # (RowContext, options) -> [(message, detail), ...]
+
+
+class RuleOptions(NamedTuple):
+    expected_count: int = DEFAULT_EXPECTED_COUNT
+    id_pattern: str = DEFAULT_ID_PATTERN
+
+
+def _check_teacher_count(ctx, options):
+    count = len(ctx.passed) + len(ctx.failed)
+    if count != options.expected_count:
+        return [(f"老师数量为 {count}，应为 {options.expected_count}",
+                 {'count': count, 'passed': ctx.passed, 'failed': ctx.failed})]
+    return ()
+
+
+def _check_id_in_both_columns(ctx, options):
+    both = set(ctx.passed) & set(ctx.failed)
+    return [(f"{t} 同时出现在 C 列和 D 列", {'teacher_id': t}) for t in sorted(both)]
+
+
+def _check_duplicate_id_in_cell(ctx, options):
+    out = []
+    for column, teachers in (('C', ctx.passed), ('D', ctx.failed)):
+        for t, n in Counter(teachers).items():
+            if n > 1:
+                out.append((f"{column} 列中 {t} 出现了 {n} 次",
+                            {'column': column, 'teacher_id': t, 'times': n}))
+    return out
+
+
+def _check_non_numeric_amount(ctx, options):
+    out = []
+    for column, value in (('K', ctx.row.correct_per), ('N', ctx.row.wrong_per)):
+        try:
+            parse_amount(value)
+        except (TypeError, ValueError):
+            out.append((f"{column} 列的值 {value!r} 不是数字，计算所得金时整行被跳过",
+                        {'column': column, 'value': value}))
+    return out
+
+
+@lru_cache(maxsize=None)
+def _compiled_pattern(pattern):
+    return re.compile(pattern)
+
+
+def _check_id_pattern(ctx, options):
+    pattern = _compiled_pattern(options.id_pattern)
+    out = []
+    for column, teachers in (('C', ctx.passed), ('D', ctx.failed)):
+        for t in teachers:
+            if not pattern.match(t):
+                out.append((f"{column} 列的老师-ID {t!r} 不符合「姓名-编号」格式",
+                            {'column': column, 'teacher_id': t}))
+    return out
+
+
+def _check_unknown_fill(ctx, options):
+    out = []
+    for column, other in (('C', ctx.row.passed_other_fill), ('D', ctx.row.failed_other_fill)):
+        if other:
+            out.append((f"{column} 列的填充不是已知的颜色，按「无颜色」计算", {'column': column}))
+    return out
+
+
+RULES = {
+    rule.name: rule for rule in (
+        Rule('teacher_count', "每个题目的评审老师数量", _check_teacher_count),
+        Rule('id_in_both_columns', "同一老师-ID 同时出现在 C、D 两列", _check_id_in_both_columns),
+        Rule('duplicate_id_in_cell', "同一格子中重复的老师-ID", _check_duplicate_id_in_cell),
+        Rule('non_numeric_amount', "K/N 列不是数字", _check_non_numeric_amount),
+        Rule('id_pattern', "老师-ID 格式", _check_id_pattern),
+        Rule('unknown_fill', "C/D 列的未知填充颜色", _check_unknown_fill),
+    )
+}
+
+
+def select_rules(names=None):
+    """按名称选出规则（保持 RULES 中的顺序）；None 表示全部，未知名称抛出 ValueError"""
+    if not names:
+        return list(RULES.values())
+    unknown = [n for n in names if n not in RULES]
+    if unknown:
+        raise ValueError(f"未知的规则: {', '.join(unknown)}（可用: {', '.join(RULES)}）")
+    return [rule for name, rule in RULES.items() if name in names]
+
+
+class ValidationReport:
+    """校验结果"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.rows = 0                       # 检查过的行数
+        self.violations = []
+        self.counts = {rule.name: 0 for rule in rules}
+        self.stopped_early = False          # fail_fast 时遇到违规即停止
+
+    @property
+    def ok(self):
+        return not self.violations
+
+
+@PROFILER.profiled("validate")
+def validate(judge_rows, rules=None, options=RuleOptions(), fail_fast=False):
+    """一遍扫描 JudgeRow 流，依次应用 rules，返回 ValidationReport"""
+    rules = select_rules() if rules is None else rules
+    report = ValidationReport(rules)
+    for row in judge_rows:
+        report.rows += 1
+        ctx = RowContext(row)
+        for rule in rules:
+            for message, detail in rule.check(ctx, options):
+                report.violations.append(Violation(rule.name, row.row, row.problem_id, message, detail))
+                report.counts[rule.name] += 1
+                if fail_fast:
+                    report.stopped_early = True
+                    return report
+    return report
+
+
+def print_report(report, limit=20):
+    """以文本形式输出校验结果，每条规则最多显示 limit 处违规"""
+    print("="*80)
+    print(f"数据校验（{len(report.rules)} 条规则）")
+    print("="*80)
+    print(f"\n共检查 {report.rows} 行" + ("（遇到违规后停止）" if report.stopped_early else ""))
+    for rule in report.rules:
+        n = report.counts[rule.name]
+        mark = "✓" if n == 0 else "✗"
+        print(f"  {mark} {rule.name:<22} {rule.description}: {n} 处")
+
+    if report.ok:
+        print("\n✓ 没有发现问题")
+        return
+
+    shown = Counter()
+    print("\n违规详情:")
+    for v in report.violations:
+        if shown[v.rule] >= limit:
+            continue
+        shown[v.rule] += 1
+        print(f"  [{v.rule}] 第{v.row}行 题目 {v.problem_id}: {v.message}")
+    hidden = len(report.violations) - sum(shown.values())
+    if hidden:
+        print(f"  ……另有 {hidden} 处未显示（每条规则最多显示 {limit} 处）")
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+生成模拟的 judge 工作簿，用于性能测试
+列布局与真实的 judge.xlsx 相同（A~O 列），其中：
+- C/D 列为空格分隔的「姓名-编号」老师列表，每题 5 位老师
+- 判断正确的一侧按比例填充 theme 8（浅蓝）/ theme 9（浅绿）实心颜色
+- K/N 列为每人金额（= 总金额 / 人数）
+- 老师姓名按 Zipf 分布抽取，可控制少数老师评审大量题目的倾斜程度
+
+用法：
+    python make_judge_workbook.py --rows 100000 --output bench_data/judge_100k.xlsx
+"""
+
+import argparse
+import random
+from pathlib import Path
+
+HEADER = ['problem_id', 'import_id', 'passed_users', 'failed_users', 'incomplete_rating_ids',
+          None, '题目情况', '题目判断结果', '决定正确金额', '决定正确人数', '决定正确金额/每人',
+          '决定错误金额', '决定错误人数', '决定错误金额/每人', '总人数']
+
+TEACHERS_PER_PROBLEM = 5
+
+# 真实数据中常见的 (决定正确金额, 决定错误金额) 组合
+AMOUNTS = [(45, 5), (22.5, 5), (15, 5), (45, 0), (12.5, 0)]
+
+_SURNAMES = "赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨朱秦尤许何吕施张孔曹严华金魏陶姜"
+_GIVEN = "林航葳啸朋轩翔涵乐靖宇海长有祝明华强伟芳敏静丽军杰涛超勇艳娟霞"
+
+
+def teacher_names(count, seed=0):
+    """生成 count 个不重复的中文姓名"""
+    rnd = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        names.add(rnd.choice(_SURNAMES) + "".join(rnd.choice(_GIVEN) for _ in range(rnd.randint(1, 2))))
+    return sorted(names)
+
+
+def generate_rows(rows, seed=0, colored_share=0.9, teachers=200, skew=1.1, repeat=0.0):
+    """
+    逐行产出模拟数据（列表，与 HEADER 对齐），外加 C/D 两列是否填充颜色：
+        (values, passed_theme, failed_theme)   theme 为 None 表示无填充
+    colored_share: 判断正确的一侧被填充颜色的比例
+    teachers:      不同老师姓名的数量
+    skew:          Zipf 指数，越大越集中在少数老师身上
+    repeat:        同一个老师-ID 被重复使用（评审多个题目）的概率
+    """
+    rnd = random.Random(seed)
+    names = teacher_names(teachers, seed)
+    weights = [1.0 / (rank ** skew) for rank in range(1, len(names) + 1)]
+    next_serial = {}
+    used_ids = {}
+
+    def pick_teacher(taken):
+        while True:
+            name = rnd.choices(names, weights)[0]
+            if used_ids.get(name) and rnd.random() < repeat:
+                tid = rnd.choice(used_ids[name])
+            else:
+                serial = next_serial.get(name, 0) + 1
+                next_serial[name] = serial
+                tid = f"{name}-{serial}"
+                used_ids.setdefault(name, []).append(tid)
+            if tid not in taken:
+                return tid
+
+    for i in range(1, rows + 1):
+        taken = set()
+        reviewers = []
+        for _ in range(TEACHERS_PER_PROBLEM):
+            tid = pick_teacher(taken)
+            taken.add(tid)
+            reviewers.append(tid)
+
+        n_passed = rnd.randint(0, TEACHERS_PER_PROBLEM)
+        passed, failed = reviewers[:n_passed], reviewers[n_passed:]
+        # 题目判断结果：T = 通过的一侧正确，F = 不通过的一侧正确
+        if not passed:
+            result = 'F'
+        elif not failed:
+            result = 'T'
+        else:
+            result = rnd.choice('TF')
+        right, wrong = (passed, failed) if result == 'T' else (failed, passed)
+
+        correct_total, wrong_total = rnd.choice(AMOUNTS)
+        correct_per = correct_total / len(right) if right else None
+        wrong_per = wrong_total / len(wrong) if wrong else None
+
+        theme = rnd.choice((8, 9)) if rnd.random() < colored_share else None
+        passed_theme = theme if result == 'T' else None
+        failed_theme = theme if result == 'F' else None
+
+        values = [i, 100000 + i, " ".join(passed), " ".join(failed), None,
+                  None, None, result, correct_total, len(right), correct_per,
+                  wrong_total, len(wrong), wrong_per, TEACHERS_PER_PROBLEM]
+        yield values, passed_theme, failed_theme
+
+
+def write_workbook(path, rows, **options):
+    """用 openpyxl write_only 模式流式写出工作簿"""
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import PatternFill
+    from openpyxl.styles.colors import Color
+
+    fills = {theme: PatternFill('solid', fgColor=Color(theme=theme, tint=0.7999816888943144))
+             for theme in (8, 9)}
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append(HEADER)
+    for values, passed_theme, failed_theme in generate_rows(rows, **options):
+        cells = list(values)
+        for col, theme in ((2, passed_theme), (3, failed_theme)):
+            if theme is not None:
+                cell = WriteOnlyCell(ws, value=values[col])
+                cell.fill = fills[theme]
+                cells[col] = cell
+        ws.append(cells)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    wb.save(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成模拟的 judge 工作簿")
+    parser.add_argument("--rows", type=int, default=10000, help="题目行数（默认 10000）")
+    parser.add_argument("--output", type=Path, required=True, help="输出 xlsx 路径")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子（默认 0）")
+    parser.add_argument("--colored-share", type=float, default=0.9,
+                        help="判断正确的一侧被填充颜色的比例（默认 0.9）")
+    parser.add_argument("--teachers", type=int, default=200, help="不同老师姓名数（默认 200）")
+    parser.add_argument("--skew", type=float, default=1.1, help="老师分布的 Zipf 指数（默认 1.1）")
+    parser.add_argument("--repeat", type=float, default=0.0,
+                        help="老师-ID 被重复使用的概率（默认 0，即每个 ID 只评审一题）")
+    args = parser.parse_args()
+
+    path = write_workbook(args.output, args.rows, seed=args.seed, colored_share=args.colored_share,
+                          teachers=args.teachers, skew=args.skew, repeat=args.repeat)
+    print(f"已生成 {args.rows} 行: {path}")
+
+
+if __name__ == "__main__":
+    main()
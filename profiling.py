@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+分阶段计时 / 内存统计
+
+    from profiling import PROFILER
+
+    @PROFILER.profiled("verify")
+    def verify(...): ...
+
+    with PROFILER.phase("aggregate") as ph:
+        ...
+        ph.rows = n
+    rows = PROFILER.timed_iter("read_rows", iter_judge_rows(...))
+
+每个命名阶段记录墙钟时间、CPU 时间、处理行数和 tracemalloc 峰值内存；
+timed_iter 只统计生成器内部（即解析工作簿）所花的时间，与消费方的处理时间分开
+未启用时 phase() 返回同一个空对象、timed_iter() 原样返回迭代器，几乎没有开销
+
+启用方式：各脚本的 --profile trace.json（可加 --profile-sample 开启采样分析），
+结束时写出 JSON 格式的跟踪结果
+"""
+
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+
+class _NullPhase:
+    """未启用时使用的空阶段"""
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Record:
+    """同一父阶段下同名阶段的累计结果"""
+    __slots__ = ('name', 'path', 'calls', 'wall', 'cpu', 'rows', 'peak_mem')
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rows = None
+        self.peak_mem = None
+
+    def add_rows(self, n):
+        if n is not None:
+            self.rows = (self.rows or 0) + n
+
+    def add_peak(self, peak):
+        if peak is not None and (self.peak_mem is None or peak > self.peak_mem):
+            self.peak_mem = peak
+
+
+class _Phase:
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+        self.rows = None
+
+    def __enter__(self):
+        p = self._profiler
+        parent = p._stack[-1] if p._stack else None
+        path = f"{parent.path}/{self._name}" if parent else self._name
+        self._record = p._record(self._name, path)
+        # 进入子阶段前，先把目前为止的峰值记到父阶段上，再重置峰值
+        if parent is not None:
+            parent.add_peak(tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        p._stack.append(self._record)
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        p = self._profiler
+        rec = p._stack.pop()
+        rec.calls += 1
+        rec.wall += wall
+        rec.cpu += cpu
+        rec.add_rows(self.rows)
+        rec.add_peak(tracemalloc.get_traced_memory()[1])
+        if p._stack:
+            p._stack[-1].add_peak(rec.peak_mem)
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self._records = {}
+        self._stack = []
+        self._sampler = None
+        self._started = None
+
+    def enable(self, sample=False, sample_interval=0.005):
+        """开启统计；sample=True 时同时开启基于信号的采样分析（仅 POSIX）"""
+        if self.enabled:
+            return
+        self.enabled = True
+        self._started = (time.perf_counter(), time.process_time())
+        tracemalloc.start()
+        if sample:
+            self._sampler = _Sampler(sample_interval)
+            self._sampler.start()
+
+    def phase(self, name):
+        """命名阶段的上下文管理器；可设置 .rows 记录处理行数"""
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def profiled(self, name):
+        """装饰器：把整个函数调用记为一个阶段"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Phase(self, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def timed_iter(self, name, iterable):
+        """包装迭代器，只统计产出每一项时在迭代器内部花费的时间"""
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(name, iterable)
+
+    def _timed_iter(self, name, iterable):
+        parent = self._stack[-1] if self._stack else None
+        path = f"{parent.path}/{name}" if parent else name
+        rec = self._record(name, path)
+        rec.calls += 1
+        it = iter(iterable)
+        count = 0
+        perf, cpu = time.perf_counter, time.process_time
+        try:
+            while True:
+                w0, c0 = perf(), cpu()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+                finally:
+                    rec.wall += perf() - w0
+                    rec.cpu += cpu() - c0
+                count += 1
+                yield item
+        finally:
+            rec.add_rows(count)
+
+    def _record(self, name, path):
+        rec = self._records.get(path)
+        if rec is None:
+            rec = self._records[path] = _Record(name, path)
+        return rec
+
+    def report(self, **meta):
+        """返回可序列化为 JSON 的统计结果"""
+        records = list(self._records.values())
+        child_wall = Counter()
+        for rec in records:
+            parent = rec.path.rpartition("/")[0]
+            if parent:
+                child_wall[parent] += rec.wall
+
+        phases = []
+        for rec in records:
+            phases.append({
+                "name": rec.name,
+                "path": rec.path,
+                "calls": rec.calls,
+                "wall_s": round(rec.wall, 6),
+                "self_wall_s": round(rec.wall - child_wall[rec.path], 6),
+                "cpu_s": round(rec.cpu, 6),
+                "rows": rec.rows,
+                "rows_per_s": round(rec.rows / rec.wall, 1) if rec.rows and rec.wall > 0 else None,
+                "peak_mem_bytes": rec.peak_mem,
+            })
+
+        report = {
+            "argv": sys.argv,
+            "pid": os.getpid(),
+            "phases": phases,
+        }
+        if self._started is not None:
+            report["total_wall_s"] = round(time.perf_counter() - self._started[0], 6)
+            report["total_cpu_s"] = round(time.process_time() - self._started[1], 6)
+            report["tracemalloc_peak_bytes"] = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+        if self._sampler is not None:
+            report["samples"] = self._sampler.folded()
+        report.update(meta)
+        return report
+
+    def write(self, path, **meta):
+        """停止采样并把统计结果写入 JSON 文件"""
+        if self._sampler is not None:
+            self._sampler.stop()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(**meta), f, ensure_ascii=False, indent=2)
+
+
+class _Sampler:
+    """
+    简单的采样分析器：用 ITIMER_PROF 定时中断，记录当前调用栈
+    结果为 "外层;...;内层" -> 次数 的折叠栈格式，可直接交给 flamegraph 工具
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+
+    def start(self):
+        import signal
+        if not hasattr(signal, "setitimer"):
+            print("警告：当前平台不支持采样分析（需要 signal.setitimer）", file=sys.stderr)
+            return
+        signal.signal(signal.SIGPROF, self._handle)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        import signal
+        if hasattr(signal, "setitimer"):
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+
+    def _handle(self, signum, frame):
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        self.stacks[";".join(reversed(parts))] += 1
+
+    def folded(self):
+        return dict(self.stacks.most_common())
+
+
+PROFILER = Profiler()
+
+
+def add_profile_arguments(parser):
+    """给 argparse 解析器加上 --profile / --profile-sample 选项"""
+    parser.add_argument("--profile", metavar="TRACE_JSON",
+                        help="记录各阶段耗时与内存，写入指定的 JSON 文件")
+    parser.add_argument("--profile-sample", action="store_true",
+                        help="配合 --profile，同时开启采样分析（仅 POSIX）")
+
+
+def start_from_args(args):
+    """根据命令行参数启用统计"""
+    if args.profile:
+        PROFILER.enable(sample=args.profile_sample)
+
+
+def finish_from_args(args, **meta):
+    """根据命令行参数写出统计结果"""
+    if args.profile:
+        PROFILER.write(args.profile, **meta)
+        print(f"性能跟踪已写入: {args.profile}")
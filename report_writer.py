@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+结构化报告输出：代替逐行 print，把检查结果按 text / json / csv 格式
+通过大缓冲区流式写入文件（或标准输出）
+
+    python cal.py compare-ids --report json --report-file ids.json
+    python cal.py verify --report csv --report-file verify.csv --top 100
+    python cal.py compare-ids --report text --summary-only
+
+报告由若干「段」（如 missing / extra / repeated）和最后的汇总组成：
+- 每段的记录是字段固定的字典，由调用方以生成器的形式给出，不整体放入内存
+- --top N：每段最多写 N 条；给了排序键的段用堆取最大的 N 条
+- --summary-only：只写每段的条数和汇总
+各格式：
+- text：每段一个标题，每条记录一行 字段=值
+- json：{"sections": {段名: {"total": 条数, "records": [...]}}, "summary": {...}}
+- csv：一张表，第一列为段名，其余列为字段；汇总以 "# 键=值" 注释行写在最后
+"""
+
+import csv
+import heapq
+import itertools
+import json
+import sys
+
+FORMATS = ('text', 'json', 'csv')
+
+# 写文件时的缓冲区大小
+BUFFER_SIZE = 1 << 20
+
+
+class ReportWriter:
+    """报告写入器的公共部分：段的截取（top / summary_only）与计数"""
+
+    def __init__(self, stream, fields, top=None, summary_only=False):
+        self.stream = stream
+        self.fields = list(fields)
+        self.top = top
+        self.summary_only = summary_only
+        self.totals = {}
+
+    def section(self, name, records, total=None, key=None, render=None):
+        """
+        写入一段记录；records 全部遍历一次（用于计数），只写出选中的部分
+        - key 不为 None 时，--top 取按 key 最大的 N 条，否则取最前面的 N 条
+        - render 不为 None 时，只对选中（要写出）的记录调用 render 生成字典，
+          耗时的格式化（如追踪明细）不会花在不写出的记录上
+        - total 为该段的总条数，不传则按遍历到的条数计
+        返回实际写出的条数
+        """
+        counted = _CountingIterator(records)
+        if self.summary_only:
+            selected = ()
+        elif self.top is not None and key is not None:
+            selected = heapq.nlargest(self.top, counted, key=key)
+        elif self.top is not None:
+            selected = itertools.islice(counted, self.top)
+        else:
+            selected = counted
+
+        written = 0
+        self._begin_section(name)
+        try:
+            for record in selected:
+                self._write_record(name, record if render is None else render(record))
+                written += 1
+            for _ in counted:   # 剩下没有写出的只计数
+                pass
+        finally:
+            self.totals[name] = counted.count if total is None else total
+            self._end_section(name, self.totals[name], written)
+        return written
+
+    def summary(self, values):
+        """写入汇总并结束报告"""
+        self._write_summary(values)
+        self.stream.flush()
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    # 子类实现
+    def _begin_section(self, name):
+        pass
+
+    def _write_record(self, name, record):
+        raise NotImplementedError
+
+    def _end_section(self, name, total, written):
+        pass
+
+    def _write_summary(self, values):
+        raise NotImplementedError
+
+
+class TextReportWriter(ReportWriter):
+    def _begin_section(self, name):
+        self._header_pending = name
+
+    def _write_record(self, name, record):
+        if self._header_pending is not None:
+            self.stream.write(f"[{name}]\n")
+            self._header_pending = None
+        self.stream.write("  " + "  ".join(f"{f}={record.get(f, '')}" for f in self.fields if f in record) + "\n")
+
+    def _end_section(self, name, total, written):
+        if self._header_pending is not None:
+            # 没有写出记录（空段或 --summary-only）
+            self._header_pending = None
+            if total:
+                self.stream.write(f"[{name}] {total} 条\n")
+            return
+        more = f"，只显示 {written} 条" if written < total else ""
+        self.stream.write(f"[{name}] 共 {total} 条{more}\n\n")
+
+    def _write_summary(self, values):
+        self.stream.write("== 汇总 ==\n")
+        for k, v in values.items():
+            self.stream.write(f"  {k}: {v}\n")
+
+
+class JsonReportWriter(ReportWriter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stream.write('{"sections": {')
+        self._sections = 0
+
+    def _begin_section(self, name):
+        if self._sections:
+            self.stream.write(", ")
+        self._sections += 1
+        self.stream.write(json.dumps(name, ensure_ascii=False) + ': {"records": [')
+        self._first = True
+
+    def _write_record(self, name, record):
+        if not self._first:
+            self.stream.write(", ")
+        self._first = False
+        self.stream.write(json.dumps({f: record.get(f) for f in self.fields if f in record},
+                                     ensure_ascii=False, default=str))
+
+    def _end_section(self, name, total, written):
+        self.stream.write(f'], "total": {total}}}')
+
+    def _write_summary(self, values):
+        self.stream.write('}, "summary": ')
+        self.stream.write(json.dumps(values, ensure_ascii=False, default=str))
+        self.stream.write("}\n")
+
+
+class CsvReportWriter(ReportWriter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._writer = csv.writer(self.stream)
+        self._writer.writerow(["section"] + self.fields)
+
+    def _write_record(self, name, record):
+        self._writer.writerow([name] + [record.get(f, "") for f in self.fields])
+
+    def _write_summary(self, values):
+        for k, v in values.items():
+            self.stream.write(f"# {k}={v}\n")
+
+
+class _CountingIterator:
+    """边遍历边计数"""
+
+    def __init__(self, iterable):
+        self._it = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._it)
+        self.count += 1
+        return item
+
+
+_WRITERS = {'text': TextReportWriter, 'json': JsonReportWriter, 'csv': CsvReportWriter}
+
+
+def _silent(*args, **kwargs):
+    pass
+
+
+def progress_printer(report):
+    """写结构化报告时不输出逐行的进度和明细：有报告时返回一个什么都不做的 print"""
+    return print if report is None else _silent
+
+
+def open_report(fmt, path=None, fields=(), top=None, summary_only=False):
+    """
+    打开一个报告写入器；path 为 None 或 '-' 时写到标准输出
+    文件用 BUFFER_SIZE 大小的缓冲区，CSV 与项目中其它 CSV 一样带 BOM
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"未知的报告格式: {fmt}")
+    if path is None or str(path) == '-':
+        sys.stdout.flush()
+        stream = sys.stdout
+    else:
+        encoding = 'utf-8-sig' if fmt == 'csv' else 'utf-8'
+        stream = open(path, 'w', encoding=encoding, newline='', buffering=BUFFER_SIZE)
+    return _WRITERS[fmt](stream, fields, top=top, summary_only=summary_only)
+
+
+def add_report_arguments(parser):
+    """给 argparse 解析器加上 --report / --report-file / --top / --summary-only 选项"""
+    parser.add_argument("--report", choices=FORMATS,
+                        help="以结构化报告代替逐行输出：text / json / csv")
+    parser.add_argument("--report-file", metavar="PATH",
+                        help="报告写入的文件（默认：标准输出）")
+    parser.add_argument("--top", type=int, metavar="N",
+                        help="配合 --report，每段最多写 N 条（按严重程度取前 N 条）")
+    parser.add_argument("--summary-only", action="store_true",
+                        help="配合 --report，只写每段的条数和汇总")
+
+
+def check_report_arguments(parser, args):
+    """--report-file / --top / --summary-only 只在指定了 --report 时有效，否则 parser.error 退出"""
+    if getattr(args, "report", None):
+        return
+    given = [option for option, value in (("--report-file", getattr(args, "report_file", None)),
+                                          ("--top", getattr(args, "top", None)),
+                                          ("--summary-only", getattr(args, "summary_only", False)))
+             if value is not None and value is not False]
+    if given:
+        parser.error(f"{' / '.join(given)} 需要配合 --report 使用")
+
+
+def open_report_from_args(args, fields):
+    """根据命令行参数打开报告写入器；没有指定 --report 时返回 None"""
+    if not getattr(args, "report", None):
+        return None
+    return open_report(args.report, args.report_file, fields, top=args.top,
+                       summary_only=args.summary_only)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+按老师-ID / 老师姓名汇总所得金（NumPy 批量计算）
+
+每个老师-ID 只在第一次出现时分配一个整数编码，同时算好它所属的姓名编码；
+所有「老师出现一次」记录成三个扁平数组（ID 编码、是否判断正确、金额），
+最后用 np.bincount 一次性求出每个 ID / 每个姓名的金额与题数
+"""
+
+from array import array
+from typing import NamedTuple
+
+import numpy as np
+
+from judge_loader import parse_teachers, extract_teacher_name
+
+
+class Appearances(NamedTuple):
+    """所有「老师出现一次」的扁平记录"""
+    ids: list               # 编码 -> 老师-ID
+    names: list             # 姓名编码 -> 老师姓名
+    id_name: np.ndarray     # 老师-ID 编码 -> 姓名编码
+    codes: np.ndarray       # 每次出现的老师-ID 编码
+    correct: np.ndarray     # 每次出现是否判断正确（格子有颜色）
+    amount: np.ndarray      # 每次出现的金额（正确取 K 列，错误取 N 列）
+    rows: int               # 处理的行数（含跳过的行）
+    skipped: int            # 因 K/N 不是数字而跳过的行数
+    # 以下只有 with_rows=True 时才生成（见 salary_analytics），否则为 None
+    row_index: np.ndarray = None    # 每次出现所在的行（计入的行按顺序编号，从 0 开始）
+    row_numbers: np.ndarray = None  # 计入的行（没有跳过的行）-> 工作表中的行号
+    problem_ids: list = None        # 计入的行 -> 题目 ID
+
+
+class SalaryTotals(NamedTuple):
+    """汇总结果，数组下标与 ids / names 对应"""
+    ids: list
+    id_correct: np.ndarray          # 老师-ID -> 正确总金
+    id_wrong: np.ndarray            # 老师-ID -> 错误总金
+    id_correct_count: np.ndarray
+    id_wrong_count: np.ndarray
+    names: list
+    name_correct: np.ndarray        # 老师姓名 -> 正确总金
+    name_wrong: np.ndarray          # 老师姓名 -> 错误总金
+    name_correct_count: np.ndarray  # 老师姓名 -> 正确题数
+    name_wrong_count: np.ndarray    # 老师姓名 -> 错误题数
+
+
+def parse_amount(value):
+    """K/N 列的金额：空格子算 0，不是数字则抛出 TypeError / ValueError"""
+    return float(value) if value is not None else 0.0
+
+
+def collect_appearances(judge_rows, with_rows=False):
+    """
+    遍历 JudgeRow 流，把 C/D 列中每位老师的出现展开成扁平数组
+    K/N 列不是数字的行整行跳过（与原来的逐行累加一致）
+    with_rows=True 时另外记录每次出现所在的行、行号和题目 ID（评审分析用，汇总不需要）
+    """
+    index = {}           # 老师-ID -> 编码
+    ids = []
+    name_index = {}      # 老师姓名 -> 姓名编码
+    names = []
+    id_name = array('q')
+    codes = array('q')
+    correct = array('b')
+    amount = array('d')
+    row_sizes = array('q')      # 计入的行 -> 该行的出现次数
+    row_numbers = array('q')
+    problem_ids = []
+    rows = skipped = 0
+
+    for r in judge_rows:
+        rows += 1
+        try:
+            correct_per = parse_amount(r.correct_per)
+            wrong_per = parse_amount(r.wrong_per)
+        except (TypeError, ValueError):
+            skipped += 1
+            continue
+        if with_rows:
+            row_numbers.append(r.row)
+            problem_ids.append(r.problem_id)
+            size = len(codes)
+
+        for value, colored in ((r.passed, r.passed_colored), (r.failed, r.failed_colored)):
+            teachers = parse_teachers(value)
+            if not teachers:
+                continue
+            for t in teachers:
+                code = index.get(t)
+                if code is None:
+                    code = index[t] = len(ids)
+                    ids.append(t)
+                    name = extract_teacher_name(t)
+                    name_code = name_index.get(name)
+                    if name_code is None:
+                        name_code = name_index[name] = len(names)
+                        names.append(name)
+                    id_name.append(name_code)
+                codes.append(code)
+            n = len(teachers)
+            # 有颜色 → 判断正确，取 K 列；没颜色 → 判断错误，取 N 列
+            correct.extend([colored] * n)
+            amount.extend([correct_per if colored else wrong_per] * n)
+
+        if with_rows:
+            row_sizes.append(len(codes) - size)
+
+    app = Appearances(
+        ids=ids,
+        names=names,
+        id_name=np.frombuffer(id_name, dtype=np.int64) if id_name else np.zeros(0, dtype=np.int64),
+        codes=np.frombuffer(codes, dtype=np.int64) if codes else np.zeros(0, dtype=np.int64),
+        correct=np.frombuffer(correct, dtype=np.int8).astype(bool) if correct else np.zeros(0, dtype=bool),
+        amount=np.frombuffer(amount, dtype=np.float64) if amount else np.zeros(0),
+        rows=rows,
+        skipped=skipped,
+    )
+    if not with_rows:
+        return app
+    sizes = np.frombuffer(row_sizes, dtype=np.int64) if row_sizes else np.zeros(0, dtype=np.int64)
+    return app._replace(
+        row_index=np.repeat(np.arange(len(sizes), dtype=np.int64), sizes),
+        row_numbers=np.frombuffer(row_numbers, dtype=np.int64) if row_numbers else np.zeros(0, dtype=np.int64),
+        problem_ids=problem_ids,
+    )
+
+
+def aggregate(app):
+    """
+    批量汇总：np.bincount 按出现顺序依次累加，
+    浮点结果与逐条 += 完全相同，写出的 CSV 逐字节一致
+    """
+    n_ids = len(app.ids)
+    n_names = len(app.names)
+    right = app.correct
+    wrong = ~right
+    name_codes = app.id_name[app.codes] if n_ids else app.codes
+
+    def sums(keys, mask, minlength):
+        return np.bincount(keys[mask], weights=app.amount[mask], minlength=minlength)
+
+    def counts(keys, mask, minlength):
+        return np.bincount(keys[mask], minlength=minlength)
+
+    return SalaryTotals(
+        ids=app.ids,
+        id_correct=sums(app.codes, right, n_ids),
+        id_wrong=sums(app.codes, wrong, n_ids),
+        id_correct_count=counts(app.codes, right, n_ids),
+        id_wrong_count=counts(app.codes, wrong, n_ids),
+        names=app.names,
+        name_correct=sums(name_codes, right, n_names),
+        name_wrong=sums(name_codes, wrong, n_names),
+        name_correct_count=counts(name_codes, right, n_names),
+        name_wrong_count=counts(name_codes, wrong, n_names),
+    )
+
+
+def merge_totals(partials):
+    """
+    把多个 SalaryTotals（例如每个工作表一份）合并成一份
+    按 partials 的顺序依次累加，同样的输入顺序得到逐位相同的结果；
+    只有一份时结果与它完全相同
+    """
+    def merge(keys_of, columns):
+        index = {}
+        keys = []
+        for p in partials:
+            for k in keys_of(p):
+                if k not in index:
+                    index[k] = len(keys)
+                    keys.append(k)
+        out = [np.zeros(len(keys), dtype=np.float64), np.zeros(len(keys), dtype=np.float64),
+               np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=np.int64)]
+        for p in partials:
+            codes = np.array([index[k] for k in keys_of(p)], dtype=np.int64)
+            for acc, values in zip(out, columns(p)):
+                acc[codes] += values   # 同一份中的键不重复，可以直接按下标累加
+        return keys, out
+
+    ids, (ic, iw, icc, iwc) = merge(
+        lambda p: p.ids,
+        lambda p: (p.id_correct, p.id_wrong, p.id_correct_count, p.id_wrong_count))
+    names, (nc, nw, ncc, nwc) = merge(
+        lambda p: p.names,
+        lambda p: (p.name_correct, p.name_wrong, p.name_correct_count, p.name_wrong_count))
+    return SalaryTotals(ids, ic, iw, icc, iwc, names, nc, nw, ncc, nwc)
+
+
+def detail_rows(totals):
+    """按老师-ID 排序产出 (老师-ID, 正确总金, 错误总金)"""
+    correct = totals.id_correct.tolist()
+    wrong = totals.id_wrong.tolist()
+    for i in sorted(range(len(totals.ids)), key=totals.ids.__getitem__):
+        yield totals.ids[i], correct[i], wrong[i]
+
+
+def summary_rows(totals):
+    """按老师姓名排序产出 (老师姓名, 正确总金, 错误总金, 正确题数, 错误题数)"""
+    correct = totals.name_correct.tolist()
+    wrong = totals.name_wrong.tolist()
+    cc = totals.name_correct_count.tolist()
+    wc = totals.name_wrong_count.tolist()
+    for i in sorted(range(len(totals.names)), key=totals.names.__getitem__):
+        yield totals.names[i], correct[i], wrong[i], cc[i], wc[i]
+
+
+def write_detail_csv(totals, path):
+    """写入 salary_detail.csv"""
+    write_detail_csv_rows(detail_rows(totals), path)
+
+
+def write_summary_csv(totals, path):
+    """写入 salary_summary.csv"""
+    write_summary_csv_rows(summary_rows(totals), path)
+
+
+def write_detail_csv_rows(rows, path):
+    """把已排序的 (老师-ID, 正确总金, 错误总金) 逐行写入 salary_detail.csv，返回行数"""
+    n = 0
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        f.write("老师,回答正确所得金,回答错误所得金,所得金合计\n")
+        for t, c, w in rows:
+            f.write(f"{t},{c:.2f},{w:.2f},{c+w:.2f}\n")
+            n += 1
+    return n
+
+
+def write_summary_csv_rows(rows, path):
+    """把已排序的 (老师姓名, 正确总金, 错误总金, 正确题数, 错误题数) 逐行写入 salary_summary.csv，返回行数"""
+    n = 0
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        f.write("老师,回答正确所得金,回答错误所得金,所得金合计,评价正确题数,评价错误题数,评价总题数\n")
+        for t, c, w, correct_count, wrong_count in rows:
+            total_count = correct_count + wrong_count
+            f.write(f"{t},{c:.2f},{w:.2f},{c+w:.2f},{correct_count},{wrong_count},{total_count}\n")
+            n += 1
+    return n
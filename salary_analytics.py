@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+评审分析：每位老师的正确率、每个题目有几位评审老师判断正确、正确率最高 / 最低的老师
+
+    python cal.py analytics                      解析 judge.xlsx，写出 salary_analytics.npz 并输出
+    python cal.py analytics --tables             只读已有的 salary_analytics.npz，不读工作簿
+    python cal.py analytics --top 5 --min-reviews 50
+    python cal.py calc --analytics               计算所得金的同时写出分析表
+
+- 数据来自 calc 同样使用的 Appearances（「老师出现一次」的扁平数组，见 salary_aggregate），
+  全部指标用 np.bincount 一次算出，不为每行、每次出现创建 Python 对象
+- K/N 列不是数字的行不计入所得金，也不计入分析（与 calc 一致）
+- 正确率 = 判断正确次数 / 评审次数；最高 / 最低的 N 位老师用堆（heapq）选出，
+  只考虑评审次数不少于 min_reviews 的老师，正确率相同时评审次数多的排在前面
+- 题目的一致程度：评审人数、判断正确的人数；按（评审人数, 判断正确人数）统计题目数，
+  评审人数不等于 expected_count（默认 5）的题目单独计数
+
+salary_analytics.npz 与 salary_columnar 格式相同（不压缩，可直接映射），每张表的键是字符串字典：
+    reviewer_id      按老师-ID 排序：correct（判断正确次数）、reviews（评审次数）、name（姓名表下标）
+    reviewer_name    按老师姓名排序：correct、reviews、ids（老师-ID 个数）
+    problem          按工作表行顺序：row（行号）、correct、reviews；键为题目 ID
+    agreement        [评审人数, 判断正确人数] -> 题目数
+"""
+
+import heapq
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from judge_rules import DEFAULT_EXPECTED_COUNT
+from salary_columnar import ColumnarTable, _map_npz_members, _string_dictionary
+
+ANALYTICS_NAME = "salary_analytics.npz"
+FORMAT_VERSION = 1
+
+DEFAULT_TOP_N = 10
+DEFAULT_MIN_REVIEWS = 10
+
+_ID_COLUMNS = ('correct', 'reviews', 'name')
+_NAME_COLUMNS = ('correct', 'reviews', 'ids')
+_PROBLEM_COLUMNS = ('row', 'correct', 'reviews')
+
+
+class Analytics(NamedTuple):
+    """analyze() 的结果，各表已按键排序（题目按行顺序）"""
+    ids: list
+    id_correct: np.ndarray
+    id_reviews: np.ndarray
+    id_name: np.ndarray         # 老师-ID -> names 下标
+    names: list
+    name_correct: np.ndarray
+    name_reviews: np.ndarray
+    name_ids: np.ndarray
+    problem_ids: list
+    problem_rows: np.ndarray
+    problem_correct: np.ndarray
+    problem_reviews: np.ndarray
+    agreement: np.ndarray       # (最多评审人数 + 1, 最多评审人数 + 1)
+    expected_count: int
+
+
+def _sorted_order(keys):
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    return np.array(order, dtype=np.int64)
+
+
+def analyze(app, expected_count=DEFAULT_EXPECTED_COUNT):
+    """由 Appearances 一次算出全部分析表（需要 collect_appearances(..., with_rows=True) 的行信息）"""
+    n_ids = len(app.ids)
+    n_names = len(app.names)
+    n_rows = len(app.row_numbers)
+    right = app.correct
+    name_codes = app.id_name[app.codes] if n_ids else app.codes
+
+    id_reviews = np.bincount(app.codes, minlength=n_ids)
+    id_correct = np.bincount(app.codes[right], minlength=n_ids)
+    name_reviews = np.bincount(name_codes, minlength=n_names)
+    name_correct = np.bincount(name_codes[right], minlength=n_names)
+    name_ids = np.bincount(app.id_name, minlength=n_names)
+
+    id_order = _sorted_order(app.ids)
+    name_order = _sorted_order(app.names)
+    name_position = np.empty(n_names, dtype=np.int64)
+    name_position[name_order] = np.arange(n_names)
+
+    # 每个计入的行：有评审老师，或者至少有题目 ID（补齐的空行不算题目）
+    reviews = np.bincount(app.row_index, minlength=n_rows)
+    correct = np.bincount(app.row_index[right], minlength=n_rows)
+    has_id = np.fromiter((p is not None for p in app.problem_ids), dtype=bool, count=n_rows)
+    keep = np.flatnonzero((reviews > 0) | has_id)
+    reviews = reviews[keep]
+    correct = correct[keep]
+    size = int(reviews.max()) + 1 if len(reviews) else 1
+    agreement = np.bincount(reviews * size + correct, minlength=size * size).reshape(size, size)
+
+    return Analytics(
+        ids=[app.ids[i] for i in id_order],
+        id_correct=id_correct[id_order],
+        id_reviews=id_reviews[id_order],
+        id_name=name_position[app.id_name[id_order]] if n_ids else np.zeros(0, dtype=np.int64),
+        names=[app.names[i] for i in name_order],
+        name_correct=name_correct[name_order],
+        name_reviews=name_reviews[name_order],
+        name_ids=name_ids[name_order],
+        problem_ids=["" if app.problem_ids[i] is None else str(app.problem_ids[i]) for i in keep.tolist()],
+        problem_rows=app.row_numbers[keep],
+        problem_correct=correct,
+        problem_reviews=reviews,
+        agreement=agreement,
+        expected_count=expected_count,
+    )
+
+
+def write_analytics(an, path):
+    """把 Analytics 写成不压缩的 .npz（先写临时文件再替换）"""
+    arrays = {
+        "format_version": np.array([FORMAT_VERSION], dtype=np.int64),
+        "expected_count": np.array([an.expected_count], dtype=np.int64),
+        "agreement": np.asarray(an.agreement, dtype=np.int64),
+    }
+    for prefix, keys, columns in (
+            ("reviewer_id", an.ids, {"correct": an.id_correct, "reviews": an.id_reviews, "name": an.id_name}),
+            ("reviewer_name", an.names, {"correct": an.name_correct, "reviews": an.name_reviews,
+                                         "ids": an.name_ids}),
+            ("problem", an.problem_ids, {"row": an.problem_rows, "correct": an.problem_correct,
+                                         "reviews": an.problem_reviews})):
+        data, offsets = _string_dictionary(keys)
+        arrays[f"{prefix}_key_data"] = data
+        arrays[f"{prefix}_key_offsets"] = offsets
+        for column, values in columns.items():
+            arrays[f"{prefix}_{column}"] = np.asarray(values, dtype=np.int64)
+
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    tmp.replace(path)
+    return path
+
+
+class AnalyticsTables:
+    """读取的分析表：reviewer_id / reviewer_name / problem 为 ColumnarTable，agreement 为数组"""
+
+    def __init__(self, arrays):
+        version = int(arrays["format_version"][0])
+        if version != FORMAT_VERSION:
+            raise ValueError(f"不支持的分析文件版本: {version}")
+        self.expected_count = int(arrays["expected_count"][0])
+        self.agreement = arrays["agreement"]
+        self.reviewer_id = ColumnarTable(arrays, "reviewer_id", _ID_COLUMNS)
+        self.reviewer_name = ColumnarTable(arrays, "reviewer_name", _NAME_COLUMNS)
+        self.problem = ColumnarTable(arrays, "problem", _PROBLEM_COLUMNS)
+
+
+def load_analytics(path, mmap=True):
+    """读取 salary_analytics.npz；mmap=True 时数组直接映射文件，不复制"""
+    if mmap:
+        return AnalyticsTables(_map_npz_members(path))
+    with np.load(path) as npz:
+        return AnalyticsTables({name: npz[name] for name in npz.files})
+
+
+def accuracy(correct, reviews):
+    """正确率数组；没有评审的为 nan"""
+    correct = np.asarray(correct, dtype=np.float64)
+    reviews = np.asarray(reviews, dtype=np.float64)
+    out = np.full(len(reviews), np.nan)
+    np.divide(correct, reviews, out=out, where=reviews > 0)
+    return out
+
+
+def top_reviewers(correct, reviews, n=DEFAULT_TOP_N, min_reviews=DEFAULT_MIN_REVIEWS):
+    """
+    返回 (正确率最高的 n 个下标, 最低的 n 个下标)，只考虑评审次数 >= min_reviews 的
+    用 heapq 选出，不对全部老师排序；正确率相同时评审次数多的在前，再相同时按下标
+    """
+    acc = accuracy(correct, reviews).tolist()
+    counts = np.asarray(reviews).tolist()
+    eligible = [i for i, c in enumerate(counts) if c >= min_reviews]
+    best = heapq.nsmallest(n, eligible, key=lambda i: (-acc[i], -counts[i], i))
+    worst = heapq.nsmallest(n, eligible, key=lambda i: (acc[i], -counts[i], i))
+    return best, worst
+
+
+def print_analytics(tables, top_n=DEFAULT_TOP_N, min_reviews=DEFAULT_MIN_REVIEWS):
+    """输出分析表的摘要（只用读取的表，不需要工作簿）"""
+    names = tables.reviewer_name
+    problems = tables.problem
+    total_reviews = int(names.reviews.sum())
+    total_correct = int(names.correct.sum())
+    print("="*80)
+    print("评审分析")
+    print("="*80)
+    overall = f"{total_correct / total_reviews:.1%}" if total_reviews else "-"
+    print(f"评审 {total_reviews} 次（老师-ID {len(tables.reviewer_id)} 个，老师 {len(names)} 位），"
+          f"判断正确 {total_correct} 次，整体正确率 {overall}")
+
+    reviews = np.asarray(problems.reviews)
+    expected = tables.expected_count
+    off = int(np.count_nonzero(reviews != expected))
+    print(f"\n题目 {len(problems)} 个，评审人数不等于 {expected} 的 {off} 个")
+    print("每题判断正确的人数（按评审人数分组，题目数）：")
+    agreement = np.asarray(tables.agreement)
+    for count in np.flatnonzero(agreement.sum(axis=1)).tolist():
+        row = agreement[count, :count + 1].tolist()
+        cells = "  ".join(f"{k}人:{v}" for k, v in enumerate(row) if v)
+        mark = "" if count == expected else "  ←评审人数异常"
+        print(f"  评审 {count} 人（{sum(row)} 题）: {cells}{mark}")
+
+    best, worst = top_reviewers(names.correct, names.reviews, top_n, min_reviews)
+    acc = accuracy(names.correct, names.reviews)
+    keys = names.keys()
+    correct = np.asarray(names.correct).tolist()
+    counts = np.asarray(names.reviews).tolist()
+    for title, picked in (("最高", best), ("最低", worst)):
+        print(f"\n正确率{title}的 {len(picked)} 位老师（评审不少于 {min_reviews} 次）：")
+        for rank, i in enumerate(picked, 1):
+            print(f"  {rank:>2}. {keys[i]}  {acc[i]:.1%}（{correct[i]}/{counts[i]}）")
+        if not picked:
+            print("  （没有满足条件的老师）")
+
+
+def add_analytics_arguments(parser):
+    """--top / --min-reviews"""
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP_N, metavar="N",
+                        help=f"输出正确率最高 / 最低的 N 位老师（默认 {DEFAULT_TOP_N}）")
+    parser.add_argument("--min-reviews", type=int, default=DEFAULT_MIN_REVIEWS, metavar="M",
+                        help=f"参与排名的老师至少评审 M 次（默认 {DEFAULT_MIN_REVIEWS}）")
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+列式二进制输出：与 salary_detail.csv / salary_summary.csv 内容相同的两张表，
+写成一个不压缩的 NumPy .npz（salary_tables.npz），下游直接按类型读取，不做文本解析
+
+    python cal.py calc --columnar
+    python cal.py verify --columnar salary_tables.npz
+
+每张表（detail：按老师-ID，summary：按老师姓名，行顺序与 CSV 相同）的列：
+    <表>_key_data / <表>_key_offsets   字符串字典：全部键的 UTF-8 字节拼在一起 + 每个键的起止偏移
+    <表>_correct_cents / _wrong_cents / _total_cents
+                                       金额（整数分，int64），与 CSV 中两位小数的数值完全相同
+    <表>_correct_count / _wrong_count  题数（int64）
+    <表>_correct / <表>_wrong          未经四舍五入的浮点合计（float64），需要更高精度时使用
+load_tables() 直接把 .npz 中的每个数组映射到内存（np.memmap），不复制、不解析；
+键只在用到时才解码
+"""
+
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+from salary_aggregate import detail_rows, summary_rows
+
+TABLES_NAME = "salary_tables.npz"
+FORMAT_VERSION = 1
+
+_COLUMNS = ('correct_cents', 'wrong_cents', 'total_cents', 'correct_count', 'wrong_count',
+            'correct', 'wrong')
+
+
+def _cents(value):
+    """与 CSV 的 f"{value:.2f}" 相同的舍入，换成整数分"""
+    return int(f"{value:.2f}".replace(".", ""))
+
+
+def _string_dictionary(keys):
+    encoded = [k.encode("utf-8") for k in keys]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _table_arrays(prefix, keys, correct, wrong, correct_count, wrong_count):
+    data, offsets = _string_dictionary(keys)
+    return {
+        f"{prefix}_key_data": data,
+        f"{prefix}_key_offsets": offsets,
+        f"{prefix}_correct_cents": np.array([_cents(c) for c in correct], dtype=np.int64),
+        f"{prefix}_wrong_cents": np.array([_cents(w) for w in wrong], dtype=np.int64),
+        f"{prefix}_total_cents": np.array([_cents(c + w) for c, w in zip(correct, wrong)], dtype=np.int64),
+        f"{prefix}_correct_count": np.array(correct_count, dtype=np.int64),
+        f"{prefix}_wrong_count": np.array(wrong_count, dtype=np.int64),
+        f"{prefix}_correct": np.array(correct, dtype=np.float64),
+        f"{prefix}_wrong": np.array(wrong, dtype=np.float64),
+    }
+
+
+def _columns(rows, width):
+    """按行产出的元组 -> width 个列表"""
+    columns = tuple([] for _ in range(width))
+    for row in rows:
+        for column, value in zip(columns, row):
+            column.append(value)
+    return columns
+
+
+def write_tables(totals, path):
+    """把 SalaryTotals 写成列式 .npz（先写临时文件再替换）"""
+    id_counts = dict(zip(totals.ids, zip(totals.id_correct_count.tolist(),
+                                         totals.id_wrong_count.tolist())))
+    ids, id_correct, id_wrong = _columns(detail_rows(totals), 3)
+    names, name_correct, name_wrong, name_cc, name_wc = _columns(summary_rows(totals), 5)
+    arrays = {"format_version": np.array([FORMAT_VERSION], dtype=np.int64)}
+    arrays.update(_table_arrays("detail", ids, id_correct, id_wrong,
+                                [id_counts[t][0] for t in ids], [id_counts[t][1] for t in ids]))
+    arrays.update(_table_arrays("summary", names, name_correct, name_wrong, name_cc, name_wc))
+
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)   # 不压缩，才能直接映射
+    tmp.replace(path)
+    return path
+
+
+class ColumnarTable:
+    """一张表：数值列是只读的 NumPy 数组（映射自文件），键按需解码"""
+
+    def __init__(self, arrays, prefix, columns=_COLUMNS):
+        self._key_data = arrays[f"{prefix}_key_data"]
+        self._key_offsets = arrays[f"{prefix}_key_offsets"]
+        for column in columns:
+            setattr(self, column, arrays[f"{prefix}_{column}"])
+        self._keys = None
+
+    def __len__(self):
+        return len(self._key_offsets) - 1
+
+    def key(self, i):
+        a, b = self._key_offsets[i], self._key_offsets[i + 1]
+        return self._key_data[a:b].tobytes().decode("utf-8")
+
+    def keys(self):
+        """全部键（第一次调用时解码一次）"""
+        if self._keys is None:
+            data = self._key_data.tobytes()
+            offsets = self._key_offsets.tolist()
+            self._keys = [data[a:b].decode("utf-8") for a, b in zip(offsets, offsets[1:])]
+        return self._keys
+
+
+class ColumnarTables:
+    def __init__(self, arrays):
+        version = int(arrays["format_version"][0])
+        if version != FORMAT_VERSION:
+            raise ValueError(f"不支持的列式文件版本: {version}")
+        self.detail = ColumnarTable(arrays, "detail")
+        self.summary = ColumnarTable(arrays, "summary")
+
+
+def _map_npz_members(path):
+    """
+    把不压缩的 .npz 中的每个 .npy 成员直接映射成 np.memmap：
+    找到成员在 zip 中的数据起点，读出 .npy 头，数组数据从头后面开始
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path} 中的 {info.filename} 是压缩的，无法直接映射")
+            f.seek(info.header_offset)
+            local = f.read(30)
+            name_len = int.from_bytes(local[26:28], "little")
+            extra_len = int.from_bytes(local[28:30], "little")
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if not shape or 0 in shape:
+                arrays[name] = np.zeros(shape, dtype=dtype)     # 空数组不能映射
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                         order="F" if fortran else "C")
+    return arrays
+
+
+def load_tables(path, mmap=True):
+    """读取列式 .npz；mmap=True 时数组直接映射文件，不复制"""
+    if mmap:
+        return ColumnarTables(_map_npz_members(path))
+    with np.load(path) as npz:
+        return ColumnarTables({name: npz[name] for name in npz.files})
+
+
+def iter_detail_columnar(tables):
+    """按老师-ID 顺序产出 (老师-ID, (正确金额, 错误金额))，金额与 CSV 中的数值相同"""
+    t = tables.detail
+    correct = (t.correct_cents / 100).tolist()
+    wrong = (t.wrong_cents / 100).tolist()
+    return zip(t.keys(), zip(correct, wrong))
+
+
+def iter_summary_columnar(tables):
+    """按老师姓名顺序产出 (老师姓名, (正确金额, 错误金额, 正确题数, 错误题数))"""
+    t = tables.summary
+    return zip(t.keys(), zip((t.correct_cents / 100).tolist(), (t.wrong_cents / 100).tolist(),
+                             t.correct_count.tolist(), t.wrong_count.tolist()))
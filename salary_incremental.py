@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+增量计算：只处理 judge.xlsx 中新增、删除或修改过的行
+
+检查点（默认 .salary_checkpoint，与 CSV 放在同一目录）保存：
+- 按行顺序排列的行键：(题号, 行内容哈希, 相同内容的第几行)
+- 每种行内容对老师-ID 的贡献：((老师-ID, 是否正确, 每人金额), ...)
+- 每个老师-ID 出现过的行键（按行顺序），以及每个老师-ID / 老师姓名的合计
+
+下次运行时只比较行键：消失的行与新出现的行所涉及的老师-ID（及其姓名）需要重算，
+其余老师的合计直接沿用。重算时按当前的行顺序从 0 开始逐次累加，
+与 salary_aggregate.aggregate 的累加顺序完全相同，所以结果与全量计算逐位一致，
+写出的 CSV 也完全一样（--check-full 可以当场核对）
+未变化的行如果被调换了顺序，浮点累加顺序随之改变，此时自动退回全量重算
+"""
+
+import hashlib
+import marshal
+import os
+import zlib
+
+import numpy as np
+
+from judge_loader import PARSER_VERSION, parse_teachers, extract_teacher_name
+from salary_aggregate import SalaryTotals, parse_amount, collect_appearances, aggregate
+
+CHECKPOINT_NAME = ".salary_checkpoint"
+MAGIC = b"JDGI"
+FORMAT_VERSION = 1
+
+
+def _plain(value):
+    """题号等值转成 marshal 可保存的类型"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return repr(value)
+
+
+def content_key(r):
+    """(题号, 行内容哈希)；行号不参与，插入/删除别的行不会让本行被视为修改"""
+    content = repr(tuple(r[1:])).encode("utf-8")
+    return (_plain(r.problem_id), hashlib.blake2b(content, digest_size=16).digest())
+
+
+def row_contributions(r):
+    """
+    一行对老师-ID 的贡献：((老师-ID, 是否正确, 每人金额), ...)，顺序与 collect_appearances 相同
+    K/N 不是数字的行没有贡献
+    """
+    try:
+        correct_per = parse_amount(r.correct_per)
+        wrong_per = parse_amount(r.wrong_per)
+    except (TypeError, ValueError):
+        return ()
+    out = []
+    for value, colored in ((r.passed, r.passed_colored), (r.failed, r.failed_colored)):
+        amount = correct_per if colored else wrong_per
+        for t in parse_teachers(value):
+            out.append((t, bool(colored), amount))
+    return tuple(out)
+
+
+class IncrementalState:
+    """检查点内容"""
+
+    def __init__(self, header):
+        self.header = header
+        self.order = []     # 行键 (题号, 哈希, 序号)，按行顺序
+        self.contrib = {}   # (题号, 哈希) -> 贡献
+        self.rows_of = {}   # 老师-ID -> [行键, ...]，按行顺序
+        self.ids = {}       # 老师-ID -> (正确总金, 错误总金, 正确题数, 错误题数)
+        self.names = {}     # 老师姓名 -> (正确总金, 错误总金, 正确题数, 错误题数)
+
+    def to_totals(self):
+        """转换成 SalaryTotals，供 write_detail_csv / write_summary_csv 使用"""
+        def columns(table):
+            keys = sorted(table)
+            values = [table[k] for k in keys]
+            return (keys,
+                    np.array([v[0] for v in values], dtype=np.float64),
+                    np.array([v[1] for v in values], dtype=np.float64),
+                    np.array([v[2] for v in values], dtype=np.int64),
+                    np.array([v[3] for v in values], dtype=np.int64))
+
+        return SalaryTotals(*columns(self.ids), *columns(self.names))
+
+
+def checkpoint_header(fill_rule):
+    return {
+        "format": FORMAT_VERSION,
+        "parser": PARSER_VERSION,
+        "fill_rule": (sorted(fill_rule.themes), sorted(fill_rule.rgbs)),
+    }
+
+
+def load_checkpoint(path, header):
+    """读取检查点；不存在、损坏或与当前解析规则不一致时返回 None"""
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            data = marshal.loads(zlib.decompress(f.read()))
+    except (OSError, ValueError, EOFError, TypeError, zlib.error):
+        return None
+    if not isinstance(data, dict) or data.get("header") != header:
+        return None
+    state = IncrementalState(header)
+    state.order = data["order"]
+    state.contrib = data["contrib"]
+    state.rows_of = data["rows_of"]
+    state.ids = data["ids"]
+    state.names = data["names"]
+    return state
+
+
+def save_checkpoint(path, state):
+    """原子地写出检查点；含无法保存的值时返回 False"""
+    data = {
+        "header": state.header,
+        "order": state.order,
+        "contrib": state.contrib,
+        "rows_of": state.rows_of,
+        "ids": state.ids,
+        "names": state.names,
+    }
+    try:
+        payload = zlib.compress(marshal.dumps(data))
+    except ValueError:
+        return False
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(payload)
+    os.replace(tmp, path)
+    return True
+
+
+class IncrementalResult:
+    def __init__(self, state, full, added, removed, changed, unchanged, affected):
+        self.state = state
+        self.full = full            # 没有可用的检查点（或行顺序变化），做了全量计算
+        self.added = added          # 新增的行数
+        self.removed = removed      # 删除的行数
+        self.changed = changed      # 内容被修改的题号（同时出现在新增与删除中）
+        self.unchanged = unchanged  # 未变化的行数
+        self.affected = affected    # 重算的老师-ID 数
+
+
+def _sum_in_order(keys, contrib, position, wanted):
+    """按当前行顺序逐次累加 wanted(老师-ID) 为真的贡献，返回合计四元组"""
+    correct = wrong = 0.0
+    correct_count = wrong_count = 0
+    for key in sorted(keys, key=position.__getitem__):
+        for t, is_correct, amount in contrib[key[:2]]:
+            if wanted(t):
+                if is_correct:
+                    correct += amount
+                    correct_count += 1
+                else:
+                    wrong += amount
+                    wrong_count += 1
+    return (correct, wrong, correct_count, wrong_count)
+
+
+def _apply(state, order, new_contrib, added, removed):
+    """把 removed / added 行键的贡献应用到 state，重算受影响的老师-ID 与姓名"""
+    contrib = state.contrib
+    contrib.update(new_contrib)
+    position = {key: i for i, key in enumerate(order)}
+
+    affected = set()
+    for key in removed:
+        for t, _, _ in contrib[key[:2]]:
+            affected.add(t)
+            keys = state.rows_of.get(t)
+            if keys is not None and key in keys:
+                keys.remove(key)
+    for key in added:
+        for t, _, _ in contrib[key[:2]]:
+            affected.add(t)
+            keys = state.rows_of.setdefault(t, [])
+            if not keys or keys[-1] != key:   # 同一格子里重复的 ID 只记一次行
+                keys.append(key)
+
+    affected_names = set()
+    for t in affected:
+        affected_names.add(extract_teacher_name(t))
+        keys = state.rows_of.get(t)
+        if not keys:
+            state.rows_of.pop(t, None)
+            state.ids.pop(t, None)
+            continue
+        keys[:] = sorted(set(keys), key=position.__getitem__)
+        state.ids[t] = _sum_in_order(keys, contrib, position, t.__eq__)
+
+    if affected_names:
+        name_of = {t: extract_teacher_name(t) for t in state.rows_of}
+        ids_of_name = {}
+        for t, name in name_of.items():
+            if name in affected_names:
+                ids_of_name.setdefault(name, []).append(t)
+        for name in affected_names:
+            members = ids_of_name.get(name)
+            if not members:
+                state.names.pop(name, None)
+                continue
+            keys = {key for t in members for key in state.rows_of[t]}
+            state.names[name] = _sum_in_order(
+                keys, contrib, position, lambda t: name_of.get(t) == name)
+
+    state.order = order
+    # 只保留仍被引用的行内容
+    live = {key[:2] for key in order}
+    state.contrib = {k: v for k, v in contrib.items() if k in live}
+    return affected
+
+
+def update(judge_rows, checkpoint_path, fill_rule):
+    """读取全部行，按检查点做增量更新，写回检查点，返回 IncrementalResult"""
+    header = checkpoint_header(fill_rule)
+    old = load_checkpoint(checkpoint_path, header)
+    known = old.contrib if old is not None else {}
+
+    order = []
+    seen = {}
+    new_contrib = {}
+    for r in judge_rows:
+        ck = content_key(r)
+        n = seen.get(ck, 0)
+        seen[ck] = n + 1
+        order.append(ck + (n,))
+        # 只有没见过的行内容才需要解析老师列表
+        if ck not in known and ck not in new_contrib:
+            new_contrib[ck] = row_contributions(r)
+
+    full = old is None
+    if not full:
+        old_position = {key: i for i, key in enumerate(old.order)}
+        current = set(order)
+        removed = [key for key in old.order if key not in current]
+        added = [key for key in order if key not in old_position]
+        # 未变化的行必须保持原来的相对顺序，否则浮点累加顺序会变
+        last = -1
+        for key in order:
+            i = old_position.get(key)
+            if i is not None:
+                if i < last:
+                    full = True
+                    break
+                last = i
+    if full:
+        state = IncrementalState(header)
+        removed = []
+        added = order
+        new_contrib.update(known)
+    else:
+        state = old
+
+    affected = _apply(state, order, new_contrib, added, removed)
+    save_checkpoint(checkpoint_path, state)
+
+    changed = {key[0] for key in added} & {key[0] for key in removed}
+    return IncrementalResult(state, full, len(added), len(removed), changed,
+                             len(order) - len(added), len(affected))
+
+
+def check_against_full(state, judge_rows):
+    """
+    用 collect_appearances + aggregate 全量重算，与增量结果逐位对比
+    返回不一致的老师-ID / 老师姓名列表（空列表表示完全一致）
+    """
+    totals = aggregate(collect_appearances(judge_rows))
+    mismatched = []
+    for keys, table, columns in (
+            (totals.ids, state.ids,
+             (totals.id_correct, totals.id_wrong, totals.id_correct_count, totals.id_wrong_count)),
+            (totals.names, state.names,
+             (totals.name_correct, totals.name_wrong, totals.name_correct_count, totals.name_wrong_count))):
+        expected = {k: tuple(c[i].item() for c in columns) for i, k in enumerate(keys)}
+        for k in sorted(expected.keys() | table.keys()):
+            actual = tuple(table[k]) if k in table else None
+            if expected.get(k) != actual:
+                mismatched.append(k)
+    return mismatched
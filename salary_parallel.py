@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+批量模式：一次处理多个 judge 工作簿、每个工作簿的多个工作表
+
+    python cal.py batch 批次目录/ "2024-*/judge*.xlsx" --sheet "Sheet*" --jobs 8
+
+- 输入可以是目录（取其中全部 .xlsx）、通配符或单个文件，按路径排序去重
+- 每个工作簿默认处理全部工作表，--sheet 按名称通配符筛选（可重复指定）
+- 每个 (工作簿, 工作表) 是一个任务，在进程池中并行解析、汇总，
+  工作进程只返回该表的 SalaryTotals（每个老师-ID / 姓名一项，体积很小）
+- 合并严格按任务顺序（路径、工作表在工作簿中的顺序）进行，
+  与进程数和完成先后无关，输出逐字节确定
+"""
+
+import fnmatch
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+from judge_loader import DEFAULT_FILL_RULE, iter_judge_rows, sheet_names
+from salary_aggregate import collect_appearances, aggregate, merge_totals
+
+
+class SheetTask(NamedTuple):
+    path: str
+    sheet: str
+    engine: str
+    fill_rule: object
+    use_cache: bool
+
+
+class SheetResult(NamedTuple):
+    path: str
+    sheet: str
+    rows: int
+    skipped: int
+    totals: object      # SalaryTotals
+
+
+def expand_inputs(inputs):
+    """目录 / 通配符 / 文件 -> 排序去重后的 xlsx 路径列表（跳过 Excel 的 ~$ 临时文件）"""
+    paths = set()
+    for item in inputs:
+        p = Path(item)
+        if p.is_dir():
+            matches = p.glob("*.xlsx")
+        elif glob.has_magic(item):
+            matches = (Path(m) for m in glob.glob(item, recursive=True))
+        else:
+            if not p.exists():
+                raise FileNotFoundError(f"找不到输入: {item}")
+            matches = [p]
+        for m in matches:
+            if m.is_file() and not m.name.startswith("~$"):
+                paths.add(str(m.resolve()))
+    return sorted(paths)
+
+
+def plan_tasks(paths, sheet_patterns=(), engine='openpyxl', fill_rule=DEFAULT_FILL_RULE, use_cache=True):
+    """按路径顺序、工作表在工作簿中的顺序列出全部任务"""
+    tasks = []
+    for path in paths:
+        for name in sheet_names(path):
+            if sheet_patterns and not any(fnmatch.fnmatchcase(name, pat) for pat in sheet_patterns):
+                continue
+            tasks.append(SheetTask(path, name, engine, fill_rule, use_cache))
+    return tasks
+
+
+def run_task(task):
+    """工作进程：解析一个工作表并汇总"""
+    try:
+        rows = iter_judge_rows(task.path, engine=task.engine, fill_rule=task.fill_rule,
+                               use_cache=task.use_cache, sheet=task.sheet)
+        app = collect_appearances(rows)
+        return SheetResult(task.path, task.sheet, app.rows, app.skipped, aggregate(app))
+    except Exception as e:
+        raise RuntimeError(f"处理 {task.path} 的工作表 {task.sheet!r} 失败: {e}") from e
+
+
+def run_tasks(tasks, jobs=None):
+    """
+    并行执行全部任务，按任务顺序返回 SheetResult 列表
+    jobs=1 时在当前进程中依次执行
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(tasks) <= 1:
+        return [run_task(t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as pool:
+        # map 按提交顺序返回结果，与完成先后无关
+        return list(pool.map(run_task, tasks))
+
+
+def merge_results(results):
+    """按任务顺序合并各工作表的汇总"""
+    return merge_totals([r.totals for r in results])
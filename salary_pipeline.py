@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+流水线模式：解析 judge.xlsx 与汇总、校验同时进行
+
+    python cal.py calc --pipeline
+    python cal.py calc --pipeline --validate        同一遍中再做数据校验（见 judge_rules）
+
+    读取进程 ──行批次──> 有界队列 ──> 主进程：collect_appearances（汇总）
+               └──────> 有界队列 ──> 校验进程：judge_rules.validate（可选）
+
+- 解压、解析 XML 与汇总都是 CPU 密集的纯 Python 代码，受 GIL 限制，线程无法并行，
+  因此读取和校验各用一个进程，汇总留在主进程（结果直接可用，不必再跨进程传回）
+- 每批 BATCH_ROWS 行打包成普通元组后放入队列，序列化开销远小于解析
+- 队列最多积压 QUEUE_DEPTH 批，消费者跟不上时读取进程阻塞（背压），
+  内存占用与工作簿大小无关
+- 汇总仍按行的原始顺序进行，结果与逐行循环逐位相同
+- 只有一个 CPU 时流水线没有收益，pipeline_available() 为 False，调用方改用普通循环
+"""
+
+import multiprocessing
+import os
+from typing import NamedTuple
+
+from judge_loader import DEFAULT_FILL_RULE, JudgeRow, iter_judge_rows
+from judge_rules import RuleOptions, validate
+from salary_aggregate import collect_appearances
+
+BATCH_ROWS = 2048
+QUEUE_DEPTH = 8
+
+
+class _Failure(NamedTuple):
+    """某个阶段出错时代替数据放入队列，由接收方重新抛出"""
+    stage: str
+    message: str
+
+
+class PipelineResult(NamedTuple):
+    appearances: object     # salary_aggregate.Appearances
+    validation: object      # judge_rules.ValidationReport；没有校验阶段时为 None
+
+
+def pipeline_available():
+    """至少有两个 CPU 时流水线才比普通循环快"""
+    return (os.cpu_count() or 1) >= 2
+
+
+def _reader(queues, xlsx_path, engine, fill_rule, use_cache, sheet, batch_rows):
+    """读取进程：解析工作簿，按批放入每个下游队列，最后放入 None 表示结束"""
+    try:
+        batch = []
+        for r in iter_judge_rows(xlsx_path, engine=engine, fill_rule=fill_rule,
+                                 use_cache=use_cache, sheet=sheet):
+            batch.append(tuple(r))
+            if len(batch) >= batch_rows:
+                for q in queues:
+                    q.put(batch)
+                batch = []
+        if batch:
+            for q in queues:
+                q.put(batch)
+        end = None
+    except Exception as e:
+        end = _Failure("读取", f"{type(e).__name__}: {e}")
+    for q in queues:
+        q.put(end)
+
+
+def _iter_queue_rows(queue):
+    """从队列中逐行取出 JudgeRow，直到结束标记；读取出错时抛出 RuntimeError"""
+    make = JudgeRow._make
+    while True:
+        batch = queue.get()
+        if batch is None:
+            return
+        if isinstance(batch, _Failure):
+            raise RuntimeError(f"{batch.stage}阶段出错: {batch.message}")
+        for t in batch:
+            yield make(t)
+
+
+def _drain(rows):
+    """
+    把没有读完的行丢弃到结束标记为止，避免读取进程阻塞在满的队列上
+    rows 已经读完（或因读取出错而结束）时什么也不做
+    """
+    try:
+        for _ in rows:
+            pass
+    except RuntimeError:
+        pass
+
+
+def _validator(queue, result_queue, rules, options):
+    """校验进程：消费行批次做数据校验，把 ValidationReport 放入 result_queue"""
+    rows = _iter_queue_rows(queue)
+    try:
+        result = validate(rows, rules, options)
+    except Exception as e:
+        result = _Failure("校验", f"{type(e).__name__}: {e}")
+    _drain(rows)
+    result_queue.put(result)
+
+
+def run_pipeline(xlsx_path, engine='openpyxl', fill_rule=DEFAULT_FILL_RULE, use_cache=True, sheet=None,
+                 rules=None, options=RuleOptions(), batch_rows=BATCH_ROWS, depth=QUEUE_DEPTH, with_rows=False):
+    """
+    以流水线方式解析并汇总一个工作表，返回 PipelineResult
+    rules 不为 None 时同时在校验进程中检查这些规则
+    """
+    ctx = multiprocessing.get_context()
+    aggregate_queue = ctx.Queue(depth)
+    queues = [aggregate_queue]
+    validator = result_queue = None
+    if rules is not None:
+        validate_queue = ctx.Queue(depth)
+        result_queue = ctx.Queue(1)
+        queues.append(validate_queue)
+        validator = ctx.Process(target=_validator, name="judge-validator", daemon=True,
+                                args=(validate_queue, result_queue, rules, options))
+    reader = ctx.Process(target=_reader, name="judge-reader", daemon=True,
+                         args=(queues, xlsx_path, engine, fill_rule, use_cache, sheet, batch_rows))
+
+    processes = [p for p in (reader, validator) if p is not None]
+    for p in processes:
+        p.start()
+    try:
+        appearances = collect_appearances(_iter_queue_rows(aggregate_queue), with_rows)
+        validation = None
+        if result_queue is not None:
+            validation = result_queue.get()
+            if isinstance(validation, _Failure):
+                raise RuntimeError(f"{validation.stage}阶段出错: {validation.message}")
+        for p in processes:
+            p.join()
+    finally:
+        # 出错时下游不再消费，读取进程可能阻塞在满的队列上
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+                p.join()
+    return PipelineResult(appearances, validation)
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+抽样预览：工作表还在填写、行数很多时，几秒内给出每位老师所得金的估计值和 95% 置信区间
+
+    python cal.py calc --preview            默认用时约 DEFAULT_BUDGET 秒
+    python cal.py calc --preview 2 --seed 7 约 2 秒，固定随机种子（结果可重复）
+
+结果只是估计，写到 salary_preview.csv，不覆盖 salary_detail.csv / salary_summary.csv
+
+- 抽样单位是连续 BLOCK_ROWS 行的块（按行号划分）；全部块按行号顺序均分成 STRATA 层，
+  每层随机不放回地抽块（分层整群抽样），层与层轮流抽，到时间用完或全部抽完为止
+- 工作表 XML 解压到临时文件（deflate 不能随机访问，但解压远比解析快），
+  按行号二分查找块的字节位置，只解析抽中的块（与 salary_shards 使用同一段逐行代码）
+- 每层的估计：层内块数 × 抽中块的平均值；方差含有限总体校正，各层相加；
+  区间为正态近似的 ±1.96 倍标准误。每层至少抽 MIN_BLOCKS 块（不受时间限制），才能估计方差；
+  只抽到很少几块时方差本身估计得不准，区间偏窄
+- 全部块都抽到时结果就是精确值（区间为 0；按块求和，两位小数的最后一位可能与 calc 差 0.01）
+- 只有样本中出现过的老师才有估计；行没有 r 属性或行号不是升序时无法定位，改为读取全部行
+- 抽中的块里有没有缓存结果的 K/N 公式时，与 calc 一样计算（judge_formulas，在当前进程中扫描全表一次，
+  之后的块直接使用结果）；K/N 列确实为空的行按 0 计，并给出提示
+- 开始前解压工作表、读取 sharedStrings / 样式，以及需要时计算公式，耗时与整个工作表的大小成正比，
+  不能靠抽样缩短（这段时间计入用时，并占用 budget）；这些准备工作做完时已经超过 budget，
+  或者不能抽样、读取全部行超过 budget 时，抛出 PreviewOverBudget，不给出估计
+"""
+
+import mmap
+import random
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+from judge_loader import DEFAULT_FILL_RULE, parse_judge_rows, parse_teachers
+from judge_fastxml import RowOrderError, _CellConverter, iter_sheet_rows
+from judge_formulas import evaluate_uncached, fill_uncached_formulas, print_issues
+from salary_aggregate import collect_appearances, aggregate
+from salary_shards import Shard, _ROW_NUMBER, _ShardedSheet, _ShardReader
+from profiling import PROFILER
+
+PREVIEW_NAME = "salary_preview.csv"
+DEFAULT_BUDGET = 5.0
+
+BLOCK_ROWS = 64
+STRATA = 16
+MIN_BLOCKS = 2
+
+# 95% 置信区间的正态分位数
+Z_95 = 1.96
+
+# 每位老师估计的量：正确所得金、错误所得金、合计、正确题数、错误题数
+METRICS = ("回答正确所得金", "回答错误所得金", "所得金合计", "评价正确题数", "评价错误题数")
+
+
+class PreviewOverBudget(Exception):
+    """准备工作（解压工作表、计算公式、读取全部行）已经用完了预览的时间"""
+
+    def __init__(self, stage, elapsed, budget):
+        super().__init__(f"{stage}已用 {elapsed:.2f} 秒，超过预览的用时上限 {budget:g} 秒")
+        self.stage = stage
+        self.elapsed = elapsed
+        self.budget = budget
+
+
+def _check_budget(stage, started, budget):
+    elapsed = time.monotonic() - started
+    if elapsed >= budget:
+        raise PreviewOverBudget(stage, elapsed, budget)
+
+
+class PreviewResult(NamedTuple):
+    names: list             # 按姓名排序
+    estimates: np.ndarray   # (老师数, len(METRICS))
+    half_widths: np.ndarray # 95% 置信区间的半宽
+    rows_sampled: int
+    rows_total: int
+    blocks_sampled: int
+    blocks_total: int
+    strata: int
+    exact: bool
+    empty_amount_rows: int  # 样本中有老师但 K/N 为空的行
+    elapsed: float
+
+
+class _RowLocator:
+    """在解压后的工作表 XML 中按行号二分查找 <row> 的字节位置（要求行号升序）"""
+
+    def __init__(self, mm, data_start, data_end, row_open):
+        self.mm = mm
+        self.data_start = data_start
+        self.data_end = data_end
+        self.row_open = row_open
+
+    def next_row(self, pos):
+        mm, row_open = self.mm, self.row_open
+        while True:
+            pos = mm.find(row_open, pos, self.data_end)
+            if pos < 0 or mm[pos + len(row_open):pos + len(row_open) + 1] in (b" ", b">", b"\t", b"\r", b"\n"):
+                return pos
+            pos += 1
+
+    def row_number(self, pos):
+        m = _ROW_NUMBER.match(self.mm, pos)
+        if m is None:
+            raise RowOrderError(pos)
+        return int(m.group(1))
+
+    def last_row(self):
+        pos = self.mm.rfind(self.row_open, self.data_start, self.data_end)
+        while pos >= 0 and self.next_row(pos) != pos:
+            pos = self.mm.rfind(self.row_open, self.data_start, pos)
+        return None if pos < 0 else self.row_number(pos)
+
+    def offset_of(self, row):
+        """第一个行号 >= row 的 <row> 的位置，没有时为 sheetData 的结尾"""
+        lo, hi = self.data_start, self.data_end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = self.next_row(mid)
+            if pos < 0 or self.row_number(pos) >= row:
+                hi = mid
+            else:
+                lo = mid + 1
+        pos = self.next_row(lo)
+        return self.data_end if pos < 0 else pos
+
+
+def _block_vectors(rows):
+    """一块行 -> ({老师姓名: 各量的合计}, 行数, K/N 为空的行数)"""
+    rows = list(rows)
+    empty = sum(1 for r in rows
+                if (r.correct_per is None or r.wrong_per is None)
+                and (parse_teachers(r.passed) or parse_teachers(r.failed)))
+    totals = aggregate(collect_appearances(rows))
+    vectors = {}
+    for i, name in enumerate(totals.names):
+        c = float(totals.name_correct[i])
+        w = float(totals.name_wrong[i])
+        vectors[name] = (c, w, c + w, int(totals.name_correct_count[i]), int(totals.name_wrong_count[i]))
+    return vectors, len(rows), empty
+
+
+def _estimate(strata_blocks, strata_sizes):
+    """
+    strata_blocks[h]：第 h 层抽中各块的 {姓名: 向量}；strata_sizes[h]：第 h 层的总块数
+    返回 (姓名列表, 估计值, 95% 半宽)
+    """
+    names = sorted({name for blocks in strata_blocks for b in blocks for name in b})
+    index = {name: i for i, name in enumerate(names)}
+    total = np.zeros((len(names), len(METRICS)))
+    variance = np.zeros((len(names), len(METRICS)))
+    for blocks, size in zip(strata_blocks, strata_sizes):
+        m = len(blocks)
+        if not m:
+            continue
+        y = np.zeros((m, len(names), len(METRICS)))
+        for j, b in enumerate(blocks):
+            for name, vector in b.items():
+                y[j, index[name]] = vector
+        total += size * y.mean(axis=0)
+        if 1 < m < size:
+            variance += size * size * (1 - m / size) * y.var(axis=0, ddof=1) / m
+    return names, total, Z_95 * np.sqrt(variance)
+
+
+def _exact(xlsx_path, fill_rule, sheet, started, budget):
+    """不能按行号定位时：读取全部行，结果是精确值；超过 budget 时抛出 PreviewOverBudget"""
+    def budgeted(rows):
+        for i, r in enumerate(rows):
+            if i % BLOCK_ROWS == 0:
+                _check_budget("读取全部行", started, budget)
+            yield r
+
+    vectors, rows, empty = _block_vectors(budgeted(parse_judge_rows(xlsx_path, 'fast', fill_rule, sheet)))
+    names, estimates, half_widths = _estimate([[vectors]], [1])
+    return PreviewResult(names, estimates, half_widths, rows, rows, 1, 1, 1, True, empty,
+                         time.monotonic() - started)
+
+
+def preview(xlsx_path, budget=DEFAULT_BUDGET, fill_rule=DEFAULT_FILL_RULE, sheet=None, seed=None):
+    """
+    在约 budget 秒内抽样估计每位老师的所得金，返回 PreviewResult
+    准备工作用完 budget 时抛出 PreviewOverBudget
+    """
+    started = time.monotonic()
+    deadline = started + budget
+    rng = random.Random(seed)
+    with _ShardedSheet(xlsx_path, fill_rule, sheet, 1) as sharded:
+        plan, ctx = sharded.plan, sharded.context
+        _check_budget("解压工作表、读取共享字符串和样式", started, budget)
+        if plan is None:
+            print("工作表的行没有行号，无法抽样定位，改为读取全部行")
+            return _exact(xlsx_path, fill_rule, sheet, started, budget)
+        conv = _CellConverter(ctx.shared_strings, ctx.date_styles, ctx.timedelta_styles, ctx.date1904)
+        with open(plan.xml_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            ns_end = plan.prefix.rfind(b"sheetData")
+            ns = plan.prefix[plan.prefix.rfind(b"<", 0, ns_end) + 1:ns_end]
+            locator = _RowLocator(mm, len(plan.prefix), len(mm) - len(plan.suffix), b"<" + ns + b"row")
+            try:
+                last = locator.last_row()
+            except RowOrderError:
+                last = None
+            if last is None or last < 2:
+                print("工作表没有数据行或行没有行号，改为读取全部行")
+                return _exact(xlsx_path, fill_rule, sheet, started, budget)
+            if plan.max_row is not None:
+                last = min(last, plan.max_row)
+
+            n_blocks = (last - 1 + BLOCK_ROWS - 1) // BLOCK_ROWS
+            n_strata = min(STRATA, n_blocks)
+            bounds = [n_blocks * h // n_strata for h in range(n_strata + 1)]
+            queues = []
+            for h in range(n_strata):
+                blocks = list(range(bounds[h], bounds[h + 1]))
+                rng.shuffle(blocks)
+                queues.append(blocks)
+            sizes = [len(q) for q in queues]
+            formulas = []
+
+            def fill(rows):
+                """抽中的块有没有缓存结果的公式时，第一次需要时计算全表，之后复用"""
+                rows = list(rows)
+                if any(r.uncached_formula for r in rows):
+                    if not formulas:
+                        with PROFILER.phase("evaluate_formulas"):
+                            formulas.append(evaluate_uncached(xlsx_path, sheet))
+                        print_issues(formulas[0])
+                        _check_budget("计算全表没有缓存值的公式", started, budget)
+                    rows = list(fill_uncached_formulas(rows, xlsx_path, sheet, result=formulas[0]))
+                return rows
+
+            def read_block(block):
+                first = 2 + block * BLOCK_ROWS
+                stop = min(first + BLOCK_ROWS, last + 1)
+                start = locator.offset_of(first)
+                end = locator.offset_of(stop) if stop <= last else locator.data_end
+                src = _ShardReader(plan, Shard(start, end, first, stop))
+                try:
+                    return _block_vectors(fill(iter_sheet_rows(src, conv, ctx.colored, ctx.other_filled,
+                                                               plan.max_row, first=first, stop=stop)))
+                finally:
+                    src.close()
+
+            sampled = [[] for _ in range(n_strata)]
+            rows_sampled = empty = 0
+            try:
+                with PROFILER.phase("preview_sample") as ph:
+                    first_round = True
+                    while any(queues):
+                        for h, queue in enumerate(queues):
+                            for _ in range(MIN_BLOCKS if first_round else 1):
+                                if not queue or (not first_round and time.monotonic() >= deadline):
+                                    break
+                                vectors, n, e = read_block(queue.pop())
+                                sampled[h].append(vectors)
+                                rows_sampled += n
+                                empty += e
+                        first_round = False
+                        if time.monotonic() >= deadline:
+                            break
+                    ph.rows = rows_sampled
+            except RowOrderError:
+                print("工作表的行号不是升序，无法抽样定位，改为读取全部行")
+                return _exact(xlsx_path, fill_rule, sheet, started, budget)
+
+    names, estimates, half_widths = _estimate(sampled, sizes)
+    blocks_sampled = sum(len(s) for s in sampled)
+    return PreviewResult(names, estimates, half_widths, rows_sampled, last - 1, blocks_sampled, n_blocks,
+                         n_strata, blocks_sampled == n_blocks, empty, time.monotonic() - started)
+
+
+def _format(value, half_width, count):
+    if count:
+        if half_width == 0 and float(value).is_integer():
+            return f"{value:.0f}", "0"
+        return f"{value:.1f}", f"{half_width:.1f}"
+    return f"{value:.2f}", f"{half_width:.2f}"
+
+
+def print_preview(result):
+    """在终端输出估计结果"""
+    print("\n" + "="*80)
+    if result.exact:
+        print(f"预览：已读完全部 {result.rows_total} 行，以下为精确值")
+    else:
+        share = result.rows_sampled / result.rows_total if result.rows_total else 0.0
+        print(f"预览（抽样估计，不是最终结果）：抽样 {result.rows_sampled} / {result.rows_total} 行（{share:.1%}），"
+              f"{result.blocks_sampled} / {result.blocks_total} 块，分 {result.strata} 层")
+        print("括号内为 95% 置信区间的半宽；样本中没有出现的老师不在表中")
+    print(f"用时 {result.elapsed:.2f} 秒")
+    print("="*80)
+    for i, name in enumerate(result.names):
+        parts = []
+        for k, label in enumerate(METRICS):
+            value, half = _format(result.estimates[i, k], result.half_widths[i, k], k >= 3)
+            parts.append(f"{label} {value}" + ("" if result.exact else f"（±{half}）"))
+        print(f"{name}: " + "，".join(parts))
+    if result.empty_amount_rows:
+        print(f"\n提示：样本中有 {result.empty_amount_rows} 行有评审老师但 K/N 列为空，按 0 计算")
+
+
+def write_preview_csv(result, path):
+    """写入 salary_preview.csv：每个量一列估计值、一列 95% 半宽"""
+    header = ["老师"]
+    for label in METRICS:
+        header += [f"{label}(估计)", f"{label}(±95%)"]
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        f.write(",".join(header) + "\n")
+        for i, name in enumerate(result.names):
+            fields = [name]
+            for k in range(len(METRICS)):
+                fields += _format(result.estimates[i, k], result.half_widths[i, k], k >= 3)
+            f.write(",".join(fields) + "\n")
+
+
+def add_preview_arguments(parser):
+    """--preview [SECONDS] / --seed"""
+    parser.add_argument("--preview", nargs="?", type=float, const=DEFAULT_BUDGET, metavar="SECONDS",
+                        help=f"抽样预览：约 SECONDS 秒（默认 {DEFAULT_BUDGET:g}）内估计每位老师的所得金和置信区间，"
+                             f"写到 {PREVIEW_NAME}（见 salary_preview）")
+    parser.add_argument("--seed", type=int, help="配合 --preview，固定抽样的随机种子")
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+历史所得金汇总库（SQLite）：每次计算把本批次的汇总结果存一份，
+季度、年度等任意日期范围的合计直接合并库中的各批次结果，不必重新解析旧的 judge.xlsx
+
+    python cal.py calc --rollup payroll.sqlite --batch-date 2024-03-15
+    python cal.py batch 批次目录/ --rollup payroll.sqlite --batch-date 2024-03-31   # 每个工作簿记为一个批次
+    python cal.py rollup --rollup payroll.sqlite --from 2024-01-01 --to 2024-03-31
+
+每个批次只保存每个老师-ID / 老师姓名的正确、错误金额与题数，与处理过的行数无关；
+同一个批次名称（默认为「工作簿的绝对路径@批次日期」）再次写入时替换旧数据，不会重复计入；
+每月沿用同一个文件名时，不同日期的批次各自保留
+写入汇总库时必须指定 --batch-date 或 --batch-label：批次日期不再默认取工作簿的修改日期——
+同一期的工作簿改过后重新保存，修改日期变了，会成为另一个批次，与旧批次重复计入
+查询时按 (批次日期, 批次编号) 的顺序依次累加，结果确定
+"""
+
+import sqlite3
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+
+from salary_aggregate import SalaryTotals, merge_totals
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id          INTEGER PRIMARY KEY,
+    label       TEXT NOT NULL UNIQUE,
+    batch_date  TEXT NOT NULL,          -- YYYY-MM-DD
+    source      TEXT,
+    recorded_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS batches_by_date ON batches (batch_date);
+
+CREATE TABLE IF NOT EXISTS id_totals (
+    batch_id      INTEGER NOT NULL REFERENCES batches (id) ON DELETE CASCADE,
+    teacher_id    TEXT NOT NULL,
+    correct       REAL NOT NULL,
+    wrong         REAL NOT NULL,
+    correct_count INTEGER NOT NULL,
+    wrong_count   INTEGER NOT NULL,
+    PRIMARY KEY (batch_id, teacher_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS name_totals (
+    batch_id      INTEGER NOT NULL REFERENCES batches (id) ON DELETE CASCADE,
+    name          TEXT NOT NULL,
+    correct       REAL NOT NULL,
+    wrong         REAL NOT NULL,
+    correct_count INTEGER NOT NULL,
+    wrong_count   INTEGER NOT NULL,
+    PRIMARY KEY (batch_id, name)
+) WITHOUT ROWID;
+"""
+
+
+def open_store(path):
+    """打开（必要时创建）汇总库"""
+    conn = sqlite3.connect(str(path))
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def parse_date(value):
+    """'2024-03-15' -> date；格式不对时抛出 ValueError"""
+    return date.fromisoformat(value)
+
+
+def record_batch(conn, label, batch_date, totals, source=None):
+    """写入（或替换）一个批次的汇总结果，返回批次编号"""
+    with conn:
+        conn.execute("DELETE FROM batches WHERE label = ?", (label,))
+        cur = conn.execute(
+            "INSERT INTO batches (label, batch_date, source, recorded_at) VALUES (?, ?, ?, ?)",
+            (label, batch_date.isoformat(), source, datetime.now().isoformat(timespec="seconds")))
+        batch_id = cur.lastrowid
+        conn.executemany(
+            "INSERT INTO id_totals VALUES (?, ?, ?, ?, ?, ?)",
+            zip([batch_id] * len(totals.ids), totals.ids,
+                totals.id_correct.tolist(), totals.id_wrong.tolist(),
+                totals.id_correct_count.tolist(), totals.id_wrong_count.tolist()))
+        conn.executemany(
+            "INSERT INTO name_totals VALUES (?, ?, ?, ?, ?, ?)",
+            zip([batch_id] * len(totals.names), totals.names,
+                totals.name_correct.tolist(), totals.name_wrong.tolist(),
+                totals.name_correct_count.tolist(), totals.name_wrong_count.tolist()))
+    return batch_id
+
+
+def list_batches(conn, start=None, end=None):
+    """日期在 [start, end] 内的批次：[(编号, 名称, 日期, 来源), ...]，按日期、编号排序"""
+    sql = "SELECT id, label, batch_date, source FROM batches"
+    where, params = [], []
+    if start is not None:
+        where.append("batch_date >= ?")
+        params.append(start.isoformat())
+    if end is not None:
+        where.append("batch_date <= ?")
+        params.append(end.isoformat())
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return conn.execute(sql + " ORDER BY batch_date, id", params).fetchall()
+
+
+def load_batch(conn, batch_id):
+    """读出一个批次的 SalaryTotals"""
+    def table(sql):
+        rows = conn.execute(sql, (batch_id,)).fetchall()
+        keys = [r[0] for r in rows]
+        return (keys,
+                np.array([r[1] for r in rows], dtype=np.float64),
+                np.array([r[2] for r in rows], dtype=np.float64),
+                np.array([r[3] for r in rows], dtype=np.int64),
+                np.array([r[4] for r in rows], dtype=np.int64))
+
+    return SalaryTotals(
+        *table("SELECT teacher_id, correct, wrong, correct_count, wrong_count "
+               "FROM id_totals WHERE batch_id = ? ORDER BY teacher_id"),
+        *table("SELECT name, correct, wrong, correct_count, wrong_count "
+               "FROM name_totals WHERE batch_id = ? ORDER BY name"))
+
+
+def query_range(conn, start=None, end=None):
+    """合并日期范围内全部批次，返回 (批次列表, SalaryTotals)"""
+    batches = list_batches(conn, start, end)
+    return batches, merge_totals([load_batch(conn, b[0]) for b in batches])
+
+
+def add_rollup_arguments(parser):
+    """给 argparse 解析器加上 --rollup / --batch-date / --batch-label 选项"""
+    parser.add_argument("--rollup", type=Path, metavar="DB",
+                        help="把本次结果作为一个批次写入 SQLite 汇总库")
+    parser.add_argument("--batch-date", type=parse_date, metavar="YYYY-MM-DD",
+                        help="批次日期；写入汇总库时必须指定它或 --batch-label"
+                             "（只指定 --batch-label 时为工作簿的修改日期）")
+    parser.add_argument("--batch-label",
+                        help="批次名称，同名批次再次写入时替换（默认：工作簿的绝对路径@批次日期）")
+
+
+def check_rollup_arguments(parser, args):
+    """--rollup 需要 --batch-date 或 --batch-label；后两者只在指定了 --rollup 时有效；否则 parser.error 退出"""
+    if getattr(args, "rollup", None):
+        if args.batch_date is None and args.batch_label is None:
+            parser.error("--rollup 需要指定 --batch-date（同一日期再次写入时替换）或 --batch-label，"
+                         "以免同一期的数据重新保存后被重复计入")
+        return
+    given = [option for option, value in (("--batch-date", getattr(args, "batch_date", None)),
+                                          ("--batch-label", getattr(args, "batch_label", None)))
+             if value is not None]
+    if given:
+        parser.error(f"{' / '.join(given)} 需要配合 --rollup 使用")
+
+
+def record_from_args(args, xlsx_path, totals):
+    """根据命令行参数把一个工作簿的结果写入汇总库"""
+    if not args.rollup:
+        return
+    xlsx_path = Path(xlsx_path).resolve()
+    batch_date = args.batch_date or date.fromtimestamp(xlsx_path.stat().st_mtime)
+    label = args.batch_label or f"{xlsx_path}@{batch_date.isoformat()}"
+    conn = open_store(args.rollup)
+    try:
+        record_batch(conn, label, batch_date, totals, source=str(xlsx_path))
+    finally:
+        conn.close()
+    print(f"已写入汇总库 {args.rollup}：批次 {label}（{batch_date}）")
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+监视模式：常驻进程监视 judge.xlsx，文件保存后自动重新计算，
+汇总结果常驻内存，通过本机 HTTP/JSON 接口查询
+
+    python cal.py serve                       默认 http://127.0.0.1:8000/
+    python cal.py serve --port 8080 --debounce 2
+
+接口（GET，返回 JSON；金额与 CSV 一样保留两位小数）：
+    /teachers               全部老师-ID 的明细（按老师-ID 排序）
+    /teachers/<老师-ID>      单个老师-ID
+    /names                  全部老师姓名的汇总（按姓名排序）
+    /names/<老师姓名>        单个老师姓名
+    /top?n=10&by=id|name    所得金合计最高的 n 个老师-ID（by=name 时为老师姓名）
+    /status                 当前结果的版本、计算时间、行数，以及最近一次重新计算的错误
+
+- 每隔 interval 秒比较一次文件的大小和修改时间；发生变化后要等到文件连续 debounce 秒
+  不再变化才重新计算（Excel 保存时会多次写文件）
+- 重新计算在后台线程中进行，完成后整体替换内存中的快照；计算期间和计算失败时
+  （如文件正在写入、暂时不是完整的 xlsx）继续用旧结果回答查询
+- 快照中按老师-ID / 姓名建好字典、排好 top 顺序，列表接口的 JSON 预先编码好，
+  查询只做字典查找，不重新解析
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from judge_loader import DEFAULT_FILL_RULE, iter_judge_rows, extract_teacher_name
+from salary_aggregate import collect_appearances, aggregate, detail_rows, summary_rows
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_INTERVAL = 0.5
+DEFAULT_DEBOUNCE = 1.0
+DEFAULT_TOP = 10
+
+
+def _cents(value):
+    """与 CSV 相同的两位小数"""
+    return float(f"{value:.2f}")
+
+
+def _encode(obj):
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+class Snapshot:
+    """一次计算结果（只读）：按键查找的字典、按合计降序的顺序、预先编码的列表"""
+
+    def __init__(self, totals, rows, stamp, version, elapsed):
+        self.version = version
+        self.computed_at = datetime.now().isoformat(timespec="seconds")
+        self.rows = rows
+        self.stamp = stamp
+        self.elapsed = elapsed
+
+        id_counts = dict(zip(totals.ids, zip(totals.id_correct_count.tolist(),
+                                             totals.id_wrong_count.tolist())))
+        self.teachers = {}
+        for t, c, w in detail_rows(totals):
+            cc, wc = id_counts[t]
+            self.teachers[t] = {
+                'teacher_id': t, 'name': extract_teacher_name(t),
+                'correct': _cents(c), 'wrong': _cents(w), 'total': _cents(c + w),
+                'correct_count': cc, 'wrong_count': wc,
+            }
+        self.names = {}
+        for name, c, w, cc, wc in summary_rows(totals):
+            self.names[name] = {
+                'name': name,
+                'correct': _cents(c), 'wrong': _cents(w), 'total': _cents(c + w),
+                'correct_count': cc, 'wrong_count': wc, 'total_count': cc + wc,
+            }
+
+        def by_total(records):
+            return sorted(records.values(), key=lambda r: -r['total'])   # 稳定排序，同额按键
+
+        self.top = {'id': by_total(self.teachers), 'name': by_total(self.names)}
+        self.teachers_json = _encode(list(self.teachers.values()))
+        self.names_json = _encode(list(self.names.values()))
+
+    def status(self):
+        return {
+            'version': self.version,
+            'computed_at': self.computed_at,
+            'rows': self.rows,
+            'teachers': len(self.teachers),
+            'names': len(self.names),
+            'elapsed_seconds': round(self.elapsed, 3),
+            'source_size': self.stamp[0],
+            'source_mtime_ns': self.stamp[1],
+        }
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class PayrollService:
+    """持有当前快照，并在后台线程中监视工作簿、按需重新计算"""
+
+    def __init__(self, xlsx_path, engine='openpyxl', fill_rule=DEFAULT_FILL_RULE, use_cache=True,
+                 interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE):
+        self.xlsx_path = xlsx_path
+        self.engine = engine
+        self.fill_rule = fill_rule
+        self.use_cache = use_cache
+        self.interval = interval
+        self.debounce = debounce
+        self.snapshot = None        # 整体替换，读取方无需加锁
+        self.last_error = None
+        self._version = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """重新计算并替换快照；失败时保留旧快照，返回是否成功"""
+        stamp = _file_stamp(self.xlsx_path)
+        start = time.perf_counter()
+        try:
+            rows = iter_judge_rows(self.xlsx_path, engine=self.engine, fill_rule=self.fill_rule,
+                                   use_cache=self.use_cache)
+            appearances = collect_appearances(rows)
+            totals = aggregate(appearances)
+        except Exception as e:
+            self.last_error = {'at': datetime.now().isoformat(timespec="seconds"),
+                               'error': f"{type(e).__name__}: {e}"}
+            print(f"[{self.last_error['at']}] 重新计算失败，继续使用旧结果: {self.last_error['error']}")
+            return False
+        self._version += 1
+        self.snapshot = Snapshot(totals, appearances.rows, stamp, self._version,
+                                 time.perf_counter() - start)
+        self.last_error = None
+        print(f"[{self.snapshot.computed_at}] 第 {self._version} 版：{appearances.rows} 行，"
+              f"{len(totals.ids)} 个老师-ID，{len(totals.names)} 位老师（{self.snapshot.elapsed:.2f} 秒）")
+        return True
+
+    def _watch(self):
+        seen = self.snapshot.stamp if self.snapshot else None
+        while not self._stop.wait(self.interval):
+            stamp = _file_stamp(self.xlsx_path)
+            if stamp is None or stamp == seen:
+                continue
+            # 防抖：文件连续 debounce 秒不再变化才重新计算
+            settled_at = time.monotonic()
+            while not self._stop.wait(self.interval):
+                current = _file_stamp(self.xlsx_path)
+                if current != stamp:
+                    stamp, settled_at = current, time.monotonic()
+                elif time.monotonic() - settled_at >= self.debounce:
+                    break
+            if self._stop.is_set():
+                return
+            if stamp is None:
+                continue
+            seen = stamp
+            self.refresh()
+
+    def start(self):
+        """先计算一次，再启动监视线程"""
+        self.refresh()
+        self._thread = threading.Thread(target=self._watch, name="judge-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def make_handler(service):
+    """生成绑定到 service 的请求处理类"""
+
+    class Handler(BaseHTTPRequestHandler):
+        server_version = "judge-salary"
+
+        def _send(self, status, body):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status, message):
+            self._send(status, _encode({'error': message}))
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parts = [unquote(p) for p in url.path.split("/") if p]
+            snapshot = service.snapshot     # 本次请求始终使用同一个快照
+
+            if parts == ["status"]:
+                body = snapshot.status() if snapshot else {'version': 0}
+                body['last_error'] = service.last_error
+                body['source'] = str(service.xlsx_path)
+                return self._send(HTTPStatus.OK, _encode(body))
+            if snapshot is None:
+                return self._error(HTTPStatus.SERVICE_UNAVAILABLE, "还没有计算结果")
+
+            if parts == ["teachers"]:
+                return self._send(HTTPStatus.OK, snapshot.teachers_json)
+            if parts == ["names"]:
+                return self._send(HTTPStatus.OK, snapshot.names_json)
+            if len(parts) == 2 and parts[0] in ("teachers", "names"):
+                records = snapshot.teachers if parts[0] == "teachers" else snapshot.names
+                record = records.get(parts[1])
+                if record is None:
+                    return self._error(HTTPStatus.NOT_FOUND, f"没有找到 {parts[1]}")
+                return self._send(HTTPStatus.OK, _encode(record))
+            if parts == ["top"]:
+                query = parse_qs(url.query)
+                by = query.get("by", ["id"])[0]
+                try:
+                    n = int(query.get("n", [DEFAULT_TOP])[0])
+                except ValueError:
+                    return self._error(HTTPStatus.BAD_REQUEST, "n 必须是整数")
+                if by not in snapshot.top or n < 0:
+                    return self._error(HTTPStatus.BAD_REQUEST, "by 只能是 id 或 name，n 不能为负")
+                return self._send(HTTPStatus.OK, _encode(snapshot.top[by][:n]))
+            return self._error(HTTPStatus.NOT_FOUND, "未知的接口")
+
+        def log_message(self, format, *args):
+            pass    # 不逐条打印请求
+
+    return Handler
+
+
+def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """启动监视线程和 HTTP 服务，直到 Ctrl+C"""
+    service.start()
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"正在监视 {service.xlsx_path}，查询接口: http://{host}:{server.server_address[1]}/ （Ctrl+C 退出）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n已停止")
+    finally:
+        server.server_close()
+        service.stop()
@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+"""
+单个工作表的分片并行：一个工作表有上百万行时，把它的行按行号切成连续的若干片，
+由多个工作进程同时解析、汇总
+
+    python cal.py calc --shards           分片数 = CPU 核数
+    python cal.py verify --shards 8       verify / check-count / compare-ids 同样可以分片解析
+
+- 主进程只读一次 sharedStrings.xml 和 styles.xml（样式预先分类），
+  通过进程池的 initializer 交给每个工作进程，工作进程不再各自读取
+- 工作表 XML 先解压到临时文件；按字节大致均分，在每个切分点之后的第一个 <row> 处切开，
+  每片是「文件开头到 <sheetData> + 这段 <row> + </sheetData> 到文件结尾」，
+  由 judge_fastxml 的同一段逐行代码解析，只产出该片行号范围内的行（缺失的行同样补空行）
+- calc：每片在工作进程中 collect_appearances，主进程按片的顺序拼接
+  （老师-ID / 姓名的编码按首次出现顺序重新编号），与逐行处理得到的数组完全相同，
+  再用同一个 aggregate 汇总，写出的 CSV 逐字节一致
+  （各片只交回「老师出现一次」的扁平数组而不是各自的合计：浮点合计与累加顺序有关，
+  分片各自求和再相加，结果可能在最后一位上不同）
+- verify / check-count / compare-ids：每片解析成行后交回主进程，按片的顺序产出
+- 行没有 r 属性、行号不是升序、工作表没有行时，自动改为逐行解析整个工作表
+- 分片直接解析工作簿，不读写 .judge_cache/ 中的解析缓存；使用 fast 引擎的解析代码
+  （与 openpyxl 引擎逐行一致）
+"""
+
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from judge_loader import DEFAULT_FILL_RULE, JudgeRow, parse_judge_rows
+from judge_fastxml import (RowOrderError, _CellConverter, _max_row_from_dimension, _sheet_path,
+                           iter_sheet_rows, read_shared_strings, read_styles)
+from judge_formulas import FormulaResult, evaluate_uncached, fill_uncached_formulas, print_issues
+from salary_aggregate import Appearances, collect_appearances
+from profiling import PROFILER
+
+# 逐行模式（verify 等）每个工作进程分几片：片小一些，主进程同时持有的行就少
+ROW_SHARDS_PER_JOB = 4
+
+_SHEET_DATA_OPEN = re.compile(rb"<((?:[\w.-]+:)?)sheetData(?:\s[^>]*)?(/?)>")
+_ROW_NUMBER = re.compile(rb"<(?:[\w.-]+:)?row\b[^>]*?\sr=\"(\d+)\"")
+
+
+class Shard(NamedTuple):
+    start: int          # <row> 在解压后的 XML 中的字节偏移
+    end: int
+    first: int          # 本片的行号范围 [first, stop)
+    stop: object        # 最后一片为 None
+
+
+class ShardPlan(NamedTuple):
+    xml_path: str       # 解压后的工作表 XML
+    prefix: bytes       # 文件开头到 <sheetData ...>
+    suffix: bytes       # </sheetData> 到文件结尾
+    shards: list
+    max_row: object
+
+
+class _Context(NamedTuple):
+    """工作进程共用的只读数据，每个进程只传一次"""
+    xlsx_path: str
+    sheet: object
+    plan: ShardPlan
+    shared_strings: list
+    colored: frozenset
+    other_filled: frozenset
+    date_styles: frozenset
+    timedelta_styles: frozenset
+    date1904: bool
+
+
+def default_jobs(jobs=None):
+    return jobs or os.cpu_count() or 1
+
+
+def plan_shards(xml_path, count, max_row):
+    """
+    在解压后的工作表 XML 中找出 count 个切分点，返回 ShardPlan；
+    不能按行号分片（没有行、行没有 r 属性、行号不是升序）时返回 None
+    """
+    with open(xml_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        m = _SHEET_DATA_OPEN.search(mm)
+        if m is None or m.group(2):
+            return None
+        ns = m.group(1)
+        data_start = m.end()
+        data_end = mm.rfind(b"</" + ns + b"sheetData>")
+        if data_end < data_start:
+            return None
+        row_open = b"<" + ns + b"row"
+
+        def next_row(pos):
+            while True:
+                pos = mm.find(row_open, pos, data_end)
+                if pos < 0 or mm[pos + len(row_open):pos + len(row_open) + 1] in (b" ", b">", b"\t", b"\r", b"\n"):
+                    return pos
+                pos += 1
+
+        starts = []
+        step = (data_end - data_start) / count
+        for i in range(count):
+            pos = next_row(data_start + int(i * step))
+            if pos < 0:
+                break
+            if not starts or pos > starts[-1]:
+                starts.append(pos)
+        if not starts:
+            return None
+
+        numbers = []
+        for pos in starts:
+            m = _ROW_NUMBER.match(mm, pos)
+            if m is None:
+                return None
+            numbers.append(int(m.group(1)))
+        if numbers != sorted(set(numbers)):
+            return None
+
+        bounds = [2] + numbers[1:]
+        if max_row is not None:
+            bounds = [min(b, max_row + 1) for b in bounds]
+        shards = []
+        for i, pos in enumerate(starts):
+            last = i == len(starts) - 1
+            shards.append(Shard(pos, data_end if last else starts[i + 1], bounds[i],
+                                None if last else bounds[i + 1]))
+        return ShardPlan(xml_path, bytes(mm[:data_start]), bytes(mm[data_end:]), shards, max_row)
+
+
+class _ShardReader:
+    """把 prefix + XML 中 [start, end) 的字节 + suffix 当作一个文件读出"""
+
+    def __init__(self, plan, shard):
+        self._parts = [plan.prefix, None, plan.suffix]
+        self._file = open(plan.xml_path, "rb")
+        self._file.seek(shard.start)
+        self._left = shard.end - shard.start
+        self._part = 0
+
+    def read(self, size=-1):
+        size = 1 << 16 if size is None or size < 0 else size
+        while self._part < 3:
+            if self._part == 1:
+                if self._left:
+                    data = self._file.read(min(size, self._left))
+                    self._left -= len(data)
+                    if data:
+                        return data
+                self._part += 1
+                continue
+            data = self._parts[self._part]
+            self._part += 1
+            if data:
+                return data
+        return b""
+
+    def close(self):
+        self._file.close()
+
+
+_context = None
+
+
+def _init_worker(context):
+    global _context
+    _context = context
+
+
+# 工作进程的返回值：这一片有没有缓存值的公式，需要主进程先计算
+NEEDS_FORMULAS = "needs_formulas"
+
+
+class _NeedsFormulas(Exception):
+    pass
+
+
+def _shard_rows(shard):
+    ctx = _context
+    conv = _CellConverter(ctx.shared_strings, ctx.date_styles, ctx.timedelta_styles, ctx.date1904)
+    src = _ShardReader(ctx.plan, shard)
+    try:
+        yield from iter_sheet_rows(src, conv, ctx.colored, ctx.other_filled, ctx.plan.max_row,
+                                   first=shard.first, stop=shard.stop)
+    finally:
+        src.close()
+
+
+def _no_uncached(rows):
+    for r in rows:
+        if r.uncached_formula:
+            raise _NeedsFormulas()
+        yield r
+
+
+def _run_appearances(shard, formulas=None, with_rows=False):
+    """
+    工作进程：解析一片并展开成「老师出现一次」的扁平数组
+    formulas 为 None 时遇到没有缓存值的公式返回 NEEDS_FORMULAS（由主进程计算一次后带着结果重做）；
+    行号不属于这一片时返回 None
+    """
+    rows = _shard_rows(shard)
+    try:
+        if formulas is None:
+            return collect_appearances(_no_uncached(rows), with_rows)
+        return collect_appearances(fill_uncached_formulas(rows, _context.xlsx_path, _context.sheet,
+                                                          result=formulas), with_rows)
+    except _NeedsFormulas:
+        return NEEDS_FORMULAS
+    except RowOrderError:
+        return None
+
+
+def _run_rows(shard):
+    """工作进程：解析一片，返回行元组列表（公式由主进程统一计算）；行号不属于这一片时返回 None"""
+    try:
+        return [tuple(r) for r in _shard_rows(shard)]
+    except RowOrderError:
+        return None
+
+
+def _formulas_for(result, shard):
+    """只把这一片行号范围内的计算结果交给工作进程"""
+    stop = shard.stop
+    values = {row: v for row, v in result.values.items() if row >= shard.first and (stop is None or row < stop)}
+    return FormulaResult(values, result.evaluated, [])
+
+
+def merge_appearances(parts):
+    """
+    按片的顺序拼接各片的 Appearances：老师-ID / 姓名按全局首次出现的顺序重新编号，
+    结果与对整个工作表调用一次 collect_appearances 完全相同；各片都带有行信息时才拼接行信息
+    """
+    index = {}
+    ids = []
+    name_index = {}
+    names = []
+    id_name = []
+    codes, correct, amount = [], [], []
+    with_rows = all(p.row_numbers is not None for p in parts)
+    row_index, row_numbers, problem_ids = [], [], []
+    offset = 0
+    for p in parts:
+        id_map = np.empty(len(p.ids), dtype=np.int64)
+        local_names = p.id_name.tolist()
+        for local, t in enumerate(p.ids):
+            code = index.get(t)
+            if code is None:
+                code = index[t] = len(ids)
+                ids.append(t)
+                name = p.names[local_names[local]]
+                name_code = name_index.get(name)
+                if name_code is None:
+                    name_code = name_index[name] = len(names)
+                    names.append(name)
+                id_name.append(name_code)
+            id_map[local] = code
+        codes.append(id_map[p.codes])
+        correct.append(p.correct)
+        amount.append(p.amount)
+        if with_rows:
+            row_index.append(p.row_index + offset)
+            row_numbers.append(p.row_numbers)
+            problem_ids.extend(p.problem_ids)
+            offset += len(p.row_numbers)
+    app = Appearances(
+        ids=ids,
+        names=names,
+        id_name=np.array(id_name, dtype=np.int64),
+        codes=np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64),
+        correct=np.concatenate(correct) if correct else np.zeros(0, dtype=bool),
+        amount=np.concatenate(amount) if amount else np.zeros(0),
+        rows=sum(p.rows for p in parts),
+        skipped=sum(p.skipped for p in parts),
+    )
+    if not with_rows:
+        return app
+    return app._replace(
+        row_index=np.concatenate(row_index) if row_index else np.zeros(0, dtype=np.int64),
+        row_numbers=np.concatenate(row_numbers) if row_numbers else np.zeros(0, dtype=np.int64),
+        problem_ids=problem_ids,
+    )
+
+
+class _ShardedSheet:
+    """解压工作表、读取共享字符串和样式、规划分片；with 结束时删除临时文件"""
+
+    def __init__(self, xlsx_path, fill_rule, sheet, count):
+        self.xlsx_path = str(xlsx_path)
+        self.fill_rule = fill_rule
+        self.sheet = sheet
+        self.count = count
+
+    def __enter__(self):
+        self._tmp = tempfile.TemporaryDirectory(prefix="judge_shards_")
+        try:
+            with zipfile.ZipFile(self.xlsx_path) as archive:
+                with PROFILER.phase('read_shared_strings'):
+                    shared_strings = read_shared_strings(archive)
+                with PROFILER.phase('classify_styles'):
+                    colored, other_filled, date_styles, timedelta_styles = read_styles(archive, self.fill_rule)
+                sheet_path, date1904 = _sheet_path(archive, self.sheet)
+                max_row = _max_row_from_dimension(archive, sheet_path)
+                xml_path = os.path.join(self._tmp.name, "sheet.xml")
+                with PROFILER.phase('plan_shards'):
+                    with archive.open(sheet_path) as src, open(xml_path, "wb") as dst:
+                        shutil.copyfileobj(src, dst, 1 << 20)
+                    plan = plan_shards(xml_path, self.count, max_row) if os.path.getsize(xml_path) else None
+        except BaseException:
+            self._tmp.cleanup()
+            raise
+        self.plan = plan
+        self.context = None if plan is None else _Context(
+            self.xlsx_path, self.sheet, plan, shared_strings, frozenset(colored), frozenset(other_filled),
+            frozenset(date_styles), frozenset(timedelta_styles), date1904)
+        return self
+
+    def __exit__(self, *exc):
+        self._tmp.cleanup()
+        return False
+
+    def pool(self, jobs):
+        return ProcessPoolExecutor(max_workers=min(jobs, len(self.plan.shards)),
+                                   initializer=_init_worker, initargs=(self.context,))
+
+
+def collect_appearances_sharded(xlsx_path, fill_rule=DEFAULT_FILL_RULE, sheet=None, jobs=None, with_rows=False):
+    """
+    分片并行解析并展开工作表，返回与 collect_appearances(整个工作表) 相同的 Appearances
+    不能分片时在当前进程中逐行处理
+    """
+    jobs = default_jobs(jobs)
+    with _ShardedSheet(xlsx_path, fill_rule, sheet, jobs) as sharded:
+        if sharded.plan is not None and len(sharded.plan.shards) > 1:
+            shards = sharded.plan.shards
+            with sharded.pool(jobs) as pool:
+                results = list(pool.map(_run_appearances, shards, [None] * len(shards),
+                                        [with_rows] * len(shards)))
+                redo = [i for i, parts in enumerate(results) if parts == NEEDS_FORMULAS]
+                if redo and all(parts is not None for parts in results):
+                    # 公式只在主进程中计算一次，再把结果交给需要的片重做
+                    with PROFILER.phase("evaluate_formulas"):
+                        formulas = evaluate_uncached(xlsx_path, sheet)
+                    print_issues(formulas)
+                    again = pool.map(_run_appearances, [shards[i] for i in redo],
+                                     [_formulas_for(formulas, shards[i]) for i in redo],
+                                     [with_rows] * len(redo))
+                    for i, parts in zip(redo, again):
+                        results[i] = parts
+            if all(parts is not None for parts in results):
+                with PROFILER.phase('merge_shards'):
+                    return merge_appearances(results)
+            print("行号不是升序，无法分片，改为逐行解析")
+    return collect_appearances(parse_judge_rows(xlsx_path, 'fast', fill_rule, sheet), with_rows)
+
+
+def iter_judge_rows_sharded(xlsx_path, fill_rule=DEFAULT_FILL_RULE, sheet=None, jobs=None):
+    """
+    分片并行解析工作表，按行号顺序产出与 iter_judge_rows 相同的 JudgeRow
+    主进程最多同时持有 jobs + 1 片的行
+    """
+    jobs = default_jobs(jobs)
+    with _ShardedSheet(xlsx_path, fill_rule, sheet, jobs * ROW_SHARDS_PER_JOB) as sharded:
+        if sharded.plan is None or len(sharded.plan.shards) <= 1:
+            yield from parse_judge_rows(xlsx_path, 'fast', fill_rule, sheet)
+            return
+        # 没有缓存值的公式在主进程中计算一次
+        yield from fill_uncached_formulas(_iter_shard_rows(sharded, jobs), xlsx_path, sheet)
+
+
+def _iter_shard_rows(sharded, jobs):
+    make = JudgeRow._make
+    with sharded.pool(jobs) as pool:
+        shards = iter(sharded.plan.shards)
+        pending = deque(pool.submit(_run_rows, s) for s in _take(shards, jobs + 1))
+        while pending:
+            rows = pending.popleft().result()
+            if rows is None:
+                # 前面的片可能已经产出，无法再改为逐行解析
+                raise RowOrderError("工作表的行号不是升序，无法按行号分片；请去掉 --shards")
+            for s in _take(shards, 1):
+                pending.append(pool.submit(_run_rows, s))
+            for t in rows:
+                yield make(t)
+
+
+def _take(iterator, n):
+    for _ in range(n):
+        item = next(iterator, None)
+        if item is None:
+            return
+        yield item
+
+
+def add_shard_argument(parser):
+    """给 argparse 解析器加上 --shards [N] 选项"""
+    parser.add_argument("--shards", nargs="?", type=int, const=0, metavar="N",
+                        help="把工作表按行切成 N 片，在 N 个进程中并行解析（不写 N 时为 CPU 核数；"
+                             "总是用 fast 引擎直接解析，忽略 --engine / --no-cache，见 salary_shards）")
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+限定内存的汇总：老师-ID 多到上百万时（例如合并一整年的批次），不在内存中保存每个老师的合计
+
+    python cal.py calc --memory-limit 256      汇总占用的内存最多约 256 MB
+
+- 上限是汇总缓冲区的预算：从读到第一行时的进程常驻内存（RSS，此时解释器、NumPy 和
+  读取工作簿所需的共享字符串、样式都已就绪）算起的增长，不含这部分基线
+- 逐行展开「老师出现一次」的记录 (键, 是否正确, 金额) 放入缓冲区；
+  缓冲区占用达到上限时，按键稳定排序后写成一个临时的有序分段文件（老师-ID、老师姓名各一个），清空缓冲区
+- 缓冲区的大小按实测确定：写第一个分段之前每 CHECK_RECORDS 条测一次 RSS，增长达到上限的
+  BUFFER_SHARE（其余留给写分段时按姓名排序的副本）时写出分段，之后的分段都用这个条数——
+  释放的内存通常仍留在进程中，第一次写出分段后 RSS 不再能反映缓冲区的大小；
+  读不到 RSS（非 Linux）时按每条 ENTRY_BYTES 字节估计
+- 结束时对全部分段做 k 路归并（heapq.merge 对相同的键按分段顺序输出，分段按时间先后排列），
+  同一个键的出现因此仍按原始顺序排列，从 0 开始逐次累加——与 salary_aggregate.aggregate
+  的累加顺序相同，结果逐位一致，写出的 CSV 也完全相同
+- 分段中保存的是出现记录而不是各段的部分合计：浮点合计与累加顺序有关，
+  部分合计再相加的结果可能在最后一位上不同
+- 归并时每个分段只在内存中保留一块，结果边归并边写入 CSV；分段多于 MAX_FANIN 个时，
+  先把相邻的分段按顺序合并成较大的分段（仍然保持出现顺序），控制同时打开的文件数和内存
+- 全部数据没有超过上限时不写临时文件
+"""
+
+import heapq
+import marshal
+import os
+import tempfile
+from itertools import groupby, islice
+from operator import itemgetter
+
+from judge_loader import parse_teachers, extract_teacher_name
+from salary_aggregate import parse_amount
+
+DEFAULT_MEMORY_LIMIT_MB = 256
+
+# 缓冲区中每次出现的估计内存（记录本身 + 写分段时按姓名排序的副本和排序的临时空间）；
+# 测得 RSS 时只作为缓冲区条数的上限
+ENTRY_BYTES = 400
+
+# 缓冲区最少的条数
+MIN_BUFFERED = 1024
+
+# 写第一个分段之前，每追加这么多条测一次 RSS
+CHECK_RECORDS = 4096
+
+# 缓冲区本身可用的上限比例；其余留给写分段时的姓名副本和排序
+BUFFER_SHARE = 0.5
+
+# 分段文件中每块的最多记录数；归并时每个分段在内存中保留一块
+CHUNK_RECORDS = 4096
+
+# 一次归并最多同时打开的分段数
+MAX_FANIN = 64
+
+_key = itemgetter(0)
+
+
+def current_rss():
+    """当前进程的常驻内存（字节）；没有 /proc/self/statm（非 Linux）时返回 None"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _write_run(path, records, chunk):
+    """records 可以是列表或迭代器，每 chunk 条写成一块"""
+    it = iter(records)
+    with open(path, "wb") as f:
+        while True:
+            block = list(islice(it, chunk))
+            if not block:
+                return
+            marshal.dump(block, f)
+
+
+def _read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                chunk = marshal.load(f)
+            except EOFError:
+                return
+            yield from chunk
+
+
+def _sum_groups(records):
+    """按键分组的有序出现记录 -> (键, 正确总金, 错误总金, 正确题数, 错误题数)"""
+    for key, group in groupby(records, key=_key):
+        correct = wrong = 0.0
+        correct_count = wrong_count = 0
+        for _, is_correct, amount in group:
+            if is_correct:
+                correct += amount
+                correct_count += 1
+            else:
+                wrong += amount
+                wrong_count += 1
+        yield key, correct, wrong, correct_count, wrong_count
+
+
+class SpillAggregator:
+    """
+    限定内存的汇总器：add_rows() 逐行展开，detail_rows() / summary_rows() 按键升序产出合计
+    用 with 使用，结束时删除临时的分段文件
+    """
+
+    def __init__(self, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB, tmp_dir=None):
+        self.limit_bytes = int(memory_limit_mb * (1 << 20))
+        self._set_max_buffered(self.limit_bytes // ENTRY_BYTES)
+        self.measured = False   # 缓冲区条数是否按实测的 RSS 确定
+        self._baseline = None   # 读到第一行时的 RSS
+        self._next_check = CHECK_RECORDS
+        self.tmp_dir = tmp_dir
+        self.rows = 0
+        self.skipped = 0
+        self.appearances = 0
+        self._buffer = []
+        self._runs = []         # [(老师-ID 分段路径, 老师姓名分段路径), ...]，按写出的先后排列
+        self._seq = 0
+        self._tmp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
+        self._runs = []
+
+    @property
+    def spilled_runs(self):
+        return len(self._runs)
+
+    def _set_max_buffered(self, records):
+        self.max_buffered = max(MIN_BUFFERED, records)
+        # 归并时同时驻留 MAX_FANIN 块，块的大小按上限缩小
+        self.chunk_records = max(16, min(CHUNK_RECORDS, self.max_buffered // MAX_FANIN))
+
+    def add_rows(self, judge_rows):
+        """遍历 JudgeRow 流，K/N 列不是数字的行整行跳过（与 collect_appearances 一致）"""
+        buffer = self._buffer
+        for r in judge_rows:
+            self.rows += 1
+            if self.rows == 1:
+                self._baseline = current_rss()
+            try:
+                correct_per = parse_amount(r.correct_per)
+                wrong_per = parse_amount(r.wrong_per)
+            except (TypeError, ValueError):
+                self.skipped += 1
+                continue
+            for value, colored in ((r.passed, r.passed_colored), (r.failed, r.failed_colored)):
+                amount = correct_per if colored else wrong_per
+                colored = bool(colored)
+                for t in parse_teachers(value):
+                    buffer.append((t, colored, amount))
+            if len(buffer) >= self._next_check:
+                self._check()
+
+    def _check(self):
+        """缓冲区达到 max_buffered 条，或（第一个分段之前）实测的内存增长达到上限的 BUFFER_SHARE 时写出分段"""
+        n = len(self._buffer)
+        if n < self.max_buffered and not self._measured_full(n):
+            self._next_check = min(n + CHECK_RECORDS, self.max_buffered)
+            return
+        self._spill()
+        self._next_check = min(CHECK_RECORDS, self.max_buffered)
+
+    def _measured_full(self, n):
+        if self._runs or self._baseline is None:
+            return False
+        rss = current_rss()
+        if rss is None or rss - self._baseline < self.limit_bytes * BUFFER_SHARE:
+            return False
+        self._set_max_buffered(n)
+        self.measured = True
+        return True
+
+    def _spill(self):
+        """把缓冲区按键稳定排序，写成一对分段文件"""
+        if self._tmp is None:
+            self._tmp = tempfile.TemporaryDirectory(prefix="salary_spill_", dir=self.tmp_dir)
+        id_path, name_path = self._new_run()
+        buffer = self._buffer
+        self.appearances += len(buffer)
+        # 姓名分段要在按 ID 排序之前生成：同一姓名下的出现必须保持原始顺序
+        names = [(extract_teacher_name(t), c, a) for t, c, a in buffer]
+        names.sort(key=_key)
+        _write_run(name_path, names, self.chunk_records)
+        del names
+        buffer.sort(key=_key)
+        _write_run(id_path, buffer, self.chunk_records)
+        buffer.clear()
+        self._runs.append((id_path, name_path))
+
+    def _new_run(self):
+        self._seq += 1
+        base = os.path.join(self._tmp.name, f"run{self._seq:06d}")
+        return base + ".id", base + ".name"
+
+    def _compact(self):
+        """分段多于 MAX_FANIN 个时，按顺序把每 MAX_FANIN 个相邻分段合并成一个，直到不超过 MAX_FANIN"""
+        while len(self._runs) > MAX_FANIN:
+            merged = []
+            for i in range(0, len(self._runs), MAX_FANIN):
+                group = self._runs[i:i + MAX_FANIN]
+                if len(group) == 1:
+                    merged.append(group[0])
+                    continue
+                paths = self._new_run()
+                for which, path in enumerate(paths):
+                    sources = [run[which] for run in group]
+                    _write_run(path, heapq.merge(*map(_read_run, sources), key=_key), self.chunk_records)
+                    for source in sources:
+                        os.remove(source)
+                merged.append(paths)
+            self._runs = merged
+
+    def finish(self):
+        """输入结束：只有缓冲区时不写文件，否则把剩下的也写成分段，并把分段数合并到 MAX_FANIN 以内"""
+        if self._runs:
+            if self._buffer:
+                self._spill()
+            self._compact()
+        else:
+            self.appearances = len(self._buffer)
+
+    def _merged(self, which):
+        if not self._runs:
+            if which == 0:
+                return iter(sorted(self._buffer, key=_key))
+            return iter(sorted(((extract_teacher_name(t), c, a) for t, c, a in self._buffer), key=_key))
+        return heapq.merge(*(_read_run(run[which]) for run in self._runs), key=_key)
+
+    def detail_rows(self):
+        """按老师-ID 升序产出 (老师-ID, 正确总金, 错误总金)"""
+        for key, correct, wrong, _, _ in _sum_groups(self._merged(0)):
+            yield key, correct, wrong
+
+    def summary_rows(self):
+        """按老师姓名升序产出 (老师姓名, 正确总金, 错误总金, 正确题数, 错误题数)"""
+        return _sum_groups(self._merged(1))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+老师 -> 题目的倒排索引：回答「孙林-251 的所得金来自哪些题目」时不必重新扫描 judge.xlsx
+
+    python cal.py index                 为 judge.xlsx 建立（或重建）索引
+    python cal.py lookup 孙林-251        按老师-ID 查询
+    python cal.py lookup 孙林            按老师姓名查询（该姓名下的全部老师-ID）
+
+索引是工作簿旁边 .judge_cache/ 目录中的一个 SQLite 文件，每次出现记一行：
+(老师-ID, 老师姓名, Excel 行号, 题号, C/D 列, 是否有颜色, 计入的金额)
+老师-ID、老师姓名上都建有索引，查询只读这个文件，毫秒级返回
+索引记录了建立时工作簿的大小和修改时间，查询时只比较这两项（不读取工作簿内容），
+不一致时提示重建
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import NamedTuple
+
+from judge_loader import PARSER_VERSION, parse_teachers, extract_teacher_name
+from salary_aggregate import parse_amount
+
+CACHE_DIR_NAME = ".judge_cache"
+INDEX_SUFFIX = ".index.sqlite"
+
+SCHEMA = """
+CREATE TABLE meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE postings (
+    teacher_id TEXT NOT NULL,
+    name       TEXT NOT NULL,
+    row        INTEGER NOT NULL,
+    problem_id,
+    col        TEXT NOT NULL,       -- 'C' / 'D'
+    colored    INTEGER NOT NULL,
+    amount     REAL                 -- K/N 不是数字（整行不计）时为 NULL
+);
+"""
+
+INDEXES = """
+CREATE INDEX postings_by_id ON postings (teacher_id);
+CREATE INDEX postings_by_name ON postings (name);
+"""
+
+
+class Posting(NamedTuple):
+    """老师在某一行中的一次出现"""
+    teacher_id: str
+    row: int
+    problem_id: object
+    column: str         # 'C' / 'D'
+    colored: bool
+    amount: object      # 计入的金额；该行不计时为 None
+
+
+def index_path_for(xlsx_path, sheet=None):
+    """索引文件路径：<工作簿目录>/.judge_cache/<文件名>[.<表名哈希>].index.sqlite"""
+    xlsx_path = Path(xlsx_path)
+    suffix = ""
+    if sheet is not None:
+        suffix = "." + hashlib.sha256(sheet.encode("utf-8")).hexdigest()[:8]
+    return xlsx_path.parent / CACHE_DIR_NAME / f"{xlsx_path.name}{suffix}{INDEX_SUFFIX}"
+
+
+def _source_stamp(xlsx_path):
+    st = os.stat(xlsx_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _sql_value(value):
+    """题号转成 SQLite 能保存的类型"""
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+def iter_postings(judge_rows):
+    """把 JudgeRow 流展开成 (老师-ID, 姓名, 行号, 题号, 列, 是否有颜色, 金额)"""
+    for r in judge_rows:
+        try:
+            correct_per = parse_amount(r.correct_per)
+            wrong_per = parse_amount(r.wrong_per)
+            counted = True
+        except (TypeError, ValueError):
+            counted = False
+        problem_id = _sql_value(r.problem_id)
+        for column, value, colored in (('C', r.passed, r.passed_colored),
+                                       ('D', r.failed, r.failed_colored)):
+            for t in parse_teachers(value):
+                amount = (correct_per if colored else wrong_per) if counted else None
+                yield (t, extract_teacher_name(t), r.row, problem_id, column, int(bool(colored)), amount)
+
+
+def build_index(judge_rows, xlsx_path, fill_rule, sheet=None):
+    """扫描一遍 JudgeRow 流，写出索引文件（先写临时文件再替换），返回 (路径, 出现次数)"""
+    path = index_path_for(xlsx_path, sheet)
+    path.parent.mkdir(exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.unlink(missing_ok=True)
+    conn = sqlite3.connect(str(tmp))
+    try:
+        conn.executescript(SCHEMA)
+        with conn:
+            cur = conn.executemany("INSERT INTO postings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   iter_postings(judge_rows))
+            count = cur.rowcount
+            conn.executescript(INDEXES)
+            meta = {
+                "parser": PARSER_VERSION,
+                "fill_rule": [sorted(fill_rule.themes), sorted(fill_rule.rgbs)],
+                "sheet": sheet,
+                "source": str(Path(xlsx_path).resolve()),
+                **_source_stamp(xlsx_path),
+            }
+            conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                             [(k, json.dumps(v, ensure_ascii=False)) for k, v in meta.items()])
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return path, count
+
+
+class TeacherIndex:
+    """只读打开的索引文件"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        # 以只读模式打开，文件不存在时不会被创建
+        self.conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True)
+        self.meta = {k: json.loads(v) for k, v in self.conn.execute("SELECT key, value FROM meta")}
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def is_current(self, xlsx_path, fill_rule):
+        """工作簿大小、修改时间和解析规则都与建立索引时一致"""
+        try:
+            stamp = _source_stamp(xlsx_path)
+        except OSError:
+            return False
+        return (self.meta.get("parser") == PARSER_VERSION
+                and self.meta.get("fill_rule") == [sorted(fill_rule.themes), sorted(fill_rule.rgbs)]
+                and self.meta.get("size") == stamp["size"]
+                and self.meta.get("mtime_ns") == stamp["mtime_ns"])
+
+    def _query(self, column, key):
+        cur = self.conn.execute(
+            "SELECT teacher_id, row, problem_id, col, colored, amount FROM postings "
+            f"WHERE {column} = ? ORDER BY rowid", (key,))
+        return [Posting(t, row, pid, col, bool(colored), amount)
+                for t, row, pid, col, colored, amount in cur]
+
+    def by_teacher_id(self, teacher_id):
+        """某个老师-ID 的全部出现，按 Excel 行顺序"""
+        return self._query("teacher_id", teacher_id)
+
+    def by_name(self, name):
+        """某个老师姓名下全部老师-ID 的出现，按 Excel 行顺序"""
+        return self._query("name", name)
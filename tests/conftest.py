@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+测试共用：生成小的模拟工作簿，用普通 calc 算出作为基准的 CSV
+
+    python -m pytest -q
+"""
+
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+BASE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE))
+
+import cal
+from make_judge_workbook import write_workbook
+
+OUTPUT_NAMES = ("salary_detail.csv", "salary_summary.csv")
+
+# 小工作簿：行数足够切成多片、写出多个分段，又能在几秒内跑完
+ROWS = 1500
+
+
+def run_cal(*argv):
+    """在当前进程中运行 cal.py，返回退出码"""
+    return cal.main([str(a) for a in argv])
+
+
+def calc_outputs(xlsx, out_dir, *options):
+    """运行 cal.py calc，返回 {文件名: 内容字节}"""
+    out_dir = Path(out_dir)
+    assert run_cal("calc", "--xlsx", xlsx, "--out-dir", out_dir, "--engine", "fast", "--no-cache",
+                   *options) == 0
+    return read_outputs(out_dir)
+
+
+def read_outputs(out_dir):
+    return {name: (Path(out_dir) / name).read_bytes() for name in OUTPUT_NAMES}
+
+
+@pytest.fixture(scope="session")
+def workbook(tmp_path_factory):
+    """只读的模拟工作簿（需要修改时先 copy_workbook）"""
+    path = tmp_path_factory.mktemp("judge") / "judge.xlsx"
+    write_workbook(path, ROWS, seed=7, repeat=0.3)
+    return path
+
+
+@pytest.fixture(scope="session")
+def expected(workbook, tmp_path_factory):
+    """普通 calc 对 workbook 的输出"""
+    return calc_outputs(workbook, tmp_path_factory.mktemp("expected"))
+
+
+@pytest.fixture
+def copy_workbook(workbook, tmp_path):
+    """复制一份可以修改的工作簿"""
+    def copy(name="judge.xlsx"):
+        target = tmp_path / "book" / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(workbook, target)
+        return target
+    return copy
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""batch：批量处理一个工作簿的 CSV 与普通 calc 完全相同"""
+
+from conftest import read_outputs, run_cal
+
+
+def test_batch(workbook, expected, tmp_path):
+    assert run_cal("batch", workbook, "--out-dir", tmp_path, "--engine", "fast",
+                   "--no-cache", "--jobs", "2") == 0
+    assert read_outputs(tmp_path) == expected
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""--incremental：每次修改工作簿后，增量结果与普通 calc 的 CSV 完全相同"""
+
+import openpyxl
+from openpyxl.styles import PatternFill
+from openpyxl.styles.colors import Color
+
+from conftest import calc_outputs
+
+COLORED = PatternFill('solid', fgColor=Color(theme=9, tint=0.7999816888943144))
+
+
+def recolor(ws):
+    """第 10~19 行的 C 列去掉颜色，D 列加上颜色"""
+    for row in range(10, 20):
+        ws.cell(row, 3).fill = PatternFill(fill_type=None)
+        ws.cell(row, 4).fill = COLORED
+
+
+def edit_amounts(ws):
+    """改几行的 决定正确金额/每人、决定错误金额/每人"""
+    for row in (30, 31, 500):
+        ws.cell(row, 11).value = 99.5
+        ws.cell(row, 14).value = 0.25
+
+
+def delete_rows(ws):
+    ws.delete_rows(200, 5)
+
+
+def append_rows(ws):
+    """在末尾追加几行已有题目的副本和一道新题"""
+    for row in (2, 3, 4):
+        ws.append([c.value for c in ws[row]])
+    ws.append(["新题", "x", "王林;李航", "赵明", None, None, None, None, 45, 2, 22.5, 5, 1, 5, 3])
+
+
+def test_incremental_matches_full_calc(copy_workbook, tmp_path, capsys):
+    xlsx = copy_workbook()
+    checkpoint = tmp_path / "checkpoint"
+    options = ("--incremental", "--checkpoint", checkpoint, "--check-full")
+
+    first = calc_outputs(xlsx, tmp_path / "incremental", *options)
+    assert "已全量计算" in capsys.readouterr().out
+    assert first == calc_outputs(xlsx, tmp_path / "full")
+
+    for step, edit in enumerate((recolor, edit_amounts, delete_rows, append_rows)):
+        wb = openpyxl.load_workbook(xlsx)
+        edit(wb.active)
+        wb.save(xlsx)
+        capsys.readouterr()
+
+        actual = calc_outputs(xlsx, tmp_path / "incremental", *options)
+        out = capsys.readouterr().out
+        assert "增量更新" in out, edit.__name__
+        assert "全量核对通过" in out, edit.__name__
+        assert actual == calc_outputs(xlsx, tmp_path / f"full{step}"), edit.__name__
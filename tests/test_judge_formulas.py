@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""judge_formulas：没有缓存值的 K/N 公式的计算，以及两种读取引擎的结果一致"""
+
+import zipfile
+
+import openpyxl
+import pytest
+from openpyxl.styles import PatternFill
+from openpyxl.styles.colors import Color
+
+import judge_formulas
+from judge_formulas import ERROR_DIV0, ERROR_VALUE, evaluate_uncached, uncached_formula_rows
+from judge_loader import COL_CORRECT_PER as K, COL_WRONG_PER as N, parse_judge_rows
+from make_judge_workbook import HEADER
+
+from conftest import calc_outputs
+
+COLORED = PatternFill('solid', fgColor=Color(theme=9, tint=0.7999816888943144))
+
+
+def save_rows(path, rows):
+    """
+    用 openpyxl（非 write_only）保存：公式格子写成 <f>…</f><v></v>，没有缓存值
+    rows: [{列号: 值}, ...]，从第 2 行开始
+    """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(HEADER)
+    for i, cells in enumerate(rows, start=2):
+        for col, value in cells.items():
+            ws.cell(i, col, value)
+    wb.save(path)
+    return path
+
+
+def evaluate(tmp_path, *cells):
+    """每个 cells 占一行，返回各行 K 列的计算结果（失败时为公式文本）和 issues"""
+    result = evaluate_uncached(save_rows(tmp_path / "f.xlsx", cells))
+    return [result.values[row][K] for row in range(2, 2 + len(cells))], result.issues
+
+
+def test_precedence_and_percent(tmp_path):
+    values, issues = evaluate(
+        tmp_path,
+        {9: 2, K: "=-I2^2"},            # 一元负号优先于 ^：(-2)^2
+        {9: 2, 10: 3, K: "=I3+J3*2^2"},
+        {9: 50, K: "=I4%*2"},
+        {9: 2, 10: 8, K: "=(I5+J5)/4-1"},
+        {9: 45, 10: 2, K: "=$I$6/J6"},
+    )
+    assert issues == []
+    assert values == [4, 14, 1, 1.5, 22.5]
+    assert [type(v) for v in values] == [int, int, int, float, float]    # 整数结果写成 int
+
+
+def test_errors_propagate(tmp_path):
+    values, issues = evaluate(
+        tmp_path,
+        {9: 45, 10: 0, K: "=I2/J2"},
+        {9: "abc", 10: 2, K: "=I3/J3"},
+        {9: 45, 10: 0, 11: "=I4/J4", N: "=K4+1"},      # N 引用了 #DIV/0! 的 K
+    )
+    assert issues == []
+    assert values == [ERROR_DIV0, ERROR_VALUE, ERROR_DIV0]
+
+
+def test_reference_to_uncached_formula(tmp_path):
+    result = evaluate_uncached(save_rows(tmp_path / "f.xlsx", [
+        {9: 45, 10: 3, 12: 5, 13: "=O2-J2", 15: 4, K: "=I2/J2", N: "=L2/M2"},
+    ]))
+    assert result.values[2] == {K: 15, N: 5}
+
+
+def test_shared_formula_is_shifted(tmp_path):
+    path = save_rows(tmp_path / "f.xlsx", [{9: 45 * i, 10: i, K: "=I{}/J{}".format(i + 1, i + 1)}
+                                           for i in range(1, 5)])
+    # 改写成共享公式：K2 为主单元格，K3~K5 只有 si
+    with zipfile.ZipFile(path) as archive:
+        items = {name: archive.read(name) for name in archive.namelist()}
+    sheet = "xl/worksheets/sheet1.xml"
+    data = items[sheet].replace(b"<f>I2/J2</f>", b'<f t="shared" ref="K2:K5" si="0">I2/J2</f>')
+    for row in (3, 4, 5):
+        data = data.replace(f"<f>I{row}/J{row}</f>".encode(), b'<f t="shared" si="0"/>')
+    assert data.count(b't="shared"') == 4
+    items[sheet] = data
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, content in items.items():
+            archive.writestr(name, content)
+
+    result = evaluate_uncached(path)
+    assert result.issues == []
+    assert [result.values[row][K] for row in range(2, 6)] == [45, 45, 45, 45]
+
+
+def test_unsupported_formulas_are_reported(tmp_path):
+    values, issues = evaluate(
+        tmp_path,
+        {K: "=N2", N: "=K2"},               # 循环引用
+        {9: 45, K: "=I2"},                  # 引用其它行
+        {9: 45, K: "=SUM(I4:J4)"},
+    )
+    reasons = {issue.cell: issue.reason for issue in issues}
+    assert reasons["K2"] == reasons["N2"] == "循环引用"
+    assert reasons["K3"].startswith("引用了其它行")
+    assert reasons["K4"].startswith("不支持的写法")
+    # 无法计算的格子换成公式文本，整行按非数字金额不计
+    assert values == ["=N2", "=I2", "=SUM(I4:J4)"]
+
+
+def test_empty_cached_value_counts_as_uncached(tmp_path):
+    path = save_rows(tmp_path / "f.xlsx", [{9: 45, 10: 2, K: "=I2/J2"}, {K: 5}])
+    with zipfile.ZipFile(path) as archive:
+        assert b"<f>I2/J2</f><v /></c>" in archive.read("xl/worksheets/sheet1.xml")
+    assert uncached_formula_rows(path) == {2}
+
+
+def formula_workbook(path):
+    """openpyxl 保存的、K/N 全是公式的小工作簿（末行是 SUM 合计行）"""
+    teachers = [("甲-1", "乙-2"), ("丙-3", "乙-2"), ("甲-1 丁-4", None), ("丙-3", "甲-1"), ("丁-4", "乙-2 丙-3")]
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(HEADER)
+    for i, (passed, failed) in enumerate(teachers, start=2):
+        ws.append([f"p{i}", "x", passed, failed, None, None, None, None, 45, 1 + i % 2, f"=I{i}/J{i}",
+                   5, 1 + i % 3, f"=L{i}/M{i}", 3])
+        ws.cell(i, 3).fill = COLORED
+    ws.append(["合计", None, None, None, None, None, None, None, "=SUM(I2:I6)", None, "=SUM(K2:K6)"])
+    wb.save(path)
+    return path
+
+
+def test_engines_agree_on_openpyxl_saved_formulas(tmp_path):
+    xlsx = formula_workbook(tmp_path / "judge.xlsx")
+    fast = list(parse_judge_rows(xlsx, engine='fast'))
+    slow = list(parse_judge_rows(xlsx, engine='openpyxl'))
+    assert fast == slow
+    assert [r.correct_per for r in fast[:5]] == [45, 22.5, 45, 22.5, 45]
+    assert fast[-1].correct_per == "=SUM(K2:K6)"
+    assert not any(r.uncached_formula for r in fast)
+
+    outputs = calc_outputs(xlsx, tmp_path / "fast")
+    assert outputs == calc_outputs(xlsx, tmp_path / "openpyxl", "--engine", "openpyxl")
+    summary = outputs["salary_summary.csv"].decode("utf-8-sig").splitlines()
+    assert summary[1:] == ["丁,90.00,0.00,90.00,2,0,2", "丙,45.00,5.00,50.00,2,1,3",
+                           "乙,0.00,11.67,11.67,0,3,3", "甲,90.00,1.67,91.67,2,1,3"]
+
+
+@pytest.mark.parametrize("engine", ["fast", "openpyxl"])
+def test_blank_amount_does_not_trigger_evaluation(tmp_path, monkeypatch, engine):
+    def fail(*args, **kwargs):
+        raise AssertionError("不应计算公式")
+    monkeypatch.setattr(judge_formulas, "evaluate_uncached", fail)
+    xlsx = save_rows(tmp_path / "f.xlsx", [{1: "p1", 3: "甲-1", 9: 45, 10: 1, 12: 5, 13: 1, N: 5}])
+    [row] = parse_judge_rows(xlsx, engine=engine)
+    assert row.correct_per is None and not row.uncached_formula
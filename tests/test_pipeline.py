@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""--pipeline：流水线模式的 CSV 与普通 calc 完全相同"""
+
+import salary_pipeline
+
+from conftest import calc_outputs
+
+
+def test_pipeline(workbook, expected, tmp_path, monkeypatch, capsys):
+    # 单 CPU 的机器上也强制走流水线
+    monkeypatch.setattr(salary_pipeline, "pipeline_available", lambda: True)
+    assert calc_outputs(workbook, tmp_path, "--pipeline") == expected
+    assert "流水线" in capsys.readouterr().out
+
+
+def test_pipeline_with_validate(workbook, expected, tmp_path, monkeypatch):
+    monkeypatch.setattr(salary_pipeline, "pipeline_available", lambda: True)
+    assert calc_outputs(workbook, tmp_path, "--pipeline", "--validate") == expected
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""--preview：时间足够时得到精确值；--colored-rgb 生效；准备工作超时时拒绝估计"""
+
+import csv
+from types import SimpleNamespace
+
+import openpyxl
+from openpyxl.styles import PatternFill
+
+import salary_preview
+from make_judge_workbook import HEADER
+
+from conftest import calc_outputs, run_cal
+
+
+def preview_rows(out_dir):
+    with open(out_dir / salary_preview.PREVIEW_NAME, encoding="utf-8-sig", newline="") as f:
+        return {row[0]: row[1:] for row in list(csv.reader(f))[1:]}
+
+
+def summary_rows(outputs):
+    return {row[0]: row[1:] for row in csv.reader(outputs["salary_summary.csv"].decode("utf-8-sig").splitlines()[1:])}
+
+
+def test_exact_when_everything_is_sampled(workbook, expected, tmp_path, capsys):
+    assert run_cal("calc", "--xlsx", workbook, "--out-dir", tmp_path, "--preview", "60", "--seed", "1") == 0
+    assert "以下为精确值" in capsys.readouterr().out
+    estimates = preview_rows(tmp_path)
+    summary = summary_rows(expected)
+    assert estimates.keys() == summary.keys()
+    for name, row in summary.items():
+        # 估计值与 ± 两列交替；按块求和，两位小数的最后一位可能差 0.01
+        assert abs(float(estimates[name][4]) - float(row[2])) <= 0.011
+        assert estimates[name][6::2] == row[3:5]
+
+
+def test_colored_rgb(tmp_path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(HEADER)
+    ws.append(["p1", "x", "甲-1", "乙-2", None, None, None, None, 45, 1, 45, 5, 1, 5, 2])
+    ws.cell(2, 3).fill = PatternFill('solid', fgColor="FFDDEBF7")
+    wb.save(tmp_path / "judge.xlsx")
+
+    for options, correct in (((), "0.00"), (("--colored-rgb", "FFDDEBF7"), "45.00")):
+        out_dir = tmp_path / ("rgb" if options else "plain")
+        assert summary_rows(calc_outputs(tmp_path / "judge.xlsx", out_dir, *options))["甲"][0] == correct
+        assert run_cal("calc", "--xlsx", tmp_path / "judge.xlsx", "--out-dir", out_dir,
+                       "--preview", "60", *options) == 0
+        assert preview_rows(out_dir)["甲"][0] == correct
+
+
+def test_refuses_when_setup_exceeds_budget(workbook, tmp_path, monkeypatch, capsys):
+    ticks = iter(range(0, 1000, 10))     # 每次取时间都过去 10 秒
+    monkeypatch.setattr(salary_preview, "time", SimpleNamespace(monotonic=lambda: next(ticks)))
+    assert run_cal("calc", "--xlsx", workbook, "--out-dir", tmp_path, "--preview", "1") == 1
+    assert "超过预览的用时上限" in capsys.readouterr().out
+    assert not (tmp_path / salary_preview.PREVIEW_NAME).exists()
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""--rollup：必须指定批次日期或名称；同一工作簿同一日期再次写入时替换，不重复计入"""
+
+import os
+
+import pytest
+
+from salary_rollup import list_batches, open_store
+
+from conftest import read_outputs, run_cal
+
+
+def test_rollup_requires_batch_date_or_label(workbook, tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        run_cal("calc", "--xlsx", workbook, "--out-dir", tmp_path, "--rollup", tmp_path / "db.sqlite")
+    assert "--batch-date" in capsys.readouterr().err
+    with pytest.raises(SystemExit):
+        run_cal("calc", "--xlsx", workbook, "--out-dir", tmp_path, "--batch-date", "2024-03-15")
+
+
+def test_resaved_workbook_replaces_its_batch(copy_workbook, expected, tmp_path):
+    xlsx = copy_workbook()
+    db = tmp_path / "db.sqlite"
+    for mtime in (1_700_000_000, 1_710_000_000):    # 重新保存：修改日期变了
+        os.utime(xlsx, (mtime, mtime))
+        assert run_cal("calc", "--xlsx", xlsx, "--out-dir", tmp_path / "calc", "--engine", "fast",
+                       "--rollup", db, "--batch-date", "2024-03-15") == 0
+    conn = open_store(db)
+    try:
+        assert len(list_batches(conn)) == 1
+    finally:
+        conn.close()
+
+    assert run_cal("rollup", "--rollup", db, "--out-dir", tmp_path / "rollup") == 0
+    rolled = {name: (tmp_path / "rollup" / name.replace(".csv", "_begin_end.csv")).read_bytes()
+              for name in read_outputs(tmp_path / "calc")}
+    assert rolled == expected
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""--shards：分片解析的 CSV 与普通 calc 完全相同"""
+
+from conftest import calc_outputs
+
+
+def test_shards(workbook, expected, tmp_path):
+    assert calc_outputs(workbook, tmp_path, "--shards", "3") == expected
+
+
+def test_shards_with_one_job(workbook, expected, tmp_path):
+    assert calc_outputs(workbook, tmp_path, "--shards", "1") == expected
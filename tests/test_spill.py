@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""--memory-limit：限定内存模式的 CSV 与普通 calc 完全相同"""
+
+import salary_spill
+
+from conftest import calc_outputs
+
+
+def test_spill(workbook, expected, tmp_path, capsys):
+    assert calc_outputs(workbook, tmp_path / "out", "--memory-limit", "1",
+                        "--spill-dir", tmp_path) == expected
+    assert "临时分段" in capsys.readouterr().out
+
+
+def test_spill_compacts_runs(workbook, expected, tmp_path, monkeypatch, capsys):
+    """分段多于 MAX_FANIN 时先合并相邻分段，结果不变"""
+    monkeypatch.setattr(salary_spill, "MAX_FANIN", 2)
+    monkeypatch.setattr(salary_spill, "ENTRY_BYTES", 4096)   # 缓冲区只放得下最少的 1024 条
+    assert calc_outputs(workbook, tmp_path, "--memory-limit", "1") == expected
+    assert "临时分段" in capsys.readouterr().out
+
+
+def test_spill_by_measured_memory(workbook, expected, tmp_path, monkeypatch, capsys):
+    """按条数估计的缓冲区放得下全部数据时，实测的内存增长仍会触发写出分段"""
+    monkeypatch.setattr(salary_spill, "ENTRY_BYTES", 1)
+    rss = iter(range(0, 1 << 40, 1 << 20))      # 每测一次增长 1 MB
+    monkeypatch.setattr(salary_spill, "current_rss", lambda: next(rss))
+    assert calc_outputs(workbook, tmp_path, "--memory-limit", "1") == expected
+    assert "临时分段" in capsys.readouterr().out
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""verify：出现记录表的老师-ID 编码；归并对比、差异验证不借用 salary_aggregate 重新汇总，能发现改过的 CSV"""
+
+import pytest
+
+import salary_aggregate
+import verify_salary
+
+from conftest import calc_outputs, run_cal
+
+MODES = (("--merge-join",), ("--differential", "--full"))
+
+
+@pytest.fixture
+def outputs(workbook, tmp_path):
+    calc_outputs(workbook, tmp_path)
+    return tmp_path
+
+
+def verify(workbook, out_dir, *options):
+    return run_cal("verify", "--xlsx", workbook, "--out-dir", out_dir, "--engine", "fast", "--no-cache",
+                   *options)
+
+
+@pytest.mark.parametrize("options", MODES)
+def test_recompute_does_not_use_salary_aggregate(workbook, outputs, monkeypatch, options):
+    def fail(*args, **kwargs):
+        raise AssertionError("验证不应借用被验证的汇总代码")
+    for name in ("collect_appearances", "aggregate"):
+        monkeypatch.setattr(salary_aggregate, name, fail)
+        monkeypatch.setattr(verify_salary, name, fail, raising=False)
+    assert verify(workbook, outputs, *options) == 0
+
+
+@pytest.mark.parametrize("options", MODES)
+@pytest.mark.parametrize("name", ["salary_detail.csv", "salary_summary.csv"])
+def test_detects_changed_amount(workbook, outputs, options, name, capsys):
+    path = outputs / name
+    lines = path.read_text(encoding="utf-8-sig").splitlines()
+    fields = lines[3].split(",")
+    fields[1] = f"{float(fields[1]) + 1:.2f}"
+    lines[3] = ",".join(fields)
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8-sig")
+    assert verify(workbook, outputs, *options) == 1
+    assert fields[0] in capsys.readouterr().out
+
+
+def test_appearance_table_codes(monkeypatch):
+    """预先登记的 ID 编码为排序后的下标，其余的接在后面；跨多批查找结果不变"""
+    monkeypatch.setattr(verify_salary, "LOOKUP_BATCH", 3)
+    known = ["乙-2", "甲-1", "丙-3", "甲-1"]
+    table = verify_salary.AppearanceTable(known)
+    o = table.add_row(2, "P1", 10.0, 1.0)
+    seen = ["甲-1", "丁-4", "乙-2", "丁-4", "丙-3", "戊-5", "甲-1"]
+    for i, t in enumerate(seen):
+        table.add(t, o, verify_salary.COLUMN_C, i % 2 == 0)
+    correct, wrong, count = table.totals()
+    ids = table.id_list()
+    assert ids[:3] == sorted(set(known), key=lambda t: t.encode("utf-8"))
+    assert ids[3:] == ["丁-4", "戊-5"]
+    assert [ids[c] for c in table.codes] == seen
+    assert table.known_codes(["丙-3", "甲-1"]) == [ids.index("丙-3"), ids.index("甲-1")]
+    assert table.id_of(ids.index("戊-5")) == "戊-5"
+    assert count.tolist() == [seen.count(t) for t in ids]
+    assert correct[ids.index("甲-1")] == 20.0 and wrong[ids.index("丁-4")] == 2.0
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+差异验证用的摘要树：上一次验证通过时，每个老师-ID / 老师姓名的内容摘要
+
+    python cal.py verify --differential          只重新验证有变化的老师
+    python cal.py verify --differential --full   全部重新验证，并重建摘要
+
+摘要文件（默认 .verify_digest，与 CSV 放在同一目录）保存两棵树：明细（按老师-ID）和汇总（按老师姓名）
+- 叶子：一个键的摘要 = judge.xlsx 中它的全部出现（按出现顺序的金额和是否正确，
+  正是这两项决定了它的合计）+ CSV 中它的全部行（原文）
+- 分支：按键的哈希分到 FANOUT 个分支，分支摘要由其中的键和叶子算出；根摘要由全部分支算出
+下次验证时先比较根，再只比较不同的分支，叶子不同（或只在一边出现）的键需要重新验证；
+CSV 中新增或删除的行会让对应的叶子出现、消失或改变，同样会被找出
+只有验证全部通过才写入摘要，有不一致时保留旧摘要，下次仍会重新验证这些键
+"""
+
+import csv
+import hashlib
+import marshal
+import os
+import zlib
+
+import numpy as np
+
+DIGEST_NAME = ".verify_digest"
+MAGIC = b"JDGV"
+FORMAT_VERSION = 1
+
+# 分支数：键按哈希的第一个字节分配
+FANOUT = 256
+
+
+def _digest(*parts):
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part)
+    return h.digest()
+
+
+def _branch_of(key):
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=1).digest()[0]
+
+
+def appearance_digests(codes, n, amount, correct):
+    """
+    codes 中每个编码（0..n-1）的出现摘要：按出现顺序的 (金额, 是否正确)
+    没有出现的编码返回 None
+    """
+    order = np.argsort(codes, kind="stable")
+    starts = np.searchsorted(codes[order], np.arange(n + 1)).tolist()
+    amounts = memoryview(np.ascontiguousarray(amount[order]).tobytes())
+    flags = memoryview(correct[order].astype(np.int8).tobytes())
+    out = []
+    for a, b in zip(starts, starts[1:]):
+        out.append(_digest(amounts[a * 8:b * 8], flags[a:b]) if b > a else None)
+    return out
+
+
+def read_csv_groups(path):
+    """读取 CSV（跳过表头），按第一列分组：键 -> [行, ...]（行为字段列表，保持文件中的顺序）"""
+    groups = {}
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if row:
+                groups.setdefault(row[0], []).append(row)
+    return groups
+
+
+def leaf_digests(excel, csv_groups):
+    """
+    excel: 键 -> judge.xlsx 中的出现摘要；csv_groups: 键 -> CSV 行
+    返回两边所有键的叶子摘要；只在一边出现的键也有叶子（另一边记为缺失）
+    """
+    leaves = {}
+    for key in excel.keys() | csv_groups.keys():
+        excel_part = excel.get(key)
+        rows = csv_groups.get(key)
+        csv_part = (_digest(*("\x1f".join(row).encode("utf-8") + b"\n" for row in rows))
+                    if rows else None)
+        leaves[key] = _digest(b"E" + excel_part if excel_part else b"-",
+                              b"C" + csv_part if csv_part else b"-")
+    return leaves
+
+
+class DigestTree:
+    """两层摘要树：FANOUT 个分支（每个分支是 键 -> 叶子摘要 的字典）和一个根"""
+
+    def __init__(self, buckets, branches, root):
+        self.buckets = buckets
+        self.branches = branches
+        self.root = root
+
+    @classmethod
+    def build(cls, leaves):
+        buckets = [{} for _ in range(FANOUT)]
+        for key in sorted(leaves):
+            buckets[_branch_of(key)][key] = leaves[key]
+        branches = [_digest(*(k.encode("utf-8") + b"\0" + v for k, v in bucket.items()))
+                    for bucket in buckets]
+        return cls(buckets, branches, _digest(*branches))
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.buckets)
+
+    def diff(self, old):
+        """
+        与上次的树比较，返回 (需要重新验证的键, 有变化的分支数)
+        old 为 None（没有摘要）时全部键都要重新验证
+        """
+        if old is None:
+            return {k for bucket in self.buckets for k in bucket}, FANOUT
+        if self.root == old.root:
+            return set(), 0
+        changed = set()
+        branches = 0
+        for new_bucket, old_bucket, new_branch, old_branch in zip(self.buckets, old.buckets,
+                                                                  self.branches, old.branches):
+            if new_branch == old_branch:
+                continue
+            branches += 1
+            for key in new_bucket.keys() | old_bucket.keys():
+                if new_bucket.get(key) != old_bucket.get(key):
+                    changed.add(key)
+        return changed, branches
+
+    def to_data(self):
+        return {"buckets": self.buckets, "branches": self.branches, "root": self.root}
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(data["buckets"], data["branches"], data["root"])
+
+
+def load_digests(path):
+    """读取摘要文件，返回 (明细树, 汇总树)；不存在、损坏或版本不同时返回 None"""
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            data = marshal.loads(zlib.decompress(f.read()))
+        if not isinstance(data, dict) or data.get("format") != FORMAT_VERSION:
+            return None
+        trees = DigestTree.from_data(data["detail"]), DigestTree.from_data(data["summary"])
+    except (OSError, ValueError, EOFError, TypeError, KeyError, zlib.error):
+        return None
+    if any(len(t.buckets) != FANOUT for t in trees):
+        return None
+    return trees
+
+
+def save_digests(path, detail_tree, summary_tree):
+    """原子地写出摘要文件"""
+    payload = zlib.compress(marshal.dumps({
+        "format": FORMAT_VERSION,
+        "detail": detail_tree.to_data(),
+        "summary": summary_tree.to_data(),
+    }))
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(payload)
+    os.replace(tmp, path)
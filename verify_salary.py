@@ -3,46 +3,227 @@
 精确验证：逐条对比 salary_detail.csv 与 judge.xlsx 原始数据
 """
 
+import argparse
+from array import array
 from pathlib import Path
 from collections import defaultdict
-import openpyxl
 import csv
+import numpy as np
+from judge_loader import iter_judge_rows, parse_teachers, extract_teacher_name
+from salary_aggregate import detail_rows, summary_rows
+from salary_columnar import TABLES_NAME, load_tables, iter_detail_columnar, iter_summary_columnar
+from verify_digest import (DIGEST_NAME, FANOUT, DigestTree, appearance_digests, read_csv_groups,
+                           leaf_digests, load_digests, save_digests)
+from salary_shards import add_shard_argument, iter_judge_rows_sharded
+from report_writer import add_report_arguments, check_report_arguments, open_report_from_args, progress_printer
+from profiling import PROFILER, add_profile_arguments, start_from_args, finish_from_args
 
-def has_color(cell):
-    """判断单个格子是否有浅蓝/浅绿填充"""
-    if not cell or not cell.fill:
-        return False
-    if cell.fill.patternType != 'solid':
-        return False
-    if cell.fill.fgColor and hasattr(cell.fill.fgColor, 'theme'):
-        theme = cell.fill.fgColor.theme
-        if theme in [8, 9]:
-            return True
-    return False
-
-def parse_teachers(s):
-    """解析老师列表"""
-    if not s or not str(s).strip():
-        return []
-    return [x.strip() for x in str(s).split() if x.strip()]
-
-def extract_teacher_name(teacher_id):
-    """从 '孙林-251' 提取出 '孙林'"""
-    if '-' in teacher_id:
-        return teacher_id.rsplit('-', 1)[0]
-    return teacher_id
+# 出现在哪一列（每次出现只占一个字节）
+COLUMN_C = 0
+COLUMN_D = 1
+COLUMN_LABELS = ('C(passed)', 'D(failed)')
 
-def main():
-    base = Path(__file__).resolve().parent
-    xlsx_path = base / "judge.xlsx"
-    detail_path = base / "salary_detail.csv"
-    
-    print("="*80)
-    print("精确验证：逐条对比 detail 与原始数据")
-    print("="*80)
-    
-    # 1. 读取 detail.csv 的每条记录
-    print("\n[1/3] 读取 salary_detail.csv...")
+# 每攒够这么多次出现，成批查一次老师-ID 的编码
+LOOKUP_BATCH = 16384
+
+
+def _encode_ids(teacher_ids):
+    """老师-ID 转成 UTF-8 定长字节串数组（中文每字 3 字节，比 numpy 的 Unicode 数组每字 4 字节省）"""
+    return np.array([t.encode('utf-8') for t in teacher_ids], dtype=bytes)
+
+
+class AppearanceTable:
+    """
+    judge.xlsx 中所有「老师出现一次」的列式记录
+    行级数据（行号、题号、K/N 金额）每行只存一份；每次出现只存
+    老师-ID 编码、行序号、列（COLUMN_C / COLUMN_D）和是否有颜色，全部是定长数组
+    老师-ID 编码：预先登记的 ID（如 CSV 中的）按 UTF-8 字节排序后存成定长字节串数组 known，
+    编码就是下标，出现的 ID 攒成一批用 np.searchsorted 查找，不为每个 ID 建字典项；
+    known 中没有的 ID 才放进 index 字典，编码接在 known 之后
+    """
+    __slots__ = ('known', 'index', 'extra_ids', 'rows', 'problem_ids', 'correct_per', 'wrong_per',
+                 'codes', 'row_ordinals', 'columns', 'colored', '_pending', '_order')
+
+    def __init__(self, known_ids=()):
+        self.known = np.unique(_encode_ids(known_ids))   # 排序去重的预先登记 ID
+        self.index = {}                 # known 之外的老师-ID -> 编码
+        self.extra_ids = []             # known 之外的老师-ID，编码为 len(known) + 下标
+        self.rows = array('q')          # 行序号 -> Excel 行号
+        self.problem_ids = []           # 行序号 -> 题号
+        self.correct_per = array('d')   # 行序号 -> K列
+        self.wrong_per = array('d')     # 行序号 -> N列
+        self.codes = array('i')         # 每次出现的老师-ID 编码
+        self.row_ordinals = array('i')  # 每次出现所在的行序号
+        self.columns = array('b')       # 每次出现所在的列
+        self.colored = array('b')       # 每次出现的格子是否有颜色
+        self._pending = []              # 还没有查编码的老师-ID（与 codes 之后的出现对应）
+        self._order = None
+
+    @property
+    def n_ids(self):
+        return len(self.known) + len(self.extra_ids)
+
+    def id_of(self, code):
+        n = len(self.known)
+        return self.known[code].decode('utf-8') if code < n else self.extra_ids[code - n]
+
+    def id_list(self):
+        """编码 -> 老师-ID 的列表"""
+        return [t.decode('utf-8') for t in self.known.tolist()] + self.extra_ids
+
+    def known_codes(self, teacher_ids):
+        """预先登记过的老师-ID 的编码（成批查找）"""
+        return np.searchsorted(self.known, _encode_ids(teacher_ids)).tolist()
+
+    def add_row(self, row, problem_id, correct_per, wrong_per):
+        """记录一行，返回行序号"""
+        self.rows.append(row)
+        self.problem_ids.append(problem_id)
+        self.correct_per.append(correct_per)
+        self.wrong_per.append(wrong_per)
+        return len(self.rows) - 1
+
+    def add(self, teacher_id, ordinal, column, has_color):
+        """记录一次出现"""
+        self._pending.append(teacher_id)
+        if len(self._pending) >= LOOKUP_BATCH:
+            self.flush()
+        self.row_ordinals.append(ordinal)
+        self.columns.append(column)
+        self.colored.append(1 if has_color else 0)
+
+    def flush(self):
+        """把攒下的老师-ID 成批转成编码（totals / appearances 之前自动调用）"""
+        pending = self._pending
+        if not pending:
+            return
+        codes = np.empty(len(pending), dtype=np.int32)
+        missing = range(len(pending))
+        n = len(self.known)
+        if n:
+            values = _encode_ids(pending)
+            pos = np.minimum(np.searchsorted(self.known, values), n - 1)
+            found = self.known[pos] == values
+            codes[found] = pos[found]
+            missing = np.flatnonzero(~found).tolist()
+        for i in missing:
+            teacher_id = pending[i]
+            code = self.index.get(teacher_id)
+            if code is None:
+                code = self.index[teacher_id] = n + len(self.extra_ids)
+                self.extra_ids.append(teacher_id)
+            codes[i] = code
+        self.codes.frombytes(codes.tobytes())
+        pending.clear()
+
+    def totals(self):
+        """每个老师-ID 的 (正确金额, 错误金额, 出现次数) 数组，按出现顺序累加"""
+        self.flush()
+        n = self.n_ids
+        if not self.codes:
+            return np.zeros(n), np.zeros(n), np.zeros(n, dtype=np.int64)
+        codes = np.frombuffer(self.codes, dtype=np.int32)
+        ordinals = np.frombuffer(self.row_ordinals, dtype=np.int32)
+        colored = np.frombuffer(self.colored, dtype=np.int8).astype(bool)
+        # 只取各自那一半出现的金额，不展开成与全部出现等长的临时数组
+        correct = np.frombuffer(self.correct_per, dtype=np.float64)[ordinals[colored]]
+        correct_total = np.bincount(codes[colored], weights=correct, minlength=n)
+        del correct
+        colored = ~colored
+        wrong = np.frombuffer(self.wrong_per, dtype=np.float64)[ordinals[colored]]
+        return (correct_total,
+                np.bincount(codes[colored], weights=wrong, minlength=n),
+                np.bincount(codes, minlength=n))
+
+    def appearances(self, code):
+        """某个老师-ID 的全部出现下标（按出现顺序）；第一次调用时排序一次"""
+        if self._order is None:
+            self.flush()
+            codes = np.frombuffer(self.codes, dtype=np.int32)
+            order = np.argsort(codes, kind='stable')
+            starts = np.searchsorted(codes[order], np.arange(self.n_ids + 1))
+            self._order = (order, starts)
+        order, starts = self._order
+        return order[starts[code]:starts[code + 1]].tolist()
+
+    def trace(self, code):
+        """某个老师-ID 的追踪明细（只在发现不匹配时调用）"""
+        details = []
+        for i in self.appearances(code):
+            o = self.row_ordinals[i]
+            head = f"题{self.problem_ids[o]}行{self.rows[o]} {COLUMN_LABELS[self.columns[i]]}"
+            if self.colored[i]:
+                details.append(f"{head} 有颜色 +{self.correct_per[o]:.2f}(正确)")
+            else:
+                details.append(f"{head} 无颜色 +{self.wrong_per[o]:.2f}(错误)")
+        return details
+
+def _row_amounts(r):
+    """K列、N列的金额（空格子算 0）；不是数字时返回 None，整行不计"""
+    try:
+        return (float(r.correct_per) if r.correct_per else 0.0,
+                float(r.wrong_per) if r.wrong_per else 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def recompute_sums(judge_rows):
+    """
+    逐行重新累加每个老师-ID、每位老师的 [正确金额, 错误金额, 正确题数, 错误题数]
+    金额的解析与 verify 相同，不经过 salary_aggregate——验证不借用被验证的汇总代码；
+    只保存每个老师的合计，内存与老师数有关，与行数无关
+    返回 ({老师-ID: 合计}, {老师姓名: 合计}, 行数)
+    """
+    by_id = {}
+    by_name = {}
+    name_sums = {}      # 老师-ID -> 所属姓名的合计（同一个列表）
+    rows = 0
+    for r in judge_rows:
+        rows += 1
+        amounts = _row_amounts(r)
+        if amounts is None:
+            continue
+        for value, has_color in ((r.passed, r.passed_colored), (r.failed, r.failed_colored)):
+            k = 0 if has_color else 1
+            amount = amounts[k]
+            for t in parse_teachers(value):
+                sums = by_id.get(t)
+                if sums is None:
+                    sums = by_id[t] = [0.0, 0.0, 0, 0]
+                    name_sums[t] = by_name.setdefault(extract_teacher_name(t), [0.0, 0.0, 0, 0])
+                for target in (sums, name_sums[t]):
+                    target[k] += amount
+                    target[k + 2] += 1
+    return by_id, by_name, rows
+
+
+def _appearance_table(judge_rows):
+    """按 verify 的解析方式把全部出现记入 AppearanceTable，返回 (表, 行数)"""
+    table = AppearanceTable()
+    rows = 0
+    for r in judge_rows:
+        rows += 1
+        amounts = _row_amounts(r)
+        if amounts is None:
+            continue
+        ordinal = table.add_row(r.row, r.problem_id, *amounts)
+        for column, value, has_color in ((COLUMN_C, r.passed, r.passed_colored),
+                                         (COLUMN_D, r.failed, r.failed_colored)):
+            for t in parse_teachers(value):
+                table.add(t, ordinal, column, has_color)
+    return table, rows
+
+
+def _sums_by(keys, n, amount, correct):
+    """按编码 keys（0..n-1）依次累加，返回 (正确金额, 错误金额, 正确题数, 错误题数) 四个数组"""
+    return (np.bincount(keys[correct], weights=amount[correct], minlength=n),
+            np.bincount(keys[~correct], weights=amount[~correct], minlength=n),
+            np.bincount(keys[correct], minlength=n),
+            np.bincount(keys[~correct], minlength=n))
+
+@PROFILER.profiled("read_detail_csv")
+def read_detail_csv(detail_path):
+    """读取 salary_detail.csv 的每条记录"""
     detail_records = []
     with open(detail_path, 'r', encoding='utf-8-sig') as f:
         reader = csv.DictReader(f)
@@ -53,85 +234,182 @@ def main():
                 'wrong': float(row['回答错误所得金']),
                 'total': float(row['所得金合计'])
             })
-    print(f"   读取 {len(detail_records)} 条记录")
+    return detail_records
+
+@PROFILER.profiled("read_summary_csv")
+def read_summary_csv(summary_path):
+    """读取 salary_summary.csv：老师姓名 -> [正确金额, 错误金额, 正确题数, 错误题数]"""
+    csv_summary = {}
+    with open(summary_path, 'r', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            teacher = row['老师']
+            correct = float(row['回答正确所得金'])
+            wrong = float(row['回答错误所得金'])
+            correct_count = int(row['评价正确题数'])
+            wrong_count = int(row['评价错误题数'])
+            csv_summary[teacher] = [correct, wrong, correct_count, wrong_count]
+    return csv_summary
+
+def records_from_totals(totals):
+    """把刚算好的 SalaryTotals 转成与 read_detail_csv / read_summary_csv 相同的结构"""
+    detail_records = [
+        {'teacher_id': t, 'correct': c, 'wrong': w, 'total': c + w}
+        for t, c, w in detail_rows(totals)
+    ]
+    csv_summary = {t: [c, w, cc, wc] for t, c, w, cc, wc in summary_rows(totals)}
+    return detail_records, csv_summary
+
+# 结构化报告（--report）的字段：detail / summary 两段，每个不一致的老师-ID / 姓名一条记录
+# kind: mismatch 金额不匹配，missing Excel中存在但CSV中缺失，extra CSV中存在但Excel中找不到
+REPORT_FIELDS = ('kind', 'key',
+                 'excel_correct', 'excel_wrong', 'excel_correct_count', 'excel_wrong_count',
+                 'csv_correct', 'csv_wrong', 'csv_correct_count', 'csv_wrong_count',
+                 'trace')
+
+def _severity(difference):
+    """--top 的排序键：金额差的绝对值之和，再按题数差"""
+    kind, key, exp, act = difference[:4]
+    exp = exp or (0.0,) * len(act)
+    act = act or (0.0,) * len(exp)
+    return (abs(exp[0] - act[0]) + abs(exp[1] - act[1]),
+            sum(abs(e - a) for e, a in zip(exp[2:], act[2:])))
+
+def _difference_record(difference, trace=None):
+    """(类别, 键, Excel 值, CSV 值) -> 报告记录；金额保留两位小数，与 CSV 一致"""
+    kind, key, exp, act = difference[:4]
+    record = {'kind': kind, 'key': key}
+    for side, values in (('excel', exp), ('csv', act)):
+        if values is None:
+            continue
+        record[f'{side}_correct'] = round(values[0], 2)
+        record[f'{side}_wrong'] = round(values[1], 2)
+        if len(values) > 2:
+            record[f'{side}_correct_count'] = values[2]
+            record[f'{side}_wrong_count'] = values[3]
+    if trace:
+        record['trace'] = "; ".join(trace)
+    return record
+
+def _report_summary(detail, summary):
+    """detail / summary 为 _MergeReport，汇总成报告最后的 summary"""
+    values = {}
+    for label, side in (('detail', detail), ('summary', summary)):
+        if side is None:
+            values[f'{label}_error'] = "CSV 没有按老师升序排列，无法归并对比"
+            continue
+        values[f'{label}_matched'] = side.matched
+        for kind, n in side.counts.items():
+            values[f'{label}_{kind}'] = n
+    values['ok'] = all(side is not None and side.ok for side in (detail, summary))
+    return values
+
+def _write_verify_report(report, table, errors, summary_errors, detail_records, excel_summary, csv_summary):
+    """把逐条验证的结果写成结构化报告"""
+    kinds = {'金额不匹配': 'mismatch', 'Excel中存在但CSV中缺失': 'missing',
+             'CSV中存在但Excel中找不到此老师': 'extra'}
+    excel_correct_by_code, excel_wrong_by_code, _ = table.totals()
+
+    def detail_differences():
+        for err in errors:
+            kind = kinds[err['error']]
+            if kind == 'mismatch':
+                yield (kind, err['teacher_id'], (err['excel_correct'], err['excel_wrong']),
+                       (err['csv_correct'], err['csv_wrong']), err['code'])
+            elif kind == 'missing':
+                code = table.index[err['teacher_id']]     # 缺失的都是 CSV 之外的 ID
+                yield (kind, err['teacher_id'],
+                       (float(excel_correct_by_code[code]), float(excel_wrong_by_code[code])), None, code)
+            else:
+                yield kind, err['teacher_id'], None, (err['csv_data']['correct'], err['csv_data']['wrong']), None
+
+    def render_detail(difference):
+        code = difference[4]
+        return _difference_record(difference, table.trace(code) if code is not None else None)
+
+    def summary_differences():
+        for err in summary_errors:
+            kind = ('missing' if err['teacher'] not in csv_summary
+                    else 'extra' if err['teacher'] not in excel_summary else 'mismatch')
+            yield (kind, err['teacher'],
+                   None if kind == 'extra' else tuple(err['excel']),
+                   None if kind == 'missing' else tuple(err['csv']))
+
+    detail = _MergeReport(0)
+    summary = _MergeReport(0)
+    for side, differences in ((detail, detail_differences()), (summary, summary_differences())):
+        for d in differences:
+            side.counts[d[0]] += 1
+    # 逐条验证中，明细以 CSV 的记录为准，汇总以两边全部老师姓名为准
+    detail.matched = len(detail_records) - detail.counts['mismatch'] - detail.counts['extra']
+    summary.matched = len(excel_summary.keys() | csv_summary.keys()) - sum(summary.counts.values())
+
+    report.section('detail', detail_differences(), key=_severity, render=render_detail)
+    report.section('summary', summary_differences(), key=_severity, render=_difference_record)
+    report.summary(_report_summary(detail, summary))
+
+@PROFILER.profiled("verify")
+def verify(judge_rows, detail_records, csv_summary,
+           detail_label="salary_detail.csv", summary_label="salary_summary.csv", report=None):
+    """
+    用 judge.xlsx 的原始行重新计算，逐条对比明细记录和汇总记录
+    detail_records / csv_summary 可以来自 CSV 文件，也可以来自刚算好的汇总结果
+    report 为 report_writer 的写入器时，不逐行打印，结果写成结构化报告
+    全部匹配时返回 True
+    """
+    say = progress_printer(report)
+    say("="*80)
+    say("精确验证：逐条对比 detail 与原始数据")
+    say("="*80)
     
-    # 2. 读取 Excel，建立"老师-ID"到题目的映射，同时统计汇总
-    print("\n[2/3] 分析 judge.xlsx，建立映射关系...")
-    wb = openpyxl.load_workbook(xlsx_path, data_only=True)
-    ws = wb.active
+    # 1. detail 的每条记录
+    say(f"\n[1/3] 读取 {detail_label}...")
+    say(f"   读取 {len(detail_records)} 条记录")
     
-    # teacher_id -> [(题号, 列名, 是否有颜色, correct_per, wrong_per), ...]
-    teacher_mapping = defaultdict(list)
+    # 2. 读取 Excel，建立"老师-ID"到题目的映射，同时统计汇总
+    say("\n[2/3] 分析 judge.xlsx，建立映射关系...")
+    # 每次出现只记几个整数 / 浮点数，追踪明细等到发现不匹配时再格式化
+    table = AppearanceTable(r['teacher_id'] for r in detail_records)
     # 老师姓名 -> [正确金额, 错误金额, 正确题数, 错误题数]
     excel_summary = defaultdict(lambda: [0.0, 0.0, 0, 0])
     
-    for row in range(2, ws.max_row + 1):
-        problem_id = ws.cell(row, 1).value  # A列：题号
-        correct_per = ws.cell(row, 11).value  # K列
-        wrong_per = ws.cell(row, 14).value    # N列
-        
-        try:
-            correct_per = float(correct_per) if correct_per else 0.0
-            wrong_per = float(wrong_per) if wrong_per else 0.0
-        except:
+    for r in judge_rows:
+        amounts = _row_amounts(r)
+        if amounts is None:
             continue
+        correct_per, wrong_per = amounts
         
-        # C列 (passed_users)
-        cell_c = ws.cell(row, 3)
-        c_has_color = has_color(cell_c)
-        for t in parse_teachers(cell_c.value):
-            teacher_mapping[t].append({
-                'problem_id': problem_id,
-                'column': 'C(passed)',
-                'has_color': c_has_color,
-                'correct_per': correct_per,
-                'wrong_per': wrong_per,
-                'row': row
-            })
-            # 同时累加汇总统计
-            teacher_name = extract_teacher_name(t)
-            if c_has_color:
-                excel_summary[teacher_name][0] += correct_per
-                excel_summary[teacher_name][2] += 1
-            else:
-                excel_summary[teacher_name][1] += wrong_per
-                excel_summary[teacher_name][3] += 1
+        ordinal = table.add_row(r.row, r.problem_id, correct_per, wrong_per)
         
-        # D列 (failed_users)
-        cell_d = ws.cell(row, 4)
-        d_has_color = has_color(cell_d)
-        for t in parse_teachers(cell_d.value):
-            teacher_mapping[t].append({
-                'problem_id': problem_id,
-                'column': 'D(failed)',
-                'has_color': d_has_color,
-                'correct_per': correct_per,
-                'wrong_per': wrong_per,
-                'row': row
-            })
-            # 同时累加汇总统计
-            teacher_name = extract_teacher_name(t)
-            if d_has_color:
-                excel_summary[teacher_name][0] += correct_per
-                excel_summary[teacher_name][2] += 1
-            else:
-                excel_summary[teacher_name][1] += wrong_per
-                excel_summary[teacher_name][3] += 1
-    
-    wb.close()
-    print(f"   分析完成，找到 {len(teacher_mapping)} 个老师-ID")
+        # C列 (passed_users)、D列 (failed_users)
+        for column, value, has_color in ((COLUMN_C, r.passed, r.passed_colored),
+                                         (COLUMN_D, r.failed, r.failed_colored)):
+            for t in parse_teachers(value):
+                table.add(t, ordinal, column, has_color)
+                # 同时累加汇总统计
+                teacher_name = extract_teacher_name(t)
+                if has_color:
+                    excel_summary[teacher_name][0] += correct_per
+                    excel_summary[teacher_name][2] += 1
+                else:
+                    excel_summary[teacher_name][1] += wrong_per
+                    excel_summary[teacher_name][3] += 1
+    # 每个老师-ID 的正确 / 错误金额，按出现顺序累加
+    excel_correct_by_code, excel_wrong_by_code, count_by_code = table.totals()
+    say(f"   分析完成，找到 {np.count_nonzero(count_by_code)} 个老师-ID")
     
     # 3. 逐条对比验证
-    print("\n[3/3] 逐条验证...")
+    say("\n[3/3] 逐条验证...")
     errors = []
+    record_codes = table.known_codes([r['teacher_id'] for r in detail_records])
     
-    for record in detail_records:
+    for record, code in zip(detail_records, record_codes):
         teacher_id = record['teacher_id']
         csv_correct = record['correct']
         csv_wrong = record['wrong']
         
         # 从 Excel 重新计算这个老师-ID
-        if teacher_id not in teacher_mapping:
+        if not count_by_code[code]:
             errors.append({
                 'teacher_id': teacher_id,
                 'error': 'CSV中存在但Excel中找不到此老师',
@@ -139,17 +417,8 @@ def main():
             })
             continue
         
-        excel_correct = 0.0
-        excel_wrong = 0.0
-        details = []
-        
-        for item in teacher_mapping[teacher_id]:
-            if item['has_color']:
-                excel_correct += item['correct_per']
-                details.append(f"题{item['problem_id']}行{item['row']} {item['column']} 有颜色 +{item['correct_per']:.2f}(正确)")
-            else:
-                excel_wrong += item['wrong_per']
-                details.append(f"题{item['problem_id']}行{item['row']} {item['column']} 无颜色 +{item['wrong_per']:.2f}(错误)")
+        excel_correct = float(excel_correct_by_code[code])
+        excel_wrong = float(excel_wrong_by_code[code])
         
         # 对比（允许0.01的浮点误差）
         if abs(excel_correct - csv_correct) > 0.01 or abs(excel_wrong - csv_wrong) > 0.01:
@@ -160,35 +429,20 @@ def main():
                 'excel_wrong': excel_wrong,
                 'csv_correct': csv_correct,
                 'csv_wrong': csv_wrong,
-                'details': details
+                'code': code
             })
     
-    # 检查是否有Excel中的老师在CSV中缺失
-    csv_teachers = set(r['teacher_id'] for r in detail_records)
-    for teacher_id in teacher_mapping:
-        if teacher_id not in csv_teachers:
-            errors.append({
-                'teacher_id': teacher_id,
-                'error': 'Excel中存在但CSV中缺失',
-                'count': len(teacher_mapping[teacher_id])
-            })
+    # 检查是否有Excel中的老师在CSV中缺失（预先登记之外的编码都是 CSV 中没有的）
+    for code in range(len(table.known), table.n_ids):
+        errors.append({
+            'teacher_id': table.id_of(code),
+            'error': 'Excel中存在但CSV中缺失',
+            'count': int(count_by_code[code])
+        })
     
     # 4. 验证汇总文件
-    print("\n[4/5] 验证 salary_summary.csv...")
-    summary_path = base / "salary_summary.csv"
-    csv_summary = {}
-    
-    with open(summary_path, 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            teacher = row['老师']
-            correct = float(row['回答正确所得金'])
-            wrong = float(row['回答错误所得金'])
-            correct_count = int(row['评价正确题数'])
-            wrong_count = int(row['评价错误题数'])
-            csv_summary[teacher] = [correct, wrong, correct_count, wrong_count]
-    
-    print(f"   从 CSV 读取 {len(csv_summary)} 位老师")
+    say(f"\n[4/5] 验证 {summary_label}...")
+    say(f"   从 CSV 读取 {len(csv_summary)} 位老师")
     
     # 对比汇总数据
     summary_errors = []
@@ -207,60 +461,456 @@ def main():
                 'csv': [csv_c, csv_w, csv_cc, csv_wc]
             })
     
+    if report is not None:
+        _write_verify_report(report, table, errors, summary_errors, detail_records,
+                             excel_summary, csv_summary)
+        return not errors and not summary_errors
+
     # 5. 输出结果
-    print("\n" + "="*80)
-    print("验证结果")
-    print("="*80)
+    say("\n" + "="*80)
+    say("验证结果")
+    say("="*80)
     
     if not errors and not summary_errors:
-        print("\n[OK] 完美！所有记录都匹配，验证通过！")
-        print(f"   详细记录验证: {len(detail_records)} 条")
-        print(f"   汇总数据验证: {len(csv_summary)} 位老师")
+        say("\n[OK] 完美！所有记录都匹配，验证通过！")
+        say(f"   详细记录验证: {len(detail_records)} 条")
+        say(f"   汇总数据验证: {len(csv_summary)} 位老师")
         
         # 显示一些统计信息
-        print("\n统计信息:")
+        say("\n统计信息:")
         total_correct = sum(r['correct'] for r in detail_records)
         total_wrong = sum(r['wrong'] for r in detail_records)
         total_correct_count = sum(v[2] for v in csv_summary.values())
         total_wrong_count = sum(v[3] for v in csv_summary.values())
-        print(f"   总正确金额: {total_correct:.2f}")
-        print(f"   总错误金额: {total_wrong:.2f}")
-        print(f"   总金额: {total_correct + total_wrong:.2f}")
-        print(f"   总正确题数: {total_correct_count}")
-        print(f"   总错误题数: {total_wrong_count}")
-        print(f"   总题数: {total_correct_count + total_wrong_count}")
+        say(f"   总正确金额: {total_correct:.2f}")
+        say(f"   总错误金额: {total_wrong:.2f}")
+        say(f"   总金额: {total_correct + total_wrong:.2f}")
+        say(f"   总正确题数: {total_correct_count}")
+        say(f"   总错误题数: {total_wrong_count}")
+        say(f"   总题数: {total_correct_count + total_wrong_count}")
     else:
         if errors:
-            print(f"\n[ERROR] 详细记录发现 {len(errors)} 个问题：\n")
+            say(f"\n[ERROR] 详细记录发现 {len(errors)} 个问题：\n")
             for i, err in enumerate(errors, 1):
-                print(f"--- 问题 {i} ---")
-                print(f"老师ID: {err['teacher_id']}")
-                print(f"错误类型: {err['error']}")
+                say(f"--- 问题 {i} ---")
+                say(f"老师ID: {err['teacher_id']}")
+                say(f"错误类型: {err['error']}")
                 
                 if err['error'] == '金额不匹配':
-                    print(f"Excel计算: 正确={err['excel_correct']:.2f}, 错误={err['excel_wrong']:.2f}, 合计={err['excel_correct']+err['excel_wrong']:.2f}")
-                    print(f"CSV结果:  正确={err['csv_correct']:.2f}, 错误={err['csv_wrong']:.2f}, 合计={err['csv_correct']+err['csv_wrong']:.2f}")
-                    print(f"差异: 正确差{err['csv_correct']-err['excel_correct']:.2f}, 错误差{err['csv_wrong']-err['excel_wrong']:.2f}")
-                    print("\n详细追踪（Excel原始数据）:")
-                    for detail in err['details']:
-                        print(f"  {detail}")
+                    say(f"Excel计算: 正确={err['excel_correct']:.2f}, 错误={err['excel_wrong']:.2f}, 合计={err['excel_correct']+err['excel_wrong']:.2f}")
+                    say(f"CSV结果:  正确={err['csv_correct']:.2f}, 错误={err['csv_wrong']:.2f}, 合计={err['csv_correct']+err['csv_wrong']:.2f}")
+                    say(f"差异: 正确差{err['csv_correct']-err['excel_correct']:.2f}, 错误差{err['csv_wrong']-err['excel_wrong']:.2f}")
+                    say("\n详细追踪（Excel原始数据）:")
+                    for detail in table.trace(err['code']):
+                        say(f"  {detail}")
                 elif err['error'] == 'Excel中存在但CSV中缺失':
-                    print(f"该老师在Excel中有 {err['count']} 条记录")
+                    say(f"该老师在Excel中有 {err['count']} 条记录")
                 elif err['error'] == 'CSV中存在但Excel中找不到此老师':
-                    print(f"CSV数据: {err['csv_data']}")
+                    say(f"CSV数据: {err['csv_data']}")
                 
-                print()
+                say()
         
         if summary_errors:
-            print(f"\n[ERROR] 汇总数据发现 {len(summary_errors)} 个问题：\n")
+            say(f"\n[ERROR] 汇总数据发现 {len(summary_errors)} 个问题：\n")
             for i, err in enumerate(summary_errors, 1):
-                print(f"--- 问题 {i} ---")
-                print(f"老师: {err['teacher']}")
+                say(f"--- 问题 {i} ---")
+                say(f"老师: {err['teacher']}")
                 excel_c, excel_w, excel_cc, excel_wc = err['excel']
                 csv_c, csv_w, csv_cc, csv_wc = err['csv']
-                print(f"Excel: 正确={excel_c:.2f}({excel_cc}题), 错误={excel_w:.2f}({excel_wc}题), 合计={excel_c+excel_w:.2f}({excel_cc+excel_wc}题)")
-                print(f"CSV:   正确={csv_c:.2f}({csv_cc}题), 错误={csv_w:.2f}({csv_wc}题), 合计={csv_c+csv_w:.2f}({csv_cc+csv_wc}题)")
-                print()
+                say(f"Excel: 正确={excel_c:.2f}({excel_cc}题), 错误={excel_w:.2f}({excel_wc}题), 合计={excel_c+excel_w:.2f}({excel_cc+excel_wc}题)")
+                say(f"CSV:   正确={csv_c:.2f}({csv_cc}题), 错误={csv_w:.2f}({csv_wc}题), 合计={csv_c+csv_w:.2f}({csv_cc+csv_wc}题)")
+                say()
+
+    return not errors and not summary_errors
+
+class CsvOrderError(Exception):
+    """CSV 没有按老师升序排列（或有重复的老师），无法归并对比"""
+
+
+def iter_detail_csv(detail_path):
+    """逐行读取 salary_detail.csv：(老师-ID, (正确金额, 错误金额))"""
+    with open(detail_path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # 表头
+        for row in reader:
+            yield row[0], (float(row[1]), float(row[2]))
+
+
+def iter_summary_csv(summary_path):
+    """逐行读取 salary_summary.csv：(老师姓名, (正确金额, 错误金额, 正确题数, 错误题数))"""
+    with open(summary_path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # 表头
+        for row in reader:
+            yield row[0], (float(row[1]), float(row[2]), int(row[4]), int(row[5]))
+
+
+def merge_join(expected, actual):
+    """
+    两个按键升序的 (键, 值) 流做归并，产出 (键, 期望值, 实际值)，缺的一侧为 None
+    actual 不是严格升序时抛出 CsvOrderError
+    """
+    expected = iter(expected)
+    actual = iter(actual)
+    e = next(expected, None)
+    a = next(actual, None)
+    last = None
+    while e is not None or a is not None:
+        if a is not None:
+            if last is not None and a[0] <= last:
+                raise CsvOrderError(a[0])
+        if a is None or (e is not None and e[0] < a[0]):
+            yield e[0], e[1], None
+            e = next(expected, None)
+        elif e is None or a[0] < e[0]:
+            yield a[0], None, a[1]
+            last = a[0]
+            a = next(actual, None)
+        else:
+            yield e[0], e[1], a[1]
+            last = a[0]
+            e = next(expected, None)
+            a = next(actual, None)
+
+
+class _MergeReport:
+    """一侧（明细或汇总）的对比结果：只计数，并保留前 limit 个例子"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.matched = 0
+        self.counts = {'mismatch': 0, 'missing': 0, 'extra': 0}
+        self.examples = {'mismatch': [], 'missing': [], 'extra': []}
+
+    def add(self, kind, item):
+        self.counts[kind] += 1
+        if len(self.examples[kind]) < self.limit:
+            self.examples[kind].append(item)
+
+    @property
+    def ok(self):
+        return not any(self.counts.values())
+
+
+def _iter_differences(expected, actual, same, report):
+    """归并对比：匹配的只在 report 中计数，不一致的逐条产出 (类别, 键, 期望值, 实际值)"""
+    for key, exp, act in merge_join(expected, actual):
+        if act is None:
+            kind = 'missing'
+        elif exp is None:
+            kind = 'extra'
+        elif same(exp, act):
+            report.matched += 1
+            continue
+        else:
+            kind = 'mismatch'
+        yield kind, key, exp, act
+
+
+def _merge_compare(expected, actual, same, limit):
+    report = _MergeReport(limit)
+    for kind, key, exp, act in _iter_differences(expected, actual, same, report):
+        report.add(kind, (key, exp, act))
+    return report
+
+
+def _counted_differences(differences, report):
+    for d in differences:
+        report.counts[d[0]] += 1
+        yield d
+
+
+def _amounts_match(exp, act):
+    # 与 verify 相同：金额允许 0.01 的误差，题数必须相同
+    return (abs(exp[0] - act[0]) <= 0.01 and abs(exp[1] - act[1]) <= 0.01
+            and exp[2:] == act[2:])
+
+
+def _format_values(values):
+    if values is None:
+        return "(无)"
+    text = f"正确={values[0]:.2f}, 错误={values[1]:.2f}, 合计={values[0] + values[1]:.2f}"
+    if len(values) > 2:
+        text += f", 正确题数={values[2]}, 错误题数={values[3]}"
+    return text
+
+
+def _print_merge_report(label, report):
+    labels = {'mismatch': '金额不匹配', 'missing': 'Excel中存在但CSV中缺失', 'extra': 'CSV中存在但Excel中找不到'}
+    if report.ok:
+        print(f"\n[OK] {label}: {report.matched} 条全部匹配")
+        return
+    print(f"\n[ERROR] {label}: 匹配 {report.matched} 条，"
+          + "，".join(f"{labels[k]} {n} 条" for k, n in report.counts.items() if n))
+    for kind, items in report.examples.items():
+        if not items:
+            continue
+        more = report.counts[kind] - len(items)
+        print(f"\n--- {labels[kind]}" + (f"（只显示前 {len(items)} 条，另有 {more} 条）" if more else "") + " ---")
+        for key, exp, act in items:
+            print(f"{key}")
+            print(f"  Excel: {_format_values(exp)}")
+            print(f"  CSV:   {_format_values(act)}")
+
+
+def _verify_sorted(judge_rows, detail_label, detail_actual, summary_label, summary_actual,
+                   limit, report):
+    """
+    重新汇总 judge.xlsx，与两个按键升序的 (键, 值) 流归并对比（verify_merge_join / verify_columnar 共用）
+    逐行累加（recompute_sums），不保留全部出现记录，内存只与老师-ID 数有关
+    detail_actual / summary_actual 是返回该流的无参函数，在开始对比时才调用
+    """
+    say = progress_printer(report)
+    say("\n[1/3] 分析 judge.xlsx，重新汇总...")
+    with PROFILER.phase("recompute") as ph:
+        by_id, by_name, rows = recompute_sums(judge_rows)
+        ph.rows = rows
+    say(f"   {rows} 行，{len(by_id)} 个老师-ID，{len(by_name)} 位老师")
+
+    def expected_detail():
+        for t in sorted(by_id):
+            yield t, tuple(by_id[t][:2])
+
+    def expected_summary():
+        for name in sorted(by_name):
+            yield name, tuple(by_name[name])
+
+    if report is not None:
+        sides = []
+        for section, expected, actual in (('detail', expected_detail(), detail_actual),
+                                          ('summary', expected_summary(), summary_actual)):
+            side = _MergeReport(0)
+            differences = _counted_differences(
+                _iter_differences(expected, actual(), _amounts_match, side), side)
+            try:
+                report.section(section, differences, key=_severity, render=_difference_record)
+            except CsvOrderError:
+                side = None
+            sides.append(side)
+        values = _report_summary(*sides)
+        report.summary(values)
+        return values['ok']
+
+    results = []
+    for step, label, expected, actual in ((2, detail_label, expected_detail(), detail_actual),
+                                          (3, summary_label, expected_summary(), summary_actual)):
+        say(f"\n[{step}/3] 归并对比{label}...")
+        try:
+            merge_report = _merge_compare(expected, actual(), _amounts_match, limit)
+        except CsvOrderError as e:
+            say(f"\n[ERROR] {label} 没有按老师升序排列（在 {e.args[0]} 处），无法归并对比；"
+                  "请使用默认的逐条验证")
+            results.append(False)
+            continue
+        _print_merge_report(label, merge_report)
+        results.append(merge_report.ok)
+
+    ok = all(results)
+    say("\n" + "="*80)
+    say("[OK] 验证通过" if ok else "[ERROR] 验证未通过")
+    return ok
+
+@PROFILER.profiled("verify_merge_join")
+def verify_merge_join(judge_rows, detail_path, summary_path, limit=20, report=None):
+    """
+    归并对比模式：逐行重新算出每个老师-ID / 姓名的汇总（见 recompute_sums），按键排序一次，
+    与按老师排序写出的 CSV 逐行归并；CSV 和 judge.xlsx 的出现记录都不整体读入内存，
+    缺失、多余、不匹配在同一遍中找出，每类只保留前 limit 个例子
+    report 为 report_writer 的写入器时，不一致的记录边归并边写入报告（不受 limit 限制）
+    CSV 没有按老师升序排列时报错（请改用默认的逐条验证）
+    全部匹配时返回 True
+    """
+    say = progress_printer(report)
+    say("="*80)
+    say("归并验证：按老师排序后逐行对比 CSV 与 judge.xlsx")
+    say("="*80)
+    return _verify_sorted(judge_rows,
+                          f"明细 {Path(detail_path).name}", lambda: iter_detail_csv(detail_path),
+                          f"汇总 {Path(summary_path).name}", lambda: iter_summary_csv(summary_path),
+                          limit, report)
+
+@PROFILER.profiled("verify_columnar")
+def verify_columnar(judge_rows, tables_path, limit=20, report=None):
+    """
+    列式验证：直接映射 calc --columnar 写出的 salary_tables.npz（见 salary_columnar），
+    不做文本解析，与重新汇总的结果归并对比；金额取文件中的整数分，与 CSV 中的数值相同
+    全部匹配时返回 True
+    """
+    say = progress_printer(report)
+    say("="*80)
+    say(f"列式验证：{Path(tables_path).name} 与 judge.xlsx 逐行对比")
+    say("="*80)
+    with PROFILER.phase("load_columnar"):
+        tables = load_tables(tables_path)
+    return _verify_sorted(judge_rows,
+                          f"明细表 ({len(tables.detail)} 条)", lambda: iter_detail_columnar(tables),
+                          f"汇总表 ({len(tables.summary)} 条)", lambda: iter_summary_columnar(tables),
+                          limit, report)
+
+def _iter_changed(keys, expected, groups, parse, same, report):
+    """
+    只对比 keys 中的键：expected 为 键 -> 期望值，groups 为 键 -> CSV 行（由 parse 转成值）
+    匹配的只在 report 中计数，不一致的逐条产出 (类别, 键, 期望值, 实际值)
+    """
+    for key in sorted(keys):
+        exp = expected.get(key)
+        rows = groups.get(key, ())
+        if not rows and exp is not None:
+            yield 'missing', key, exp, None
+        for row in rows:
+            act = parse(row)
+            if exp is None:
+                yield 'extra', key, None, act
+            elif same(exp, act):
+                report.matched += 1
+            else:
+                yield 'mismatch', key, exp, act
+
+@PROFILER.profiled("verify_differential")
+def verify_differential(judge_rows, detail_path, summary_path, digest_path, full=False, limit=20,
+                        report=None):
+    """
+    差异验证：比较本次与上次验证通过时的摘要树（见 verify_digest），
+    只重新验证摘要有变化的老师-ID / 姓名（judge.xlsx 中的出现或 CSV 中的行变了，或新增、删除），
+    其余的上次已经验证通过，直接计为匹配
+    full=True 或还没有摘要时全部重新验证；全部匹配时写入新的摘要，返回 True
+    """
+    say = progress_printer(report)
+    say("="*80)
+    say("差异验证：只重新验证摘要有变化的老师" + ("（--full：全部重新验证）" if full else ""))
+    say("="*80)
+
+    say("\n[1/3] 分析 judge.xlsx，重新汇总...")
+    with PROFILER.phase("recompute") as ph:
+        # 与 verify 一样自己解析、展开每次出现，不经过 salary_aggregate
+        table, rows = _appearance_table(judge_rows)
+        ph.rows = rows
+        table.flush()
+        codes = np.frombuffer(table.codes, dtype=np.int32)
+        correct = np.frombuffer(table.colored, dtype=np.int8).astype(bool)
+        ordinals = np.frombuffer(table.row_ordinals, dtype=np.int32)
+        amount = np.where(correct, np.frombuffer(table.correct_per, dtype=np.float64)[ordinals],
+                          np.frombuffer(table.wrong_per, dtype=np.float64)[ordinals])
+        ids = table.id_list()
+        names = sorted({extract_teacher_name(t) for t in ids})
+        name_index = {name: i for i, name in enumerate(names)}
+        id_name = np.array([name_index[extract_teacher_name(t)] for t in ids], dtype=np.int64)
+        name_codes = id_name[codes]
+        id_sums = _sums_by(codes, len(ids), amount, correct)
+        name_sums = _sums_by(name_codes, len(names), amount, correct)
+    say(f"   {rows} 行，{len(ids)} 个老师-ID，{len(names)} 位老师")
+
+    say("\n[2/3] 计算摘要树，与上次验证通过时比较...")
+    with PROFILER.phase("digest"):
+        excel_ids = dict(zip(ids, appearance_digests(codes, len(ids), amount, correct)))
+        excel_names = dict(zip(names, appearance_digests(name_codes, len(names), amount, correct)))
+        detail_groups = read_csv_groups(detail_path)
+        summary_groups = read_csv_groups(summary_path)
+        detail_tree = DigestTree.build(leaf_digests(excel_ids, detail_groups))
+        summary_tree = DigestTree.build(leaf_digests(excel_names, summary_groups))
+        saved = None if full else load_digests(digest_path)
+        if saved is None and not full:
+            say(f"   没有可用的摘要 {Path(digest_path).name}，全部重新验证")
+        changed_ids, id_branches = detail_tree.diff(saved[0] if saved else None)
+        changed_names, name_branches = summary_tree.diff(saved[1] if saved else None)
+    say(f"   老师-ID：{len(detail_tree)} 个，{id_branches}/{FANOUT} 个分支有变化，"
+          f"需要重新验证 {len(changed_ids)} 个")
+    say(f"   老师姓名：{len(summary_tree)} 位，{name_branches}/{FANOUT} 个分支有变化，"
+          f"需要重新验证 {len(changed_names)} 位")
+
+    expected_detail = {t: (id_sums[0][i].item(), id_sums[1][i].item())
+                       for i, t in enumerate(ids) if t in changed_ids}
+    expected_summary = {name: tuple(column[i].item() for column in name_sums)
+                        for i, name in enumerate(names) if name in changed_names}
+
+    def parse_detail(row):
+        return float(row[1]), float(row[2])
+
+    def parse_summary(row):
+        return float(row[1]), float(row[2]), int(row[4]), int(row[5])
+
+    sides = []
+    for section, changed, expected, groups, parse in (
+            ('detail', changed_ids, expected_detail, detail_groups, parse_detail),
+            ('summary', changed_names, expected_summary, summary_groups, parse_summary)):
+        side = _MergeReport(0 if report is not None else limit)
+        # 没有变化的键上次已验证通过
+        side.matched = sum(len(rows) for key, rows in groups.items() if key not in changed)
+        differences = _iter_changed(changed, expected, groups, parse, _amounts_match, side)
+        if report is not None:
+            report.section(section, _counted_differences(differences, side),
+                           key=_severity, render=_difference_record)
+        else:
+            for kind, key, exp, act in differences:
+                side.add(kind, (key, exp, act))
+        sides.append(side)
+    ok = all(side.ok for side in sides)
+
+    if ok:
+        save_digests(digest_path, detail_tree, summary_tree)
+    if report is not None:
+        values = _report_summary(*sides)
+        values['rechecked_ids'] = len(changed_ids)
+        values['rechecked_names'] = len(changed_names)
+        report.summary(values)
+        return ok
+
+    say("\n[3/3] 重新验证有变化的老师...")
+    _print_merge_report(f"明细 {Path(detail_path).name}", sides[0])
+    _print_merge_report(f"汇总 {Path(summary_path).name}", sides[1])
+    say("\n" + "="*80)
+    if ok:
+        say(f"[OK] 验证通过，摘要已写入 {Path(digest_path).name}")
+    else:
+        say("[ERROR] 验证未通过，摘要未更新（下次仍会重新验证这些老师）")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="逐条对比 salary_detail.csv / salary_summary.csv 与 judge.xlsx")
+    parser.add_argument("--merge-join", action="store_true",
+                        help="归并对比模式：CSV 按老师排序逐行对比，内存只与老师数有关，与 CSV 和工作表的行数无关")
+    parser.add_argument("--columnar", nargs="?", const=TABLES_NAME, metavar="NPZ",
+                        help=f"对比 calc --columnar 写出的列式文件（默认 {TABLES_NAME}），不读 CSV")
+    parser.add_argument("--differential", action="store_true",
+                        help=f"差异验证：只重新验证与上次通过时（摘要见 {DIGEST_NAME}）相比有变化的老师")
+    parser.add_argument("--full", action="store_true",
+                        help="配合 --differential，全部重新验证并重建摘要")
+    add_shard_argument(parser)
+    add_report_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    check_report_arguments(parser, args)
+    if args.full and not args.differential:
+        parser.error("--full 需要配合 --differential 使用")
+    start_from_args(args)
+
+    base = Path(__file__).resolve().parent
+    xlsx_path = base / "judge.xlsx"
+
+    def judge_rows():
+        if args.shards is not None:
+            return iter_judge_rows_sharded(xlsx_path, jobs=args.shards)
+        return iter_judge_rows(xlsx_path, use_cache=True)
+
+    report = open_report_from_args(args, REPORT_FIELDS)
+    try:
+        if args.columnar:
+            verify_columnar(judge_rows(), base / args.columnar, report=report)
+        elif args.differential:
+            verify_differential(judge_rows(),
+                                base / "salary_detail.csv", base / "salary_summary.csv",
+                                base / DIGEST_NAME, full=args.full, report=report)
+        elif args.merge_join:
+            verify_merge_join(judge_rows(),
+                              base / "salary_detail.csv", base / "salary_summary.csv", report=report)
+        else:
+            detail_records = read_detail_csv(base / "salary_detail.csv")
+            csv_summary = read_summary_csv(base / "salary_summary.csv")
+            verify(judge_rows(), detail_records, csv_summary, report=report)
+    finally:
+        if report is not None:
+            report.close()
+    finish_from_args(args, command="verify")
 
 if __name__ == "__main__":
     main()